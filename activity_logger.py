@@ -7,8 +7,9 @@ from collections import deque
 class ActivityLogger:
     """Gère les logs d'activité vocale et toutes les actions"""
     
-    def __init__(self, max_logs=100):
+    def __init__(self, max_logs=100, clock=datetime.now):
         self.lock = Lock()
+        self.clock = clock
         self.logs = deque(maxlen=max_logs)
         self.current_members = {}
         self.member_states = {}  # Pour tracker les états précédents
@@ -20,8 +21,8 @@ class ActivityLogger:
                 'type': 'join',
                 'member': member_name,
                 'channel': channel_name,
-                'timestamp': datetime.now().isoformat(),
-                'time_str': datetime.now().strftime('%H:%M:%S')
+                'timestamp': self.clock().isoformat(),
+                'time_str': self.clock().strftime('%H:%M:%S')
             }
             self.logs.append(log_entry)
             self.current_members[member_name] = channel_name
@@ -34,8 +35,8 @@ class ActivityLogger:
                 'type': 'leave',
                 'member': member_name,
                 'channel': channel_name,
-                'timestamp': datetime.now().isoformat(),
-                'time_str': datetime.now().strftime('%H:%M:%S')
+                'timestamp': self.clock().isoformat(),
+                'time_str': self.clock().strftime('%H:%M:%S')
             }
             self.logs.append(log_entry)
             if member_name in self.current_members:
@@ -52,8 +53,8 @@ class ActivityLogger:
                 'member': member_name,
                 'from_channel': from_channel,
                 'to_channel': to_channel,
-                'timestamp': datetime.now().isoformat(),
-                'time_str': datetime.now().strftime('%H:%M:%S')
+                'timestamp': self.clock().isoformat(),
+                'time_str': self.clock().strftime('%H:%M:%S')
             }
             self.logs.append(log_entry)
             self.current_members[member_name] = to_channel
@@ -66,8 +67,8 @@ class ActivityLogger:
                 'type': 'mute',
                 'member': member_name,
                 'channel': channel_name,
-                'timestamp': datetime.now().isoformat(),
-                'time_str': datetime.now().strftime('%H:%M:%S')
+                'timestamp': self.clock().isoformat(),
+                'time_str': self.clock().strftime('%H:%M:%S')
             }
             self.logs.append(log_entry)
             return log_entry
@@ -79,8 +80,8 @@ class ActivityLogger:
                 'type': 'unmute',
                 'member': member_name,
                 'channel': channel_name,
-                'timestamp': datetime.now().isoformat(),
-                'time_str': datetime.now().strftime('%H:%M:%S')
+                'timestamp': self.clock().isoformat(),
+                'time_str': self.clock().strftime('%H:%M:%S')
             }
             self.logs.append(log_entry)
             return log_entry
@@ -92,8 +93,8 @@ class ActivityLogger:
                 'type': 'deafen',
                 'member': member_name,
                 'channel': channel_name,
-                'timestamp': datetime.now().isoformat(),
-                'time_str': datetime.now().strftime('%H:%M:%S')
+                'timestamp': self.clock().isoformat(),
+                'time_str': self.clock().strftime('%H:%M:%S')
             }
             self.logs.append(log_entry)
             return log_entry
@@ -105,8 +106,8 @@ class ActivityLogger:
                 'type': 'undeafen',
                 'member': member_name,
                 'channel': channel_name,
-                'timestamp': datetime.now().isoformat(),
-                'time_str': datetime.now().strftime('%H:%M:%S')
+                'timestamp': self.clock().isoformat(),
+                'time_str': self.clock().strftime('%H:%M:%S')
             }
             self.logs.append(log_entry)
             return log_entry
@@ -118,8 +119,8 @@ class ActivityLogger:
                 'type': 'stream_start',
                 'member': member_name,
                 'channel': channel_name,
-                'timestamp': datetime.now().isoformat(),
-                'time_str': datetime.now().strftime('%H:%M:%S')
+                'timestamp': self.clock().isoformat(),
+                'time_str': self.clock().strftime('%H:%M:%S')
             }
             self.logs.append(log_entry)
             return log_entry
@@ -131,8 +132,8 @@ class ActivityLogger:
                 'type': 'stream_stop',
                 'member': member_name,
                 'channel': channel_name,
-                'timestamp': datetime.now().isoformat(),
-                'time_str': datetime.now().strftime('%H:%M:%S')
+                'timestamp': self.clock().isoformat(),
+                'time_str': self.clock().strftime('%H:%M:%S')
             }
             self.logs.append(log_entry)
             return log_entry
@@ -144,8 +145,8 @@ class ActivityLogger:
                 'type': 'webcam_on',
                 'member': member_name,
                 'channel': channel_name,
-                'timestamp': datetime.now().isoformat(),
-                'time_str': datetime.now().strftime('%H:%M:%S')
+                'timestamp': self.clock().isoformat(),
+                'time_str': self.clock().strftime('%H:%M:%S')
             }
             self.logs.append(log_entry)
             return log_entry
@@ -157,8 +158,8 @@ class ActivityLogger:
                 'type': 'webcam_off',
                 'member': member_name,
                 'channel': channel_name,
-                'timestamp': datetime.now().isoformat(),
-                'time_str': datetime.now().strftime('%H:%M:%S')
+                'timestamp': self.clock().isoformat(),
+                'time_str': self.clock().strftime('%H:%M:%S')
             }
             self.logs.append(log_entry)
             return log_entry
@@ -170,8 +171,8 @@ class ActivityLogger:
                 'type': 'server_mute',
                 'member': member_name,
                 'channel': channel_name,
-                'timestamp': datetime.now().isoformat(),
-                'time_str': datetime.now().strftime('%H:%M:%S')
+                'timestamp': self.clock().isoformat(),
+                'time_str': self.clock().strftime('%H:%M:%S')
             }
             self.logs.append(log_entry)
             return log_entry
@@ -183,12 +184,17 @@ class ActivityLogger:
                 'type': 'server_unmute',
                 'member': member_name,
                 'channel': channel_name,
-                'timestamp': datetime.now().isoformat(),
-                'time_str': datetime.now().strftime('%H:%M:%S')
+                'timestamp': self.clock().isoformat(),
+                'time_str': self.clock().strftime('%H:%M:%S')
             }
             self.logs.append(log_entry)
             return log_entry
     
+    def add_log(self, log_entry):
+        """Ajoute un log déjà construit (copie reçue du bus dans un worker web)"""
+        with self.lock:
+            self.logs.append(log_entry)
+    
     def get_logs(self, limit=50):
         """Retourne les derniers logs"""
         with self.lock:
@@ -0,0 +1,262 @@
+# -*- coding: utf-8 -*-
+"""
+Analyses vectorisées (NumPy) de l'historique des sessions
+
+Les segments de session (table session_segments : membre, salon, début et
+fin en secondes locales) sont chargés en colonnes, des tableaux NumPy, à la
+première analyse ; ensuite seuls les segments écrits depuis (id supérieur au
+dernier lu) sont ajoutés.
+
+Carte de chaleur « jour de la semaine × heure » : chaque intervalle est
+découpé aux frontières d'heure sans boucle Python (np.repeat et cumsum),
+puis chaque morceau est additionné dans sa case 7 × 24 par np.bincount.
+Les semaines entières d'un intervalle très long ajoutent la même durée à
+toutes les cases et ne sont pas découpées.
+
+NumPy est requis pour ces analyses : sans lui, le module s'importe mais
+`available` vaut False.
+"""
+
+import math
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from threading import Lock
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from config import DATABASE_PATH, HEATMAP_DEFAULT_DAYS, HEATMAP_CACHE_SIZE
+from stats_tracker import stats_tracker, local_seconds, fetch_batches, LOCAL_EPOCH
+from tracing import sqlite_connect, traced
+
+available = np is not None
+
+HOUR = 3600
+WEEK_HOURS = 7 * 24
+WEEK = WEEK_HOURS * HOUR
+# Le 1er janvier 1970 (origine des secondes locales) est un jeudi (lundi = 0)
+EPOCH_WEEKDAY = 3
+
+# Regroupements possibles : colonne des segments utilisée
+GROUP_BY = ('channel', 'member')
+
+class SegmentColumns:
+    """Segments de session en colonnes NumPy (début, fin, code membre, code salon)"""
+
+    def __init__(self, db_path=None):
+        self.lock = Lock()
+        self.db_path = db_path or DATABASE_PATH
+        self.names = {kind: [] for kind in GROUP_BY}    # code -> nom
+        self.codes = {kind: {} for kind in GROUP_BY}    # nom -> code
+        self.columns = None
+        self.size = 0
+        self.last_id = 0
+
+    def _code(self, kind, name):
+        codes = self.codes[kind]
+        code = codes.get(name)
+        if code is None:
+            code = codes[name] = len(codes)
+            self.names[kind].append(name)
+        return code
+
+    def encode(self, kind, names):
+        """Codes des noms (les noms inconnus reçoivent un nouveau code)"""
+        with self.lock:
+            return np.array([self._code(kind, name) for name in names], dtype=np.int32)
+
+    def get_names(self, kind):
+        with self.lock:
+            return list(self.names[kind])
+
+    def _reserve(self, count):
+        """Agrandit les colonnes (capacité doublée) pour `count` segments de plus"""
+        capacity = len(self.columns['start']) if self.columns is not None else 0
+        if self.columns is not None and self.size + count <= capacity:
+            return
+        capacity = max(self.size + count, capacity * 2, 1024)
+        columns = {
+            'start': np.empty(capacity),
+            'end': np.empty(capacity),
+            'member': np.empty(capacity, dtype=np.int32),
+            'channel': np.empty(capacity, dtype=np.int32)
+        }
+        if self.columns is not None:
+            for key, values in columns.items():
+                values[:self.size] = self.columns[key][:self.size]
+        self.columns = columns
+
+    @traced()
+    def refresh(self):
+        """
+        Ajoute les segments écrits depuis le dernier appel
+
+        Returns:
+            {colonne: tableau} des segments chargés (vues, non modifiées par
+            les ajouts suivants)
+        """
+        with self.lock:
+            conn = sqlite_connect(self.db_path)
+            cursor = conn.execute('''
+                SELECT id, member_name, channel, start_ts, end_ts
+                FROM session_segments
+                WHERE id > ?
+                ORDER BY id
+            ''', (self.last_id,))
+
+            # Lus par lots : au premier chargement, seules les colonnes gardent tout l'historique
+            for rows in fetch_batches(cursor):
+                self._reserve(len(rows))
+                count = len(rows)
+                window = slice(self.size, self.size + count)
+                self.columns['start'][window] = np.fromiter((row[3] for row in rows), float, count)
+                self.columns['end'][window] = np.fromiter((row[4] for row in rows), float, count)
+                self.columns['member'][window] = np.fromiter((self._code('member', row[1]) for row in rows),
+                                                             np.int32, count)
+                self.columns['channel'][window] = np.fromiter((self._code('channel', row[2]) for row in rows),
+                                                              np.int32, count)
+                self.size += count
+                self.last_id = rows[-1][0]
+            conn.close()
+
+            if self.columns is None:
+                self._reserve(0)
+            return {key: values[:self.size] for key, values in self.columns.items()}
+
+def week_matrix(starts, ends, codes, size):
+    """
+    Secondes passées dans chaque case jour de la semaine × heure
+
+    Args:
+        starts, ends: début et fin des intervalles (secondes locales)
+        codes: ligne de chaque intervalle (membre ou salon)
+        size: nombre de lignes
+
+    Returns:
+        tableau (size, 7, 24) ; [ligne, 0, 0] = lundi de 0 h à 1 h
+    """
+    matrix = np.zeros(size * WEEK_HOURS)
+    keep = ends > starts
+    starts, ends, codes = starts[keep], ends[keep], codes[keep]
+
+    # Semaines entières : une heure de plus par semaine dans chaque case
+    weeks = np.floor((ends - starts) / WEEK)
+    if weeks.any():
+        per_code = np.bincount(codes, weights=weeks * HOUR, minlength=size)
+        matrix += np.repeat(per_code, WEEK_HOURS)
+        ends = ends - weeks * WEEK
+
+    # Découpage aux frontières d'heure : un morceau par heure touchée
+    first = np.floor(starts / HOUR).astype(np.int64)
+    pieces = np.ceil(ends / HOUR).astype(np.int64) - first
+    owner = np.repeat(np.arange(len(starts)), pieces)
+    offsets = np.cumsum(pieces) - pieces
+    hours = first[owner] + np.arange(len(owner)) - offsets[owner]
+    seconds = (np.minimum(ends[owner], (hours + 1) * HOUR)
+               - np.maximum(starts[owner], hours * HOUR))
+
+    cells = ((hours // 24 + EPOCH_WEEKDAY) % 7) * 24 + hours % 24
+    matrix += np.bincount(codes[owner] * WEEK_HOURS + cells, weights=seconds, minlength=size * WEEK_HOURS)
+    return matrix.reshape(size, 7, 24)
+
+class Heatmaps:
+    """Cartes de chaleur jour × heure par salon ou par membre, en cache par période"""
+
+    def __init__(self, columns, live_segments, clock, cache_size=HEATMAP_CACHE_SIZE):
+        self.lock = Lock()
+        self.columns = columns
+        # Segments des sessions en cours : [(membre, salon, début, fin)]
+        self.live_segments = live_segments
+        self.clock = clock
+        self.cache_size = cache_size
+        # (début, fin, regroupement) -> (segments chargés lors du calcul, matrice des segments en base)
+        self.cache = OrderedDict()
+
+    def _stored_matrix(self, columns, start, end, by):
+        """Matrice des segments en base, en cache tant qu'aucun nouveau segment ne touche la période"""
+        key = (start, end, by)
+        with self.lock:
+            entry = self.cache.get(key)
+            if entry is not None:
+                count, matrix = entry
+                # Segments ajoutés depuis le calcul (sessions terminées entre-temps)
+                tail_start, tail_end = columns['start'][count:], columns['end'][count:]
+                if not np.any((tail_end > start) & (tail_start < end)):
+                    self.cache.move_to_end(key)
+                    return matrix
+
+        touching = (columns['end'] > start) & (columns['start'] < end)
+        matrix = week_matrix(np.maximum(columns['start'][touching], start),
+                             np.minimum(columns['end'][touching], end),
+                             columns[by][touching], len(self.columns.get_names(by)))
+        with self.lock:
+            self.cache[key] = (len(columns['start']), matrix)
+            self.cache.move_to_end(key)
+            while len(self.cache) > self.cache_size:
+                self.cache.popitem(last=False)
+        return matrix
+
+    def heatmap(self, start=None, end=None, by='channel', name=None):
+        """
+        Présence par jour de la semaine et par heure
+
+        Args:
+            start, end: epoch (défaut : les HEATMAP_DEFAULT_DAYS derniers jours),
+                arrondis à l'heure
+            by: 'channel' ou 'member'
+            name: un seul salon ou membre (None = tous ceux présents sur la période)
+
+        Returns:
+            dict, ou None si `name` est inconnu
+        """
+        now = local_seconds(self.clock())
+        end = now if end is None else local_seconds(datetime.fromtimestamp(end))
+        start = end - HEATMAP_DEFAULT_DAYS * 86400 if start is None else local_seconds(datetime.fromtimestamp(start))
+        start = math.floor(start / HOUR) * HOUR
+        end = max(math.ceil(end / HOUR) * HOUR, start + HOUR)
+
+        # Base d'abord, puis sessions en cours : une session terminée entre
+        # les deux lectures manque au plus une fois, elle n'est jamais comptée deux fois
+        columns = self.columns.refresh()
+        stored = self._stored_matrix(columns, start, end, by)
+
+        live = [segment for segment in self.live_segments() if segment[3] > start and segment[2] < end]
+        codes = self.columns.encode(by, [segment[0 if by == 'member' else 1] for segment in live])
+        names = self.columns.get_names(by)
+        if name is not None and name not in names:
+            return None
+
+        seconds = np.zeros((len(names), 7, 24))
+        seconds[:len(stored)] = stored
+        if live:
+            seconds += week_matrix(np.array([max(segment[2], start) for segment in live]),
+                                   np.array([min(segment[3], end) for segment in live]),
+                                   codes, len(names))
+
+        # Durée de la période dans chaque case (jusqu'à maintenant)
+        covered = week_matrix(np.array([float(start)]), np.array([float(min(end, max(now, start)))]),
+                              np.zeros(1, dtype=np.int32), 1)[0]
+        average = np.divide(seconds, covered, out=np.zeros_like(seconds), where=covered > 0)
+
+        totals = seconds.sum(axis=(1, 2))
+        rows = [names.index(name)] if name is not None else np.flatnonzero(totals > 0)
+        return {
+            'from': (LOCAL_EPOCH + timedelta(seconds=start)).isoformat(),
+            'to': (LOCAL_EPOCH + timedelta(seconds=end)).isoformat(),
+            'by': by,
+            'covered_seconds': covered.round().astype(int).tolist(),
+            'heatmaps': {
+                names[row]: {
+                    'total_seconds': round(float(totals[row]), 1),
+                    'seconds': seconds[row].round().astype(int).tolist(),
+                    'average': average[row].round(3).tolist()
+                }
+                for row in rows
+            }
+        }
+
+# Instances globales
+segment_columns = SegmentColumns()
+heatmaps = Heatmaps(segment_columns, lambda: stats_tracker.get_live_segments(), lambda: stats_tracker.clock())
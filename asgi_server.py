@@ -0,0 +1,349 @@
+# -*- coding: utf-8 -*-
+"""
+Serveur web de production (WEB_SERVER_MODE = 'asgi' ou 'single_loop')
+
+Socket.IO asynchrone (python-socketio AsyncServer) servi par uvicorn : une
+seule boucle asyncio gère toutes les connexions websocket, au lieu d'un thread
+par client avec Werkzeug. Les routes Flask existantes sont montées telles
+quelles (asgiref) et exécutées dans un pool de WEB_HTTP_THREADS threads.
+
+En mode 'asgi', le serveur a sa propre boucle dans un thread. En mode
+'single_loop', il tourne sur la boucle du bot : les diffusions et les
+endpoints de l'état du bot (/api/bot*, /api/status, /api/logs, /health)
+s'exécutent sur cette boucle, sans passage d'un thread à l'autre. En mode
+'workers', la même application est servie par les processus de web_worker.py.
+"""
+
+import asyncio
+import contextvars
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qs
+
+import socketio
+import uvicorn
+from asgiref.sync import SyncToAsync
+from asgiref.wsgi import WsgiToAsgi, WsgiToAsgiInstance
+
+from config import (FLASK_HOST, FLASK_PORT, WEB_SERVER_MODE, WEB_HTTP_THREADS, WEB_KEEPALIVE_TIMEOUT,
+                    WEB_GRACEFUL_TIMEOUT, SOCKETIO_PING_INTERVAL, SOCKETIO_PING_TIMEOUT,
+                    SOCKETIO_PER_MESSAGE_DEFLATE)
+from health_monitor import health_monitor, health_history
+from tracing import tracer, traced
+from subscriptions import subscriptions, RoomEmitter, MeteredPacket, voice_view, transport_backlog, client_payload
+import discord_bot
+import web_server
+
+sio = socketio.AsyncServer(
+    async_mode='asgi',
+    cors_allowed_origins='*',
+    serializer=MeteredPacket,
+    ping_interval=SOCKETIO_PING_INTERVAL,
+    ping_timeout=SOCKETIO_PING_TIMEOUT
+)
+
+http_executor = ThreadPoolExecutor(max_workers=WEB_HTTP_THREADS, thread_name_prefix='http')
+
+# ============================================
+# PONT BOT -> SERVEUR
+# ============================================
+
+class ThreadsafeEmitter:
+    """
+    Expose emit() comme flask_socketio.SocketIO pour discord_bot et le
+    thread des stats : l'émission est planifiée sur la boucle du serveur,
+    depuis n'importe quel thread, sans attendre l'envoi.
+    """
+
+    def __init__(self, server):
+        self.server = server
+        self.loop = None
+
+    def emit(self, event, data=None, to=None, skip_sid=None):
+        loop = self.loop
+        if loop is None or loop.is_closed():
+            return
+        coro = self.server.emit(event, data, to=to, skip_sid=skip_sid)
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is loop:
+            loop.create_task(coro)
+        else:
+            asyncio.run_coroutine_threadsafe(coro, loop)
+
+emitter = ThreadsafeEmitter(sio)
+# Diffusions routées vers les salles des abonnés (subscriptions.py)
+room_emitter = RoomEmitter(emitter, backlog=lambda sid: transport_backlog(sio, sid))
+discord_bot.set_socketio(room_emitter)
+
+# ============================================
+# APPLICATION FLASK (routes HTTP)
+# ============================================
+
+class PooledWsgiToAsgi(WsgiToAsgi):
+    """
+    WsgiToAsgi dont les requêtes tournent dans http_executor
+
+    Par défaut asgiref exécute toutes les requêtes WSGI sur un seul thread.
+    """
+
+    instance_class = type('PooledWsgiToAsgiInstance', (WsgiToAsgiInstance,), {
+        'run_wsgi_app': SyncToAsync(WsgiToAsgiInstance.__dict__['run_wsgi_app'].func,
+                                    thread_sensitive=False, executor=http_executor)
+    })
+
+    async def __call__(self, scope, receive, send):
+        await self.instance_class(self.wsgi_application, self.duplicate_header_limit)(scope, receive, send)
+
+async def run_blocking(func, *args):
+    """Exécute un appel bloquant (SQLite...) hors de la boucle, dans la trace en cours"""
+    context = contextvars.copy_context()
+    return await asyncio.get_running_loop().run_in_executor(http_executor, context.run, func, *args)
+
+# ============================================
+# ROUTES SUR LA BOUCLE (mode single_loop)
+# ============================================
+
+def query_arg(query, key, cast=str):
+    """Équivalent de request.args.get(key, type=cast)"""
+    try:
+        return cast(query[key][0])
+    except (KeyError, ValueError):
+        return None
+
+async def api_bot(query):
+    return web_server.bot_json()
+
+async def api_bot_channels(query):
+    return web_server.bot_channels_json()
+
+async def api_bot_members(query):
+    return web_server.bot_members_json(query_arg(query, 'channel'))
+
+async def api_bot_member(query, member_name):
+    return web_server.bot_member_payload(member_name, await discord_bot.fetch_member_full_info(member_name))
+
+async def api_bot_stats(query):
+    return web_server.bot_stats_json()
+
+async def api_status(query):
+    return web_server.status_payload()
+
+async def api_logs(query):
+    return web_server.logs_payload(query_arg(query, 'type'), query_arg(query, 'limit', int))
+
+async def health_check(query):
+    return web_server.health_payload()
+
+LOOP_ROUTES = {
+    '/api/bot': api_bot,
+    '/api/bot/channels': api_bot_channels,
+    '/api/bot/members': api_bot_members,
+    '/api/bot/stats': api_bot_stats,
+    '/api/status': api_status,
+    '/api/logs': api_logs,
+    '/health': health_check
+}
+MEMBER_ROUTE_PREFIX = '/api/bot/member/'
+
+class LoopRoutes:
+    """
+    Sert les endpoints de l'état du bot directement sur la boucle (mêmes
+    réponses que les routes Flask, ETag/304 compris pour les réponses en
+    cache) ; les autres requêtes passent à `fallback`.
+    """
+
+    def __init__(self, fallback):
+        self.fallback = fallback
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http' or scope['method'] not in ('GET', 'HEAD'):
+            return await self.fallback(scope, receive, send)
+
+        path = scope['path']
+        query = parse_qs(scope['query_string'].decode('utf-8', 'replace'))
+        member_name = path[len(MEMBER_ROUTE_PREFIX):] if path.startswith(MEMBER_ROUTE_PREFIX) else None
+        if path in LOOP_ROUTES:
+            result = LOOP_ROUTES[path](query)
+        elif member_name and '/' not in member_name:
+            result = api_bot_member(query, member_name)
+        else:
+            return await self.fallback(scope, receive, send)
+
+        health_monitor.web_request()
+        started = time.perf_counter()
+        route = path if member_name is None else MEMBER_ROUTE_PREFIX + '<member_name>'
+        with tracer.span(f"{scope['method']} {route}") as span:
+            status = await self.respond(scope, send, await result)
+            span.set(status=status)
+        web_server.REQUEST_SECONDS.observe(time.perf_counter() - started, route, scope['method'], str(status))
+
+    @staticmethod
+    async def respond(scope, send, result):
+        """Envoie la réponse d'une route ; renvoie le statut"""
+        headers = [(b'content-type', b'application/json')]
+        if isinstance(result, web_server.CachedJSON):
+            body, status = result.body, result.status
+            headers += [(b'etag', result.etag.encode()), (b'cache-control', b'no-cache')]
+            if_none_match = dict(scope['headers']).get(b'if-none-match', b'').decode('latin-1')
+            if web_server.not_modified(result, if_none_match):
+                body, status, headers = b'', 304, headers[1:]
+        else:
+            payload, status = result
+            body = web_server.dumps_json(payload)
+        if status != 304:
+            headers.append((b'content-length', str(len(body)).encode()))
+        await send({
+            'type': 'http.response.start',
+            'status': status,
+            'headers': headers
+        })
+        await send({'type': 'http.response.body', 'body': body if scope['method'] == 'GET' else b''})
+        return status
+
+async def broadcast_stats_periodically():
+    """Diffuse les stats du jour toutes les 30 secondes"""
+    while True:
+        await asyncio.sleep(30)
+        try:
+            with tracer.span('broadcast_stats'):
+                room_emitter.emit('stats_update', await run_blocking(web_server.build_stats_payload, 'today'))
+        except Exception as e:
+            print(f"❌ Erreur stats update: {e}")
+
+background_tasks = []
+
+async def startup():
+    """Démarrage (lifespan) : boucle de l'émetteur, historique de santé, diffusion périodique des stats"""
+    emitter.loop = asyncio.get_running_loop()
+    health_history.start()
+    # En mode workers, les stats sont publiées par le bot sur le bus
+    if WEB_SERVER_MODE != 'workers':
+        background_tasks.append(asyncio.create_task(broadcast_stats_periodically()))
+
+async def shutdown():
+    emitter.loop = None
+    while background_tasks:
+        background_tasks.pop().cancel()
+
+flask_app = PooledWsgiToAsgi(web_server.app)
+asgi_app = socketio.ASGIApp(
+    sio,
+    other_asgi_app=LoopRoutes(flask_app) if WEB_SERVER_MODE == 'single_loop' else flask_app,
+    on_startup=startup,
+    on_shutdown=shutdown
+)
+
+# ============================================
+# WEBSOCKET HANDLERS
+# ============================================
+
+async def apply_subscription(sid, data, announce=False):
+    """Abonne le client (salles) et lui envoie l'état de son périmètre"""
+    subscription, joined, left = subscriptions.subscribe(sid, data)
+    for room in joined:
+        await sio.enter_room(sid, room)
+    for room in left:
+        await sio.leave_room(sid, room)
+    if announce:
+        await sio.emit('subscribed', subscription, to=sid)
+    if 'voice' in subscription['feeds']:
+        voice = voice_view(subscription, discord_bot.get_voice_data())
+        await sio.emit('voice_update', client_payload(subscription, 'voice_update', voice), to=sid)
+    if 'health' in subscription['feeds']:
+        await sio.emit('health_status', health_monitor.get_status(), to=sid)
+
+@sio.event
+@traced('socket connect')
+async def connect(sid, environ, auth=None):
+    """Envoie les données initiales lors de la connexion"""
+    print("🔌 Client connecté")
+    health_monitor.client_connected()
+    await apply_subscription(sid, auth.get('subscribe') if isinstance(auth, dict) else None)
+
+@sio.event
+async def disconnect(sid, *args):
+    """Gère la déconnexion d'un client"""
+    print("🔌 Client déconnecté")
+    subscriptions.remove(sid)
+    health_monitor.client_disconnected()
+
+@sio.on('subscribe')
+@traced('socket subscribe')
+async def handle_subscribe(sid, data=None):
+    """Change les flux, salons et serveurs suivis par le client"""
+    await apply_subscription(sid, data, announce=True)
+
+@sio.on('ping')
+async def handle_ping(sid, *args):
+    """Répond au ping du client"""
+    await sio.emit('pong', {'timestamp': health_monitor.get_status()['timestamp']}, to=sid)
+
+@sio.on('get_logs')
+@traced('socket get_logs')
+async def handle_get_logs(sid, data=None):
+    """Envoie les logs existants au client"""
+    limit = data.get('limit', 50) if data else 50
+    await sio.emit('logs_history', web_server.logs_history_payload(sid, limit), to=sid)
+
+@sio.on('get_stats')
+@traced('socket get_stats')
+async def handle_get_stats(sid, data=None):
+    """Envoie les statistiques complètes"""
+    payload = await run_blocking(web_server.request_stats_payload, *web_server.stats_request(data))
+    if payload is not None:
+        await sio.emit('stats_update', client_payload(subscriptions.get(sid), 'stats_update', payload), to=sid)
+
+# ============================================
+# LANCEMENT / ARRÊT
+# ============================================
+
+server = uvicorn.Server(uvicorn.Config(
+    asgi_app,
+    host=FLASK_HOST,
+    port=FLASK_PORT,
+    timeout_keep_alive=WEB_KEEPALIVE_TIMEOUT,
+    timeout_graceful_shutdown=WEB_GRACEFUL_TIMEOUT,
+    ws_per_message_deflate=SOCKETIO_PER_MESSAGE_DEFLATE,
+    lifespan='on',
+    log_level='warning'
+))
+stopped = threading.Event()
+
+async def serve():
+    """Sert l'application sur la boucle courante jusqu'à stop_server()"""
+    try:
+        await server.serve()
+    finally:
+        stopped.set()
+
+async def serve_with(main):
+    """
+    Mode single_loop : sert l'application sur la boucle courante pendant
+    l'exécution de la coroutine `main` (le bot), puis arrêt gracieux
+    """
+    web_task = asyncio.create_task(serve())
+    try:
+        await main
+    finally:
+        server.should_exit = True
+        await web_task
+
+def run_server():
+    """Lance uvicorn dans une boucle dédiée (bloquant, à appeler dans un thread)"""
+    asyncio.run(serve())
+
+def stop_server(timeout=WEB_GRACEFUL_TIMEOUT):
+    """
+    Arrêt gracieux : plus de nouvelles connexions, les requêtes en cours
+    ont jusqu'à WEB_GRACEFUL_TIMEOUT secondes ; les clients Socket.IO se
+    reconnectent au redémarrage.
+    """
+    if emitter.loop is None:
+        return
+    server.should_exit = True
+    stopped.wait(timeout + 1)
+    http_executor.shutdown(wait=False)
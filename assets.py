@@ -0,0 +1,143 @@
+# -*- coding: utf-8 -*-
+"""
+Fichiers statiques empreintés et précompressés
+
+Au démarrage, chaque fichier de static/ est lu une fois : un hash de son
+contenu entre dans son URL (/assets/js/app.3f2a9c1e5b7d.js) et ses variantes
+gzip (et brotli si le module est installé) sont gardées en mémoire. Le
+contenu d'une URL empreintée ne change jamais : elle est servie avec
+Cache-Control immutable. Les templates utilisent {{ asset_url('js/app.js') }}.
+
+Un fichier modifié n'est pris en compte qu'au redémarrage du serveur web.
+"""
+
+import gzip
+import hashlib
+import mimetypes
+import os
+import re
+from collections import namedtuple
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+ASSETS_URL_PATH = '/assets'
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+
+# Longueur de l'empreinte (hexadécimal) dans le nom du fichier
+DIGEST_LENGTH = 12
+FINGERPRINT = re.compile(r'^(?P<root>.+)\.[0-9a-f]{%d}(?P<ext>\.[^./]+)$' % DIGEST_LENGTH)
+
+# Les images et polices sont déjà compressées ; en dessous de MIN_COMPRESS_SIZE
+# octets, la compression ne gagne rien
+COMPRESSIBLE_TYPES = ('text/', 'application/javascript', 'application/json', 'image/svg+xml')
+MIN_COMPRESS_SIZE = 256
+
+# Ordre de préférence des encodages proposés au client
+ENCODINGS = ('br', 'gzip', 'identity')
+
+Asset = namedtuple('Asset', 'path fingerprinted mimetype etag variants')
+
+def fingerprinted_name(path, digest):
+    """css/style.css -> css/style.<digest>.css"""
+    root, ext = os.path.splitext(path)
+    return f'{root}.{digest}{ext}'
+
+def accepted_encodings(accept_encoding):
+    """Encodages acceptés d'après l'en-tête Accept-Encoding (q=0 exclu)"""
+    accepted = {'identity'}
+    for part in (accept_encoding or '').split(','):
+        coding, _, params = part.strip().partition(';')
+        coding = coding.strip().lower()
+        quality = params.strip()
+        if quality.startswith('q='):
+            try:
+                if float(quality[2:]) == 0:
+                    accepted.discard(coding)
+                    continue
+            except ValueError:
+                continue
+        if coding == '*':
+            accepted.update(ENCODINGS)
+        elif coding:
+            accepted.add(coding)
+    return accepted
+
+def compress_variants(content, mimetype):
+    """{encodage: contenu} ; une variante n'est gardée que si elle est plus petite"""
+    variants = {'identity': content}
+    if len(content) < MIN_COMPRESS_SIZE or not mimetype.startswith(COMPRESSIBLE_TYPES):
+        return variants
+    compressed = {'gzip': gzip.compress(content, compresslevel=9, mtime=0)}
+    if brotli is not None:
+        compressed['br'] = brotli.compress(content, quality=11)
+    variants.update((encoding, data) for encoding, data in compressed.items() if len(data) < len(content))
+    return variants
+
+class AssetManifest:
+    """Fichiers d'un dossier statique, indexés par chemin et par nom empreinté"""
+
+    def __init__(self, folder, url_path=ASSETS_URL_PATH):
+        self.folder = folder
+        self.url_path = url_path
+        self.assets = {}            # chemin relatif -> Asset
+        self.fingerprinted = {}     # nom empreinté -> Asset
+
+    def build(self):
+        """Lit, empreinte et compresse tous les fichiers du dossier"""
+        assets = {}
+        for directory, _, filenames in os.walk(self.folder):
+            for filename in filenames:
+                full_path = os.path.join(directory, filename)
+                path = os.path.relpath(full_path, self.folder).replace(os.sep, '/')
+                with open(full_path, 'rb') as f:
+                    assets[path] = self._load(path, f.read())
+        # Remplacement d'un bloc : les requêtes en cours voient l'ancien ou le nouvel index
+        self.fingerprinted = {asset.fingerprinted: asset for asset in assets.values()}
+        self.assets = assets
+        return self
+
+    @staticmethod
+    def _load(path, content):
+        digest = hashlib.sha256(content).hexdigest()[:DIGEST_LENGTH]
+        mimetype = mimetypes.guess_type(path)[0] or 'application/octet-stream'
+        if mimetype.startswith('text/') or mimetype == 'application/javascript':
+            mimetype += '; charset=utf-8'
+        # ETag faible : le même pour toutes les variantes compressées
+        return Asset(path, fingerprinted_name(path, digest), mimetype, f'W/"{digest}"',
+                     compress_variants(content, mimetype))
+
+    def url(self, path):
+        """URL empreintée d'un fichier statique (URL /static/ si inconnu)"""
+        asset = self.assets.get(path)
+        if asset is None:
+            return f'/static/{path}'
+        return f'{self.url_path}/{asset.fingerprinted}'
+
+    def lookup(self, name):
+        """
+        Fichier correspondant à un nom empreinté
+
+        Returns:
+            (Asset, immuable) ; immuable est False si l'empreinte ne correspond
+            plus au contenu (page servie avant un redémarrage) ; None si inconnu
+        """
+        asset = self.fingerprinted.get(name)
+        if asset is not None:
+            return asset, True
+        match = FINGERPRINT.match(name)
+        asset = match and self.assets.get(match.group('root') + match.group('ext'))
+        if asset:
+            return asset, False
+        return None
+
+    @staticmethod
+    def select(asset, accept_encoding):
+        """(encodage, contenu) : la plus petite variante acceptée par le client"""
+        accepted = accepted_encodings(accept_encoding)
+        for encoding in ENCODINGS:
+            if encoding in accepted and encoding in asset.variants:
+                return encoding, asset.variants[encoding]
+        return 'identity', asset.variants['identity']
@@ -0,0 +1,208 @@
+# -*- coding: utf-8 -*-
+"""
+Test multi-processus du mode 'workers' sur une seule machine
+
+Ce processus joue le bot (simulateur, broker du bus, BusPublisher) ; N workers
+web sont lancés par web_worker.start_workers et des clients Socket.IO se
+connectent au port partagé. Vérifie que :
+    - chaque client reçoit chaque voice_update et activity_log publié ;
+    - l'état final vu par chaque client et par /api/bot (une requête par
+      connexion, réparties sur les workers) est celui du bot ;
+    - /api/logs reflète les logs du bot et get_stats est calculé par le bot
+      (requête via le bus) ;
+et mesure la latence bot -> client à travers le broker et les workers.
+
+Usage :
+    python benchmarks/bus_workers.py --web-workers 4 --clients 40 --duration 10 --rate 20
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import socket
+import sys
+import tempfile
+import time
+import urllib.request
+
+import harness
+
+harness.use_database(os.path.join(tempfile.mkdtemp(), 'bus_workers.db'))
+
+import config
+config.TEST_MODE = True
+config.WEB_SERVER_MODE = 'workers'
+
+import discord_bot
+import web_server
+import web_worker
+from activity_logger import activity_logger
+from gateway_journal import latency_report
+from message_bus import BusPublisher, MessageBroker
+from test_data import VoiceSimulator
+
+# Événement du bus -> événement reçu par les clients
+BUS_EVENTS = {'voice_patch': 'voice_update', 'activity_log': 'activity_log'}
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def wait_for_port(port, timeout=15):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=0.2).close()
+            return True
+        except OSError:
+            time.sleep(0.1)
+    return False
+
+
+def normalize(data):
+    return json.loads(json.dumps(data, sort_keys=True))
+
+
+def http_json(url):
+    with urllib.request.urlopen(url, timeout=10) as response:
+        return json.loads(response.read())
+
+
+async def connect_clients(url, count):
+    import socketio
+
+    clients = []
+    for _ in range(count):
+        sio = socketio.AsyncClient(reconnection=False)
+        receipts = {'voice_update': [], 'activity_log': [], 'stats_update': []}
+        for event, received in receipts.items():
+            sio.on(event, lambda data, received=received: received.append((time.time(), data)))
+        await sio.connect(url, transports=['websocket'])
+        clients.append((sio, receipts))
+    return clients
+
+
+async def run(args):
+    port, bus_port = free_port(), free_port()
+    bus_address = ('127.0.0.1', bus_port)
+    url = f'http://127.0.0.1:{port}'
+
+    # Côté bot
+    authkey = os.urandom(32)
+    broker = MessageBroker(address=bus_address, authkey=authkey)
+    broker.start()
+    publisher = BusPublisher(address=bus_address, authkey=authkey, handle_request=web_server.handle_bus_request)
+    discord_bot.set_socketio(publisher)
+
+    published = {event: [] for event in BUS_EVENTS.values()}
+    original_put = publisher.outbox.put
+
+    def recording_put(message, *put_args, **put_kwargs):
+        if message[0] == 'publish' and message[1] in BUS_EVENTS:
+            published[BUS_EVENTS[message[1]]].append(time.time())
+        return original_put(message, *put_args, **put_kwargs)
+
+    publisher.outbox.put = recording_put
+
+    sim = VoiceSimulator(guilds=1, channels=5, members=args.members, event_rates={}, seed=1)
+    sim.populate(ratio=0.5)
+    discord_bot.use_simulator(sim)
+    discord_bot.update_voice_data()
+    discord_bot.broadcast_update()
+
+    # Workers web
+    workers = web_worker.start_workers(args.web_workers, '127.0.0.1', port, bus_address, authkey)
+    if not wait_for_port(port):
+        web_worker.stop_workers(workers)
+        sys.exit('❌ Les workers web ne répondent pas')
+    await asyncio.sleep(1)
+
+    clients = await connect_clients(url, args.clients)
+    await asyncio.sleep(0.5)
+
+    # Mesure : changements vocaux pilotés par le simulateur
+    start = time.time()
+    for event in published.values():
+        event.clear()
+    mix = {'join': 1, 'move': 1, 'mute': 2, 'stream': 1, 'webcam': 1}
+    sim.set_event_rates({kind: weight * args.rate / sum(mix.values()) for kind, weight in mix.items()})
+    deadline = time.monotonic() + args.duration
+    while time.monotonic() < deadline:
+        for event in sim.due_events():
+            await discord_bot.dispatch_simulated_event(event)
+        await asyncio.sleep(0.005)
+    await asyncio.sleep(args.drain)
+
+    # Vérifications
+    expected_state = normalize(discord_bot.get_voice_data())
+    checks = {}
+    latencies = {event: [] for event in published}
+    received = {event: 0 for event in published}
+    final_states_ok = True
+    for sio, receipts in clients:
+        for event, emits in published.items():
+            times = [t for t, _ in receipts[event] if t >= start]
+            received[event] += len(times)
+            latencies[event].extend(t - e for t, e in zip(times, emits))
+        last_state = receipts['voice_update'][-1][1] if receipts['voice_update'] else None
+        final_states_ok &= normalize(last_state) == expected_state
+
+    for event, emits in published.items():
+        checks[f'{event}_delivered'] = received[event] == len(emits) * len(clients)
+    checks['client_final_state'] = final_states_ok
+
+    rest_states = [normalize(http_json(f'{url}/api/bot')['data']) for _ in range(args.web_workers * 4)]
+    checks['rest_final_state'] = all(state == expected_state for state in rest_states)
+
+    logs = http_json(f'{url}/api/logs?limit=20')['logs']
+    checks['rest_logs'] = normalize(logs) == normalize(activity_logger.get_logs(20))
+
+    sio, receipts = clients[0]
+    await sio.emit('get_stats', {'period': 'week'})
+    await asyncio.sleep(1)
+    checks['stats_via_bus'] = bool(receipts['stats_update']) and receipts['stats_update'][-1][1]['period'] == 'week'
+
+    await asyncio.gather(*(sio.disconnect() for sio, _ in clients), return_exceptions=True)
+    web_worker.stop_workers(workers)
+    broker.close()
+
+    return {
+        'web_workers': args.web_workers,
+        'clients': len(clients),
+        'published': {event: len(emits) for event, emits in published.items()},
+        'received': received,
+        'latency': latency_report(latencies),
+        'checks': checks
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--web-workers', type=int, default=4)
+    parser.add_argument('--clients', type=int, default=40)
+    parser.add_argument('--members', type=int, default=100, help='Membres simulés')
+    parser.add_argument('--duration', type=float, default=10, help='Durée de la mesure (s)')
+    parser.add_argument('--rate', type=float, default=20, help='Changements vocaux par seconde')
+    parser.add_argument('--drain', type=float, default=2, help='Attente des derniers messages (s)')
+    parser.add_argument('--output', help='Écrit le rapport JSON dans ce fichier')
+    args = parser.parse_args()
+
+    report = asyncio.run(run(args))
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+
+    failed = [name for name, ok in report['checks'].items() if not ok]
+    if failed:
+        print(f"\n❌ Échec : {', '.join(failed)}")
+        sys.exit(1)
+    print('\n✅ Workers cohérents avec le bot')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,131 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark de la co-présence (temps passé ensemble par paire de membres)
+
+Sur la base de sessions du harness (1M de sessions par défaut) :
+    sweep        balayage complet de session_segments (sweep_overlaps), comparé
+                 sur un échantillon à la comparaison de toutes les paires
+    incremental  départ d'un membre (member_left) avec N membres connectés :
+                 recouvrements comptés contre les segments récents seulement
+    queries      get_companions et get_copresence_graph
+
+Usage :
+    python benchmarks/copresence_sweep.py --sessions 1000000 --output copresence.json
+"""
+
+import argparse
+import json
+import os
+import random
+import shutil
+import sqlite3
+import tempfile
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+import harness
+
+harness.use_database(os.path.join(tempfile.mkdtemp(), 'bench_globals.db'))
+
+from copresence import pair_key, sweep_overlaps
+from stats_tracker import StatsTracker
+
+
+def naive_overlaps(segments):
+    """Comparaison de toutes les paires : O(n²), référence du balayage"""
+    overlaps = defaultdict(float)
+    for i, (member, channel, start, end) in enumerate(segments):
+        for other, other_channel, other_start, other_end in segments[i + 1:]:
+            if channel == other_channel and member != other:
+                overlap = min(end, other_end) - max(start, other_start)
+                if overlap > 0:
+                    overlaps[pair_key(member, other, channel)] += overlap
+    return overlaps
+
+
+def bench_sweep(path, sample, results):
+    conn = sqlite3.connect(path)
+    start = time.perf_counter()
+    segments = conn.execute('SELECT member_name, channel, start_ts, end_ts FROM session_segments').fetchall()
+    results['sweep.load_segments_s'] = time.perf_counter() - start
+    conn.close()
+
+    start = time.perf_counter()
+    overlaps = sweep_overlaps(segments)
+    results['sweep.full_s'] = time.perf_counter() - start
+    results['sweep.segments'] = len(segments)
+    results['sweep.pairs'] = len(overlaps)
+
+    # Échantillon : les `sample` segments les plus anciens, balayage contre toutes les paires
+    subset = sorted(segments, key=lambda segment: segment[2])[:sample]
+    start = time.perf_counter()
+    swept = sweep_overlaps(subset)
+    results[f'sweep.sample_s[segments={sample}]'] = time.perf_counter() - start
+    start = time.perf_counter()
+    naive = naive_overlaps(subset)
+    results[f'naive.sample_s[segments={sample}]'] = time.perf_counter() - start
+    results['sweep.sample_max_error_s'] = max((abs(swept.get(key, 0) - value) for key, value in naive.items()),
+                                              default=0)
+
+
+def bench_incremental(path, connected, min_time, results):
+    """member_left + member_joined sur une copie de la base, `connected` membres en vocal"""
+    copy = os.path.join(tempfile.mkdtemp(), 'copresence.db')
+    shutil.copy(path, copy)
+
+    clock = [datetime.now() + timedelta(minutes=1)]
+    tracker = StatsTracker(db_path=copy, clock=lambda: clock[0])
+    rng = random.Random(1)
+    channels = [f'Salon {i}' for i in range(5)]
+    online = [f'Membre {i}' for i in range(connected)]
+    offline = [f'Membre {i}' for i in range(connected, 2 * connected)]
+    for name in online:
+        tracker.member_joined(name, rng.choice(channels))
+        clock[0] += timedelta(seconds=rng.uniform(1, 30))
+
+    def turnover():
+        clock[0] += timedelta(seconds=rng.uniform(1, 30))
+        leaving = online.pop(rng.randrange(len(online)))
+        tracker.member_left(leaving)
+        joining = offline.pop(rng.randrange(len(offline)))
+        tracker.member_joined(joining, rng.choice(channels))
+        online.append(joining)
+        offline.append(leaving)
+
+    results[f'incremental.leave_join[connected={connected}]'] = harness.bench(turnover, min_time)
+    results['incremental.recent_segments'] = len(tracker.recent_segments)
+    return tracker
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sessions', type=int, default=1_000_000)
+    parser.add_argument('--sample', type=int, default=5000, help='Segments comparés à la méthode O(n²)')
+    parser.add_argument('--connected', type=int, default=50, help='Membres en vocal pendant le test incrémental')
+    parser.add_argument('--min-time', type=float, default=0.5, help='Durée minimale par benchmark (s)')
+    parser.add_argument('--output', help='Écrit les résultats JSON dans ce fichier')
+    args = parser.parse_args()
+
+    path = harness.build_sessions_db(harness.cached_db(f'sessions_{args.sessions}.db'), args.sessions)
+    results = {}
+
+    # Premier démarrage sur la base : segments puis co-présence reconstitués
+    start = time.perf_counter()
+    StatsTracker(db_path=path)
+    results['startup_backfill_s'] = time.perf_counter() - start
+
+    bench_sweep(path, args.sample, results)
+    tracker = bench_incremental(path, args.connected, args.min_time, results)
+    results['query.get_companions'] = harness.bench(lambda: tracker.get_companions('Membre 1'), args.min_time)
+    results['query.get_copresence_graph'] = harness.bench(tracker.get_copresence_graph, args.min_time)
+
+    report = {'meta': dict(harness.metadata('custom'), sessions=args.sessions), 'results': results}
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
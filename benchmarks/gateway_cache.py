@@ -0,0 +1,224 @@
+# -*- coding: utf-8 -*-
+"""
+Compare la mémoire et le volume d'événements gateway entre le mode complet
+(intents members + presences) et le mode lean (cache vocal uniquement).
+
+Un fixture de payloads gateway (GUILD_CREATE puis flux d'événements) est
+généré de façon déterministe, ou rechargé depuis un fichier enregistré.
+Pour le mode lean, on ne garde que ce que Discord enverrait sans les intents
+privilégiés : pas de presences, membres limités à ceux en vocal.
+
+Usage :
+    python benchmarks/gateway_cache.py --members 5000 --record fixture.json
+    python benchmarks/gateway_cache.py --fixture fixture.json
+"""
+
+import argparse
+import gc
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import config
+config.DATABASE_PATH = os.path.join(tempfile.gettempdir(), 'voice_stats_bench.db')
+
+import discord
+from discord_bot import build_gateway_settings
+
+# Événements que Discord n'envoie qu'avec un intent privilégié
+PRIVILEGED_EVENTS = {
+    'PRESENCE_UPDATE': 'presences',
+    'GUILD_MEMBER_ADD': 'members',
+    'GUILD_MEMBER_UPDATE': 'members',
+    'GUILD_MEMBER_REMOVE': 'members'
+}
+
+STATUSES = ['online', 'idle', 'dnd', 'offline']
+
+
+def _user(user_id):
+    return {
+        'id': str(user_id),
+        'username': f'user{user_id}',
+        'global_name': f'User {user_id}',
+        'discriminator': '0',
+        'avatar': None
+    }
+
+
+def _member(user_id):
+    return {
+        'user': _user(user_id),
+        'roles': [],
+        'nick': None,
+        'joined_at': '2024-01-01T00:00:00+00:00',
+        'deaf': False,
+        'mute': False,
+        'flags': 0
+    }
+
+
+def _presence(guild_id, user_id, rng):
+    status = rng.choice(STATUSES)
+    return {
+        'user': {'id': str(user_id)},
+        'guild_id': str(guild_id),
+        'status': status,
+        'activities': [{'name': f'Game {rng.randint(1, 50)}', 'type': 0}] if rng.random() < 0.3 else [],
+        'client_status': {'desktop': status}
+    }
+
+
+def _voice_state(guild_id, channel_id, user_id, rng):
+    return {
+        'guild_id': str(guild_id),
+        'channel_id': str(channel_id) if channel_id else None,
+        'user_id': str(user_id),
+        'member': _member(user_id),
+        'session_id': f'session{user_id}',
+        'deaf': False,
+        'mute': False,
+        'self_deaf': rng.random() < 0.1,
+        'self_mute': rng.random() < 0.3,
+        'self_video': rng.random() < 0.1,
+        'self_stream': rng.random() < 0.1,
+        'suppress': False,
+        'request_to_speak_timestamp': None
+    }
+
+
+def build_fixture(guilds=1, members=5000, voice_members=50, channels=5, events=20000, seed=42):
+    """Génère des GUILD_CREATE et un flux d'événements gateway réaliste"""
+    rng = random.Random(seed)
+    fixture = {'guilds': [], 'events': []}
+    next_id = 10_000
+
+    for g in range(guilds):
+        guild_id = 1_000 + g
+        channel_ids = [guild_id * 100 + c for c in range(channels)]
+        user_ids = list(range(next_id, next_id + members))
+        next_id += members
+        in_voice = rng.sample(user_ids, min(voice_members, members))
+
+        fixture['guilds'].append({
+            'id': str(guild_id),
+            'name': f'Guild {g}',
+            'member_count': members,
+            'unavailable': False,
+            'roles': [{
+                'id': str(guild_id), 'name': '@everyone', 'permissions': '0', 'position': 0,
+                'color': 0, 'hoist': False, 'managed': False, 'mentionable': False
+            }],
+            'channels': [
+                {'id': str(cid), 'type': 2, 'name': f'Vocal {i}', 'position': i,
+                 'permission_overwrites': [], 'bitrate': 64000, 'user_limit': 0}
+                for i, cid in enumerate(channel_ids)
+            ],
+            'members': [_member(uid) for uid in user_ids],
+            'presences': [_presence(guild_id, uid, rng) for uid in user_ids if rng.random() < 0.6],
+            'voice_states': [
+                {k: v for k, v in _voice_state(guild_id, rng.choice(channel_ids), uid, rng).items() if k != 'member'}
+                for uid in in_voice
+            ],
+            'emojis': [], 'stickers': [], 'features': [], 'threads': [], 'stage_instances': [],
+            'guild_scheduled_events': [], 'soundboard_sounds': []
+        })
+
+        # Flux : majorité de presences, quelques changements vocaux et membres
+        for _ in range(events // guilds):
+            roll = rng.random()
+            if roll < 0.85:
+                fixture['events'].append({'t': 'PRESENCE_UPDATE', 'd': _presence(guild_id, rng.choice(user_ids), rng)})
+            elif roll < 0.97:
+                uid = rng.choice(in_voice)
+                channel_id = rng.choice(channel_ids + [None])
+                fixture['events'].append({'t': 'VOICE_STATE_UPDATE', 'd': _voice_state(guild_id, channel_id, uid, rng)})
+            else:
+                data = _member(rng.choice(user_ids))
+                data['guild_id'] = str(guild_id)
+                data['nick'] = f'nick{rng.randint(0, 999)}'
+                fixture['events'].append({'t': 'GUILD_MEMBER_UPDATE', 'd': data})
+
+    return fixture
+
+
+def filter_for_mode(fixture, lean):
+    """Ne garde que ce que la gateway enverrait avec les intents du mode"""
+    if not lean:
+        return fixture['guilds'], fixture['events']
+
+    guilds = []
+    for guild in fixture['guilds']:
+        in_voice = {vs['user_id'] for vs in guild['voice_states']}
+        guild = dict(guild)
+        guild['members'] = [m for m in guild['members'] if m['user']['id'] in in_voice]
+        guild['presences'] = []
+        guilds.append(guild)
+
+    events = [ev for ev in fixture['events'] if ev['t'] not in PRIVILEGED_EVENTS]
+    return guilds, events
+
+
+def measure(fixture, lean):
+    """Charge le fixture dans un cache discord.py et mesure mémoire et débit"""
+    intents, member_cache_flags = build_gateway_settings(lean)
+    guilds, events = filter_for_mode(fixture, lean)
+
+    client = discord.Client(intents=intents, member_cache_flags=member_cache_flags, chunk_guilds_at_startup=False)
+    state = client._connection
+    state.user = discord.ClientUser(state=state, data=dict(_user(1), bot=True, verified=True, mfa_enabled=False))
+
+    gc.collect()
+    tracemalloc.start()
+    for guild in guilds:
+        state._get_create_guild(guild)
+    gc.collect()
+    memory = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    start = time.perf_counter()
+    for event in events:
+        getattr(state, 'parse_' + event['t'].lower())(event['d'])
+    elapsed = time.perf_counter() - start
+
+    return {
+        'mode': 'lean' if lean else 'full',
+        'cached_members': sum(len(g.members) for g in state.guilds),
+        'cache_memory_bytes': memory,
+        'events_received': len(events),
+        'events_total': len(fixture['events']),
+        'event_processing_s': elapsed
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--guilds', type=int, default=1)
+    parser.add_argument('--members', type=int, default=5000)
+    parser.add_argument('--voice-members', type=int, default=50)
+    parser.add_argument('--events', type=int, default=20000)
+    parser.add_argument('--fixture', help='Fixture enregistré à rejouer')
+    parser.add_argument('--record', help='Enregistre le fixture généré dans ce fichier')
+    args = parser.parse_args()
+
+    if args.fixture:
+        with open(args.fixture, encoding='utf-8') as f:
+            fixture = json.load(f)
+    else:
+        fixture = build_fixture(args.guilds, args.members, args.voice_members, events=args.events)
+        if args.record:
+            with open(args.record, 'w', encoding='utf-8') as f:
+                json.dump(fixture, f)
+
+    results = [measure(fixture, lean=False), measure(fixture, lean=True)]
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,145 @@
+# -*- coding: utf-8 -*-
+"""
+Outils communs aux benchmarks : chronométrage, fixtures SQLite, comparaison
+avec une baseline.
+"""
+
+import gc
+import json
+import os
+import platform
+import random
+import sqlite3
+import statistics
+import sys
+import time
+from datetime import datetime, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '.cache')
+
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+# Échelles : membres connectés / sessions en base
+SCALES = {
+    'small': {'members': 10, 'sessions': 10_000},
+    'medium': {'members': 1_000, 'sessions': 1_000_000},
+    'large': {'members': 10_000, 'sessions': 10_000_000}
+}
+
+
+def use_database(path):
+    """Choisit la base SQLite globale ; à appeler avant d'importer stats_tracker"""
+    import config
+    config.DATABASE_PATH = path
+
+
+def bench(func, min_time=0.5, max_runs=10_000, setup=None):
+    """
+    Exécute func jusqu'à min_time secondes (au moins 3 fois)
+
+    Returns:
+        dict avec median/mean/p90/min en ms et le nombre d'exécutions
+    """
+    timings = []
+    gc.collect()
+    deadline = time.perf_counter() + min_time
+    while len(timings) < 3 or (time.perf_counter() < deadline and len(timings) < max_runs):
+        if setup:
+            setup()
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+
+    timings.sort()
+    return {
+        'runs': len(timings),
+        'median_ms': statistics.median(timings) * 1000,
+        'mean_ms': statistics.fmean(timings) * 1000,
+        'p90_ms': timings[int((len(timings) - 1) * 0.9)] * 1000,
+        'min_ms': timings[0] * 1000
+    }
+
+
+def build_sessions_db(path, sessions, members=200, channels=5, days=730, seed=1):
+    """
+    Crée (ou réutilise) une base avec `sessions` sessions terminées réparties
+    sur `days` jours ; une part est placée aujourd'hui et cette semaine.
+    """
+    if os.path.exists(path):
+        return path
+
+    from stats_tracker import StatsTracker
+    StatsTracker(db_path=path)  # schéma
+
+    rng = random.Random(seed)
+    now = datetime.now()
+    member_names = [f'Membre {i}' for i in range(members)]
+    channel_names = [f'Salon {i}' for i in range(channels)]
+
+    def rows():
+        for i in range(sessions):
+            # 2 % des sessions aujourd'hui, 5 % dans la semaine, le reste sur la période
+            roll = rng.random()
+            if roll < 0.02:
+                start = now.replace(hour=0, minute=0, second=0) + timedelta(seconds=rng.uniform(0, max(1, (now - now.replace(hour=0, minute=0, second=0)).total_seconds())))
+            elif roll < 0.07:
+                start = now - timedelta(days=rng.uniform(0, 7))
+            else:
+                start = now - timedelta(days=rng.uniform(0, days))
+            duration = min(rng.lognormvariate(7, 1), 6 * 3600)
+            start = min(start, now - timedelta(seconds=duration))
+            visited = rng.sample(channel_names, rng.choice((1, 1, 1, 2)))
+            yield (rng.choice(member_names), start.isoformat(), (start + timedelta(seconds=duration)).isoformat(),
+                   duration, json.dumps(visited))
+
+    conn = sqlite3.connect(path)
+    conn.execute('PRAGMA journal_mode = OFF')
+    conn.execute('PRAGMA synchronous = OFF')
+    conn.executemany('''
+        INSERT INTO sessions (member_name, start_time, end_time, duration, channels, is_active)
+        VALUES (?, ?, ?, ?, ?, 0)
+    ''', rows())
+    conn.commit()
+    conn.close()
+    return path
+
+
+def cached_db(name):
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    return os.path.join(CACHE_DIR, name)
+
+
+def metadata(scale):
+    return {
+        'scale': scale,
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'timestamp': datetime.now().isoformat()
+    }
+
+
+def compare(current, baseline, threshold=0.2):
+    """
+    Compare deux résultats (médianes) ; retourne la liste des régressions
+
+    Une régression est une médiane supérieure de plus de `threshold`
+    (20 % par défaut) à celle de la baseline.
+    """
+    regressions = []
+    lines = []
+    for name, result in sorted(current['results'].items()):
+        base = baseline.get('results', {}).get(name)
+        if not base:
+            lines.append(f'  {name:<55} {result["median_ms"]:>10.3f} ms   (nouveau)')
+            continue
+        ratio = result['median_ms'] / base['median_ms'] if base['median_ms'] else float('inf')
+        flag = ''
+        if ratio > 1 + threshold:
+            flag = '  ⚠️ RÉGRESSION'
+            regressions.append({'name': name, 'baseline_ms': base['median_ms'],
+                                'current_ms': result['median_ms'], 'ratio': ratio})
+        lines.append(f'  {name:<55} {result["median_ms"]:>10.3f} ms   x{ratio:.2f}{flag}')
+    print('\n'.join(lines))
+    return regressions
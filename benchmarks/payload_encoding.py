@@ -0,0 +1,171 @@
+# -*- coding: utf-8 -*-
+"""
+Octets envoyés et CPU d'encodage par diffusion de voice_update et stats_update
+
+Compare, pour chaque nombre de membres (tous en vocal) :
+    json            paquet Socket.IO texte (encodé une fois par diffusion)
+    json+pmd        même paquet compressé par permessage-deflate : une
+                    compression par connexion (contexte conservé entre les
+                    messages, comme wsproto)
+    deflate         encodage binaire opt-in (subscriptions.encode_payload),
+                    compressé une fois par diffusion
+    msgpack         pour comparaison, si le module msgpack est installé
+
+Les octets sont la moyenne par message sur une suite de diffusions (un
+changement vocal entre deux voice_update). Le CPU par diffusion inclut la
+compression de chaque connexion pour json+pmd (--clients connexions).
+
+Usage :
+    python benchmarks/payload_encoding.py --members 100 2000 --clients 500
+"""
+
+import argparse
+import json
+import os
+import random
+import tempfile
+import zlib
+
+import harness
+
+harness.use_database(os.path.join(tempfile.mkdtemp(), 'payload_encoding.db'))
+
+import config
+config.TEST_MODE = True
+
+import discord_bot
+import web_server
+from socketio import packet
+from subscriptions import encode_payload
+from test_data import VoiceSimulator
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+
+def socketio_frames(event, data):
+    """Trames websocket d'un événement Socket.IO (texte, puis pièces jointes binaires)"""
+    encoded = packet.Packet(packet.EVENT, data=[event, data]).encode()
+    frames = encoded if isinstance(encoded, list) else [encoded]
+    # Préfixe engine.io '4' (message) des trames texte
+    return [('4' + frame).encode('utf-8') if isinstance(frame, str) else frame for frame in frames]
+
+
+class PerMessageDeflate:
+    """Compression permessage-deflate d'une connexion (contexte conservé)"""
+
+    def __init__(self):
+        self.compressor = zlib.compressobj(zlib.Z_DEFAULT_COMPRESSION, zlib.DEFLATED, -zlib.MAX_WBITS)
+
+    def compress(self, frame):
+        data = self.compressor.compress(frame) + self.compressor.flush(zlib.Z_SYNC_FLUSH)
+        return data[:-4]
+
+
+def voice_states(sim, count, rng):
+    """Suite d'états vocaux, un changement de flag entre deux états"""
+    states = []
+    for _ in range(count):
+        index = rng.choice(list(sim.location))
+        flag = rng.choice(('muted', 'deafened', 'stream', 'webcam'))
+        sim.set_flag(index, flag, not sim.members[index]['data'].get(flag))
+        discord_bot.update_voice_data()
+        states.append(json.loads(json.dumps(discord_bot.get_voice_data())))
+    return states
+
+
+def measure(event, payloads, clients, min_time):
+    """Octets moyens par message et ms de CPU par diffusion, pour chaque encodage"""
+    results = {}
+
+    def json_broadcast():
+        for payload in payloads:
+            socketio_frames(event, payload)
+
+    frames = [socketio_frames(event, payload) for payload in payloads]
+    results['json'] = {
+        'bytes': sum(len(frame) for message in frames for frame in message) / len(payloads),
+        'cpu_ms': harness.bench(json_broadcast, min_time)['median_ms'] / len(payloads)
+    }
+
+    # Une connexion suffit pour le coût unitaire ; contexte neuf à chaque mesure
+    def pmd_connection():
+        connection = PerMessageDeflate()
+        return [sum(len(connection.compress(frame)) for frame in message) for message in frames]
+
+    pmd_bytes = pmd_connection()
+    pmd_cpu = harness.bench(pmd_connection, min_time)['median_ms'] / len(payloads)
+    results['json+pmd'] = {
+        'bytes': sum(pmd_bytes) / len(payloads),
+        'cpu_ms': results['json']['cpu_ms'] + pmd_cpu * clients,
+        'cpu_ms_per_client': pmd_cpu
+    }
+
+    def deflate_broadcast():
+        for payload in payloads:
+            socketio_frames(event, encode_payload(payload))
+
+    binary_frames = [socketio_frames(event, encode_payload(payload)) for payload in payloads]
+    results['deflate'] = {
+        'bytes': sum(len(frame) for message in binary_frames for frame in message) / len(payloads),
+        'cpu_ms': harness.bench(deflate_broadcast, min_time)['median_ms'] / len(payloads)
+    }
+
+    if msgpack is not None:
+        def msgpack_broadcast():
+            for payload in payloads:
+                socketio_frames(event, msgpack.packb(payload))
+
+        msgpack_frames = [socketio_frames(event, msgpack.packb(payload)) for payload in payloads]
+        results['msgpack'] = {
+            'bytes': sum(len(frame) for message in msgpack_frames for frame in message) / len(payloads),
+            'cpu_ms': harness.bench(msgpack_broadcast, min_time)['median_ms'] / len(payloads)
+        }
+    return results
+
+
+def run(members, args):
+    rng = random.Random(1)
+    sim = VoiceSimulator(guilds=1, channels=max(5, members // 100), members=members, event_rates={}, seed=1)
+    sim.populate(ratio=1.0)
+    discord_bot.use_simulator(sim)
+    discord_bot.update_voice_data()
+
+    stats_payloads = [json.loads(json.dumps(web_server.build_stats_payload('today')))] * args.messages
+    return {
+        'members': members,
+        'voice_update': measure('voice_update', voice_states(sim, args.messages, rng), args.clients, args.min_time),
+        'stats_update': measure('stats_update', stats_payloads, args.clients, args.min_time)
+    }
+
+
+def print_report(report, clients):
+    print(f"{'membres':>8} {'événement':<13} {'encodage':<9} {'octets/msg':>11} {'CPU/diffusion':>14}")
+    for result in report:
+        for event in ('voice_update', 'stats_update'):
+            for encoding, values in result[event].items():
+                print(f"{result['members']:>8} {event:<13} {encoding:<9} {values['bytes']:>11.0f} "
+                      f"{values['cpu_ms']:>11.3f} ms")
+    print(f"(json+pmd : {clients} connexions compressées séparément)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--members', type=int, nargs='+', default=[100, 2000])
+    parser.add_argument('--clients', type=int, default=500, help='Connexions par diffusion (permessage-deflate)')
+    parser.add_argument('--messages', type=int, default=20, help='Diffusions successives mesurées')
+    parser.add_argument('--min-time', type=float, default=0.5)
+    parser.add_argument('--output', help='Écrit le rapport JSON dans ce fichier')
+    args = parser.parse_args()
+
+    report = [run(members, args) for members in args.members]
+    print_report(report, args.clients)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump({'clients': args.clients, 'results': report}, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,229 @@
+# -*- coding: utf-8 -*-
+"""
+Suite de benchmarks des chemins critiques (bot, stats, web)
+
+Mesure track_voice_changes, update_voice_data (alimenté par le simulateur),
+chaque requête de StatsTracker, l'ajout/lecture dans ActivityLogger et chaque
+route Flask (client de test), aux échelles :
+    small  : 10 membres,     10k sessions
+    medium : 1k membres,     1M sessions
+    large  : 10k membres,    10M sessions
+
+Les bases de sessions sont générées une fois dans benchmarks/.cache/.
+
+Usage :
+    python benchmarks/run.py --scale small --output results.json
+    python benchmarks/run.py --scale small --compare baseline.json --threshold 0.2
+"""
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+
+import harness
+
+# Base vide pour les instances globales (le fixture est ouvert séparément)
+harness.use_database(os.path.join(tempfile.mkdtemp(), 'bench_globals.db'))
+
+import config
+config.TEST_MODE = True
+
+import discord_bot
+from activity_logger import ActivityLogger
+from stats_tracker import StatsTracker, period_days
+from test_data import VoiceSimulator
+
+# Valeurs utilisées pour les routes à paramètres
+ROUTE_ARGS = {
+    'filename': 'css/style.css'
+}
+
+
+def make_simulator(members):
+    channels = max(3, min(50, members // 20))
+    sim = VoiceSimulator(guilds=1, channels=channels, members=members, seed=1)
+    sim.populate(ratio=1.0)
+    return sim
+
+
+def bench_bot(members, results, min_time):
+    """track_voice_changes et update_voice_data sur le monde simulé"""
+    sim = make_simulator(members)
+    discord_bot.set_socketio(None)
+    discord_bot.use_simulator(sim)
+    discord_bot.TEST_MODE = True
+    discord_bot.update_voice_data()
+
+    # Deux états ne différant que par un bit d'un membre
+    base = discord_bot.build_voice_flags(sim.snapshot())
+    changed = {channel: dict(members_flags) for channel, members_flags in base.items()}
+    channel = next(c for c, m in changed.items() if m)
+    member = next(iter(changed[channel]))
+    changed[channel][member] ^= discord_bot.FLAG_STREAM
+    states = [base, changed]
+    turn = [0]
+
+    def swap():
+        turn[0] ^= 1
+        discord_bot.voice_flags = states[turn[0]]
+
+    discord_bot.voice_flags = base
+    discord_bot.track_voice_changes()
+    results[f'bot.track_voice_changes.one_change[members={members}]'] = harness.bench(
+        discord_bot.track_voice_changes, min_time, setup=swap)
+
+    discord_bot.voice_flags = base
+    discord_bot.track_voice_changes()
+    results[f'bot.track_voice_changes.unchanged[members={members}]'] = harness.bench(
+        discord_bot.track_voice_changes, min_time)
+
+    online = list(sim.online)
+
+    def toggle():
+        index = sim.rng.choice(online)
+        sim.set_flag(index, 'muted', not sim.members[index]['data']['muted'])
+
+    results[f'bot.update_voice_data[members={members}]'] = harness.bench(
+        discord_bot.update_voice_data, min_time, setup=toggle)
+    return sim
+
+
+def bench_stats(sessions, members, results, min_time):
+    """Toutes les requêtes de StatsTracker sur une base de `sessions` sessions"""
+    path = harness.build_sessions_db(harness.cached_db(f'sessions_{sessions}.db'), sessions)
+    tracker = StatsTracker(db_path=path)
+
+    # Sessions en cours injectées en mémoire (la base fixture n'est pas modifiée)
+    now = tracker.clock()
+    for i in range(min(members, 200)):
+        tracker.active_sessions[f'Membre {i}'] = {
+            'session_id': None,
+            'channel': 'Salon 0',
+            'join_time': now,
+            'channel_changes': [],
+            'segment_start': now,
+            'segments': [],
+            'states': {'muted': now},
+            'state_time': {}
+        }
+
+    queries = {
+        'get_current_sessions': lambda: tracker.get_current_sessions(),
+        'get_daily_stats': lambda: tracker.get_daily_stats(),
+        'get_daily_stats.member': lambda: tracker.get_daily_stats('Membre 1'),
+        'get_weekly_stats': lambda: tracker.get_weekly_stats(),
+        'get_weekly_stats.member': lambda: tracker.get_weekly_stats('Membre 1'),
+        'get_top_users_today': lambda: tracker.get_top_users_today(limit=10),
+        'get_records': lambda: tracker.get_records(),
+        'get_duration_stats': lambda: tracker.get_duration_stats('member'),
+        'get_duration_stats.channel': lambda: tracker.get_duration_stats('channel'),
+        'get_range_stats.month': lambda: tracker.get_range_stats(*period_days('month', now.date())),
+        'get_range_stats.year': lambda: tracker.get_range_stats(*period_days('year', now.date())),
+        'get_range_stats.year.channel': lambda: tracker.get_range_stats(*period_days('year', now.date()), 'channel'),
+        'get_range_stats.year.day': lambda: tracker.get_range_stats(*period_days('year', now.date()), 'day'),
+        'get_member_history.year': lambda: tracker.get_member_history('Membre 1', *period_days('year', now.date())),
+        'get_member_history.all': lambda: tracker.get_member_history('Membre 1')
+    }
+    for name, query in queries.items():
+        results[f'stats.{name}[sessions={sessions}]'] = harness.bench(query, min_time)
+
+    # Écriture : cycle arrivée/départ sur une base jetable
+    write_tracker = StatsTracker(db_path=os.path.join(tempfile.mkdtemp(), 'writes.db'))
+
+    def join_leave():
+        write_tracker.member_joined('Bench', 'Salon 0', ['muted'])
+        write_tracker.member_state_changed('Bench', 'stream', True)
+        write_tracker.member_left('Bench')
+
+    results['stats.member_join_leave'] = harness.bench(join_leave, min_time)
+
+
+def bench_logger(results, min_time):
+    logger = ActivityLogger(max_logs=200)
+    for i in range(200):
+        logger.log_join(f'Membre {i}', 'Salon 0')
+
+    results['logger.log_join'] = harness.bench(lambda: logger.log_join('Bench', 'Salon 0'), min_time)
+    results['logger.log_mute'] = harness.bench(lambda: logger.log_mute('Bench', 'Salon 0'), min_time)
+    results['logger.get_logs'] = harness.bench(lambda: logger.get_logs(50), min_time)
+    results['logger.get_all_logs'] = harness.bench(logger.get_all_logs, min_time)
+
+
+def bench_routes(sim, members, results, min_time):
+    """Chaque route Flask via le client de test"""
+    import web_server
+
+    args = dict(ROUTE_ARGS)
+    args['member_name'] = sim.members[0]['data']['name']
+    args['fingerprinted'] = web_server.assets.url(ROUTE_ARGS['filename']).split('/', 2)[2]
+    client = web_server.app.test_client()
+
+    for rule in sorted(web_server.app.url_map.iter_rules(), key=lambda r: r.rule):
+        if 'GET' not in rule.methods or any(arg not in args for arg in rule.arguments):
+            continue
+        url = rule.rule
+        for arg in rule.arguments:
+            url = url.replace(f'<{arg}>', args[arg]).replace(f'<path:{arg}>', args[arg])
+
+        def request(url=url):
+            client.get(url).close()
+
+        results[f'web.GET {rule.rule}[members={members}]'] = harness.bench(request, min_time)
+
+        # Requête conditionnelle (client qui interroge régulièrement) : 304
+        response = client.get(url)
+        etag = response.headers.get('ETag')
+        response.close()
+        if etag:
+            def conditional_request(url=url, etag=etag):
+                client.get(url, headers={'If-None-Match': etag}).close()
+
+            results[f'web.GET {rule.rule} 304[members={members}]'] = harness.bench(conditional_request, min_time)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--scale', choices=sorted(harness.SCALES), default='small')
+    parser.add_argument('--min-time', type=float, default=0.3, help='Durée minimale par benchmark (s)')
+    parser.add_argument('--only', help='Ne lance que les groupes listés (bot,stats,logger,web)')
+    parser.add_argument('--output', help='Écrit les résultats JSON dans ce fichier')
+    parser.add_argument('--compare', help='Baseline JSON à comparer')
+    parser.add_argument('--threshold', type=float, default=0.2, help='Régression tolérée (0.2 = +20 %%)')
+    args = parser.parse_args()
+
+    scale = harness.SCALES[args.scale]
+    groups = set(args.only.split(',')) if args.only else {'bot', 'stats', 'logger', 'web'}
+    results = {}
+
+    sim = None
+    if 'bot' in groups or 'web' in groups:
+        sim = bench_bot(scale['members'], results if 'bot' in groups else {}, args.min_time)
+    if 'stats' in groups:
+        bench_stats(scale['sessions'], scale['members'], results, args.min_time)
+    if 'logger' in groups:
+        bench_logger(results, args.min_time)
+    if 'web' in groups:
+        bench_routes(sim, scale['members'], results, args.min_time)
+
+    report = {'meta': harness.metadata(args.scale), 'results': results}
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            baseline = json.load(f)
+        regressions = harness.compare(report, baseline, args.threshold)
+        if regressions:
+            print(f'\n❌ {len(regressions)} régression(s) au-delà de {args.threshold:.0%}')
+            sys.exit(1)
+        print('\n✅ Aucune régression')
+    elif not args.output:
+        print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
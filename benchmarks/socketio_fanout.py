@@ -0,0 +1,454 @@
+# -*- coding: utf-8 -*-
+"""
+Test de charge du fan-out Socket.IO
+
+Démarre le serveur web dans ce processus (mode test, simulateur), connecte
+des milliers de clients Socket.IO headless répartis dans des processus
+workers, puis génère des changements vocaux. Rapporte pour voice_update,
+activity_log, stats_update et health_status : latence émission -> réception
+(percentiles), messages perdus, et mémoire serveur par connexion.
+
+--profile choisit l'abonnement des clients (subscriptions.py) pour mesurer
+les octets reçus par client selon la page : all (sans abonnement), dashboard
+(app.js), stats (stats.js) ou channel (un seul salon).
+
+Socket.IO garantissant l'ordre par connexion, le k-ième message reçu d'un
+type est apparié au k-ième message diffusé de ce type.
+
+Usage :
+    python benchmarks/socketio_fanout.py --clients 1000 --workers 4 --duration 10 --rate 20
+    python benchmarks/socketio_fanout.py --mode asgi --clients 1000
+    python benchmarks/socketio_fanout.py --profile stats --clients 1000
+    python benchmarks/socketio_fanout.py --mode asgi --slow-clients 5 --members 500
+
+En mode single_loop, les événements vocaux sont traités sur la boucle du
+serveur, comme le bot dans main.py.
+"""
+
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import socket
+import tempfile
+import threading
+import time
+
+import harness
+
+harness.use_database(os.path.join(tempfile.mkdtemp(), 'fanout.db'))
+
+EVENTS = ('voice_update', 'activity_log', 'stats_update', 'health_status')
+PROFILES = ('all', 'dashboard', 'stats', 'channel')
+
+
+def subscription_profile(profile, sim):
+    """Abonnement envoyé par les clients à la connexion (None : aucun)"""
+    return {
+        'all': None,
+        'dashboard': {'feeds': ['voice', 'logs', 'health']},
+        'stats': {'feeds': ['stats']},
+        'channel': {'feeds': ['voice', 'logs', 'health'], 'channels': [sim.channels[0]['name']]}
+    }[profile]
+
+
+def raise_nofile_limit():
+    try:
+        import resource
+        soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+        resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+    except (ImportError, ValueError, OSError):
+        pass
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+# ============================================
+# WORKERS CLIENTS
+# ============================================
+
+def client_worker(url, count, subscription, ready_queue, control_queue, result_queue):
+    raise_nofile_limit()
+    asyncio.run(_client_main(url, count, subscription, ready_queue, control_queue, result_queue))
+
+
+async def _client_main(url, count, subscription, ready_queue, control_queue, result_queue):
+    import socketio
+
+    loop = asyncio.get_running_loop()
+    clients = []
+    receipts = []
+    bytes_received = []
+    event_bytes = {event: 0 for event in EVENTS}
+
+    def recorder(event, times, index):
+        async def handler(data):
+            times.append(time.time())
+            size = len(json.dumps(data, separators=(',', ':')))
+            bytes_received[index] += size
+            event_bytes[event] += size
+        return handler
+
+    async def connect(index):
+        sio = socketio.AsyncClient(reconnection=False)
+        times = {event: [] for event in EVENTS}
+        for event in EVENTS:
+            sio.on(event, recorder(event, times[event], index))
+        await sio.connect(url, transports=['websocket'],
+                          auth={'subscribe': subscription} if subscription else None)
+        clients.append(sio)
+        receipts.append(times)
+
+    failed = 0
+    for batch_start in range(0, count, 50):
+        batch = range(batch_start, min(batch_start + 50, count))
+        bytes_received.extend(0 for _ in batch)
+        outcomes = await asyncio.gather(*(connect(i) for i in batch), return_exceptions=True)
+        failed += sum(1 for outcome in outcomes if isinstance(outcome, Exception))
+
+    ready_queue.put({'connected': len(clients), 'failed': failed})
+
+    # Début de la mesure (les messages reçus à la connexion sont ignorés)
+    start = await loop.run_in_executor(None, control_queue.get)
+    for index in range(len(bytes_received)):
+        bytes_received[index] = 0
+    for event in EVENTS:
+        event_bytes[event] = 0
+    await loop.run_in_executor(None, control_queue.get)
+
+    results = [{event: [t for t in times[event] if t >= start] for event in EVENTS} for times in receipts]
+    result_queue.put({'receipts': results, 'bytes': bytes_received[:len(results)], 'event_bytes': event_bytes})
+
+    await asyncio.gather(*(sio.disconnect() for sio in clients), return_exceptions=True)
+
+
+def slow_client_worker(url, count, subscription, delay, ready_queue, control_queue, result_queue):
+    raise_nofile_limit()
+    asyncio.run(_slow_client_main(url, count, subscription, delay, ready_queue, control_queue, result_queue))
+
+
+async def _slow_client_main(url, count, subscription, delay, ready_queue, control_queue, result_queue):
+    """
+    Clients lents : engine.io brut sur aiohttp, petit tampon de réception, un
+    message lu toutes les `delay` secondes. Le serveur voit leur file d'envoi
+    grossir (contrôle de flux TCP) comme pour un client sur une mauvaise connexion.
+    Pendant le drain, ils lisent à pleine vitesse (connexion rétablie).
+    """
+    import aiohttp
+
+    loop = asyncio.get_running_loop()
+    receipts = [{event: [] for event in EVENTS} for _ in range(count)]
+    last_voice = [None] * count
+    pace = {'delay': delay}
+
+    def small_buffer_socket(addr_info):
+        family, sock_type, proto, _, _ = addr_info
+        sock = socket.socket(family, sock_type, proto)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4096)
+        return sock
+
+    session = aiohttp.ClientSession(connector=aiohttp.TCPConnector(socket_factory=small_buffer_socket))
+
+    async def run(index, connected):
+        ws = await session.ws_connect(url.replace('http', 'ws', 1) + '/socket.io/?EIO=4&transport=websocket',
+                                      max_msg_size=0)
+        await ws.receive()      # paquet open engine.io
+        await ws.send_str('40' + (json.dumps({'subscribe': subscription}) if subscription else ''))
+        connected.set_result(True)
+        while True:
+            message = await ws.receive()
+            if message.type != aiohttp.WSMsgType.TEXT:
+                return
+            if message.data == '2':     # ping engine.io
+                await ws.send_str('3')
+                continue
+            if message.data.startswith('42'):
+                event, *args = json.loads(message.data[2:])
+                if event in receipts[index]:
+                    receipts[index][event].append(time.time())
+                if event == 'voice_update':
+                    last_voice[index] = args[0]
+            await asyncio.sleep(pace['delay'])
+
+    tasks = []
+    for index in range(count):
+        connected = loop.create_future()
+        tasks.append(asyncio.create_task(run(index, connected)))
+        await connected
+    ready_queue.put({'connected': count, 'failed': 0})
+
+    start = await loop.run_in_executor(None, control_queue.get)
+    await loop.run_in_executor(None, control_queue.get)     # fin de la charge
+    pace['delay'] = 0
+    await loop.run_in_executor(None, control_queue.get)
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    await session.close()
+
+    results = [{event: [t for t in times[event] if t >= start] for event in EVENTS} for times in receipts]
+    result_queue.put({'slow': True, 'receipts': results, 'last_voice': last_voice})
+
+
+# ============================================
+# SERVEUR + PILOTE
+# ============================================
+
+def start_server(port, members, mode):
+    import config
+    config.TEST_MODE = True
+    config.WEB_SERVER_MODE = mode
+    config.FLASK_HOST = '127.0.0.1'
+    config.FLASK_PORT = port
+
+    import discord_bot
+    import web_server
+    from test_data import VoiceSimulator
+
+    sim = VoiceSimulator(guilds=1, channels=5, members=members, event_rates={}, seed=1)
+    sim.populate(ratio=0.6)
+    discord_bot.use_simulator(sim)
+    discord_bot.update_voice_data()
+
+    threading.Thread(target=web_server.run_server, daemon=True).start()
+    for _ in range(100):
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=0.1).close()
+            break
+        except OSError:
+            time.sleep(0.1)
+
+    # Journal des diffusions (émissions sans destinataire) par type d'événement ;
+    # l'émetteur est celui du mode choisi, installé au démarrage du serveur
+    emitted = {event: [] for event in EVENTS}
+    broadcaster = discord_bot.socketio_instance
+    original_emit = broadcaster.emit
+
+    def recording_emit(event, *args, **kwargs):
+        if event in emitted and kwargs.get('to') is None and kwargs.get('room') is None:
+            emitted[event].append(time.time())
+        return original_emit(event, *args, **kwargs)
+
+    broadcaster.emit = recording_emit
+    return sim, emitted
+
+
+async def drive(sim, duration, rate, stats_interval, health_interval):
+    """Génère les changements vocaux et les diffusions périodiques"""
+    import discord_bot
+    import web_server
+
+    mix = {'join': 1, 'move': 1, 'mute': 2, 'stream': 1, 'webcam': 1}
+    sim.set_event_rates({kind: weight * rate / sum(mix.values()) for kind, weight in mix.items()})
+
+    start = time.monotonic()
+    next_stats = start + stats_interval
+    next_health = start + health_interval
+    while time.monotonic() - start < duration:
+        for event in sim.due_events():
+            await discord_bot.dispatch_simulated_event(event)
+        now = time.monotonic()
+        if now >= next_stats:
+            web_server.broadcast_stats()
+            next_stats += stats_interval
+        if now >= next_health:
+            discord_bot.broadcast_health()
+            next_health += health_interval
+        await asyncio.sleep(0.005)
+
+
+def summarize(emitted, worker_results, clients, subscription):
+    from subscriptions import FEED_EVENTS, SCOPED_FEEDS, is_scoped, parse_subscription
+
+    subscription = parse_subscription(subscription)
+    report = {}
+    for event in EVENTS:
+        emits = emitted[event]
+        feed = FEED_EVENTS[event]
+        # Flux limité à des salons : messages partiels, non appariables aux diffusions
+        partial = feed in SCOPED_FEEDS and is_scoped(subscription)
+        latencies = []
+        received = 0
+        for result in worker_results:
+            for receipts in result['receipts']:
+                times = receipts[event]
+                received += len(times)
+                if not partial:
+                    latencies.extend(t - e for t, e in zip(times, emits))
+        latencies.sort()
+        if feed not in subscription['feeds']:
+            expected = 0
+        else:
+            expected = None if partial else len(emits) * clients
+
+        def pct(p):
+            return latencies[int((len(latencies) - 1) * p / 100)] * 1000 if latencies else None
+
+        report[event] = {
+            'emitted': len(emits),
+            'expected_deliveries': expected,
+            'received': received,
+            'dropped': max(0, expected - received) if expected is not None else None,
+            'bytes_per_client': sum(result['event_bytes'][event] for result in worker_results) / clients if clients else 0,
+            'latency_p50_ms': pct(50),
+            'latency_p90_ms': pct(90),
+            'latency_p99_ms': pct(99),
+            'latency_max_ms': latencies[-1] * 1000 if latencies else None
+        }
+    return report
+
+
+def slow_report(slow_results, emitted, subscription, delivery_peak, delivery_after_drain):
+    """Messages reçus par les clients lents et état final (conflation)"""
+    import discord_bot
+    from subscriptions import voice_view, parse_subscription
+
+    receipts = [r for result in slow_results for r in result['receipts']]
+    last_voice = [v for result in slow_results for v in result['last_voice']]
+    final = json.loads(json.dumps(voice_view(parse_subscription(subscription), discord_bot.get_voice_data())))
+    return {
+        'count': len(receipts),
+        'received_per_client': {event: sum(len(r[event]) for r in receipts) / len(receipts) if receipts else 0
+                                for event in EVENTS},
+        'emitted': {event: len(emitted[event]) for event in EVENTS},
+        # Dernier voice_update reçu = état final du bot
+        'up_to_date': sum(1 for voice in last_voice if voice == final),
+        # Métriques serveur (web.delivery de /api/status) en fin de génération et après le drain
+        'delivery_at_end_of_load': delivery_peak,
+        'delivery_after_drain': delivery_after_drain
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--mode', choices=('werkzeug', 'asgi', 'single_loop'), default='werkzeug',
+                        help='WEB_SERVER_MODE testé')
+    parser.add_argument('--profile', choices=PROFILES, default='all',
+                        help='Abonnement des clients (subscriptions.py)')
+    parser.add_argument('--clients', type=int, default=500)
+    parser.add_argument('--slow-clients', type=int, default=0,
+                        help='Clients lents en plus (petit tampon, lecture espacée)')
+    parser.add_argument('--slow-delay', type=float, default=0.5, help='Délai entre deux lectures (s)')
+    parser.add_argument('--workers', type=int, default=max(1, min(8, (os.cpu_count() or 2) // 2)))
+    parser.add_argument('--members', type=int, default=100, help='Membres simulés')
+    parser.add_argument('--duration', type=float, default=10, help='Durée de la mesure (s)')
+    parser.add_argument('--rate', type=float, default=10, help='Changements vocaux par seconde')
+    parser.add_argument('--stats-interval', type=float, default=2)
+    parser.add_argument('--health-interval', type=float, default=2)
+    parser.add_argument('--drain', type=float, default=3, help='Attente des derniers messages (s)')
+    parser.add_argument('--output', help='Écrit le rapport JSON dans ce fichier')
+    args = parser.parse_args()
+
+    raise_nofile_limit()
+    from health_monitor import current_rss_bytes, health_monitor
+
+    port = free_port()
+    rss_start = current_rss_bytes()
+    sim, emitted = start_server(port, args.members, args.mode)
+    rss_idle = current_rss_bytes()
+    subscription = subscription_profile(args.profile, sim)
+
+    ctx = multiprocessing.get_context('spawn')
+    ready_queue, result_queue = ctx.Queue(), ctx.Queue()
+    control_queues = []
+    workers = []
+    per_worker = [args.clients // args.workers + (1 if i < args.clients % args.workers else 0)
+                  for i in range(args.workers)]
+
+    connect_start = time.perf_counter()
+    for count in per_worker:
+        control_queue = ctx.Queue()
+        worker = ctx.Process(target=client_worker,
+                             args=(f'http://127.0.0.1:{port}', count, subscription,
+                                   ready_queue, control_queue, result_queue))
+        worker.start()
+        workers.append(worker)
+        control_queues.append(control_queue)
+    slow_control_queue = None
+    if args.slow_clients:
+        slow_control_queue = ctx.Queue()
+        worker = ctx.Process(target=slow_client_worker,
+                             args=(f'http://127.0.0.1:{port}', args.slow_clients, subscription, args.slow_delay,
+                                   ready_queue, slow_control_queue, result_queue))
+        worker.start()
+        workers.append(worker)
+        control_queues.append(slow_control_queue)
+
+    connected = failed = 0
+    for _ in workers:
+        ready = ready_queue.get()
+        connected += ready['connected']
+        failed += ready['failed']
+    connect_time = time.perf_counter() - connect_start
+    time.sleep(0.5)
+    rss_connected = current_rss_bytes()
+
+    start = time.time()
+    cpu_start = time.process_time()
+    for control_queue in control_queues:
+        control_queue.put(start)
+
+    driver = drive(sim, args.duration, args.rate, args.stats_interval, args.health_interval)
+    if args.mode == 'single_loop':
+        import asgi_server
+        asyncio.run_coroutine_threadsafe(driver, asgi_server.emitter.loop).result()
+    else:
+        asyncio.run(driver)
+    delivery_peak = health_monitor.get_status()['web']['delivery']
+    if slow_control_queue:
+        slow_control_queue.put('drain')
+    time.sleep(args.drain)
+    server_cpu = time.process_time() - cpu_start
+
+    delivery_after_drain = health_monitor.get_status()['web']['delivery']
+    for control_queue in control_queues:
+        control_queue.put('stop')
+    worker_results = [result_queue.get() for _ in workers]
+    for worker in workers:
+        worker.join(timeout=10)
+    slow_results = [result for result in worker_results if result.get('slow')]
+    worker_results = [result for result in worker_results if not result.get('slow')]
+    connected -= args.slow_clients
+
+    for event in EVENTS:
+        emitted[event] = [t for t in emitted[event] if t >= start]
+
+    total_bytes = sum(sum(result['bytes']) for result in worker_results)
+    events = summarize(emitted, worker_results, connected, subscription)
+    delivered = sum(event['received'] for event in events.values())
+    report = {
+        'mode': args.mode,
+        'profile': args.profile,
+        'clients': {'requested': args.clients, 'connected': connected, 'failed': failed,
+                    'connect_time_s': connect_time},
+        'memory': {
+            'server_rss_start_bytes': rss_start,
+            'server_rss_idle_bytes': rss_idle,
+            'server_rss_connected_bytes': rss_connected,
+            'bytes_per_connection': (rss_connected - rss_idle) / connected if connected and rss_connected else None
+        },
+        'payload_bytes_per_client': total_bytes / connected if connected else 0,
+        # Temps CPU du processus serveur (pilote compris) pendant la mesure
+        'server_cpu': {
+            'seconds': server_cpu,
+            'us_per_delivery': server_cpu / delivered * 1e6 if delivered else None
+        },
+        'events': events
+    }
+    if args.slow_clients:
+        report['slow_clients'] = slow_report(slow_results, emitted, subscription, delivery_peak, delivery_after_drain)
+
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+    os._exit(0)
+
+
+if __name__ == '__main__':
+    main()
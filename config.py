@@ -9,7 +9,115 @@ VOICE_CHANNEL_IDS = [
 FLASK_HOST = '0.0.0.0'
 FLASK_PORT = 5000
 SECRET_KEY = 'discord-voice-monitor-secret'
+# Serveur web : 'werkzeug' (serveur de développement, un thread par websocket),
+# 'asgi' (Socket.IO asynchrone servi par uvicorn, recommandé en production),
+# 'single_loop' (comme asgi, mais sur la boucle asyncio du bot),
+# ou 'workers' (bot et serveurs web dans des processus séparés, reliés par un bus)
+WEB_SERVER_MODE = 'werkzeug'
+# Modes uvicorn (asgi, single_loop, workers) : threads exécutant les routes Flask
+WEB_HTTP_THREADS = 8
+# Modes uvicorn (asgi, single_loop, workers) : keep-alive HTTP et délai accordé aux connexions à l'arrêt (secondes)
+WEB_KEEPALIVE_TIMEOUT = 5
+WEB_GRACEFUL_TIMEOUT = 10
+# Ping Socket.IO (secondes) : détection des clients disparus
+SOCKETIO_PING_INTERVAL = 25
+SOCKETIO_PING_TIMEOUT = 20
+# Client lent : au-delà de SOCKETIO_MAX_BACKLOG paquets en attente d'envoi, ses
+# diffusions sont mises en file (dernière valeur seulement pour voice_update,
+# stats_update et health_status ; SOCKETIO_MAX_QUEUED_LOGS logs au plus)
+SOCKETIO_MAX_BACKLOG = 8
+SOCKETIO_MAX_QUEUED_LOGS = 50
+# Encodage binaire (subscribe: {encoding: 'deflate'}) : voice_update et stats_update
+# envoyés en JSON compressé une fois par diffusion (False = JSON pour tous)
+SOCKETIO_BINARY_ENCODING = True
+SOCKETIO_COMPRESSION_LEVEL = 6
+# Modes uvicorn : négociation de permessage-deflate avec les navigateurs
+# (compression par connexion, le mode werkzeug la négocie toujours)
+SOCKETIO_PER_MESSAGE_DEFLATE = True
+# Mode 'workers' : WEB_WORKERS processus web sans état, alimentés par le bus de
+# messages du bot (broker intégré au processus du bot, ou : python message_bus.py broker)
+WEB_WORKERS = 2
+BUS_ADDRESS = ('127.0.0.1', 5001)
+# Clé du bus (les messages sont dépicklés : elle protège le bot). None = clé aléatoire
+# générée par main.py et transmise à ses workers ; obligatoire (octets secrets) pour
+# lancer le broker ou des workers séparément
+BUS_AUTHKEY = None
 DATABASE_PATH = 'voice_stats.db'
+# Intervalle d'enregistrement du dernier instant où le bot tournait (secondes) : fin
+# des sessions récupérées au redémarrage dont le membre est parti pendant l'arrêt
+SESSION_ALIVE_INTERVAL = 60
 # Mode test (True = données fictives, False = vraies données Discord)
 
 TEST_MODE = False
+
+# Simulateur du mode test : serveurs, salons par serveur, membres
+SIM_GUILDS = 1
+SIM_CHANNELS = 3
+SIM_MEMBERS = 12
+# Taux d'événements (par seconde) ; les départs découlent des durées de session
+SIM_EVENT_RATES = {
+    'join': 0.05,
+    'move': 0.02,
+    'mute': 0.05,
+    'deafen': 0.02,
+    'server_mute': 0.005,
+    'stream': 0.01,
+    'webcam': 0.01,
+    'status': 0.02
+}
+# Durée moyenne d'une session (secondes, loi log-normale)
+SIM_MEAN_SESSION = 1800
+# Accélération du temps des sessions (60 = une heure simulée par minute)
+SIM_TIME_SCALE = 1.0
+SIM_SEED = None
+
+# Journal des événements gateway pour rejeu (None = désactivé)
+# ex: 'gateway_journal.jsonl.gz', puis : python gateway_journal.py replay gateway_journal.jsonl.gz
+JOURNAL_PATH = None
+
+# Mode gateway "lean" : sans intents members/presences, discord.py ne garde en cache
+# que les membres présents en vocal (statut/activités indisponibles)
+LEAN_GATEWAY_MODE = False
+# Durée de vie (secondes) des profils récupérés à la demande en mode lean
+PROFILE_CACHE_TTL = 60
+
+# Traces des chemins critiques : fraction des événements/requêtes tracés (0 = désactivé)
+# et durée (ms) au-delà de laquelle une trace est gardée pour /admin/traces
+TRACE_SAMPLE_RATE = 0.05
+TRACE_SLOW_MS = 50
+# Requêtes SQLite de StatsTracker journalisées au-delà de SQL_SLOW_MS (ms)
+SQL_SLOW_MS = 20
+# Jeton des routes /admin/ (en-tête Authorization: Bearer <jeton> ou ?token=) ;
+# None = routes désactivées
+ADMIN_TOKEN = None
+# Profilage à la demande (/admin/profile, /admin/memory) : intervalle d'échantillonnage
+# par défaut (ms), durée maximale (s), profondeur des piles tracemalloc
+PROFILE_INTERVAL_MS = 5
+PROFILE_MAX_SECONDS = 60
+TRACEMALLOC_FRAMES = 10
+# Historique de santé (/api/status/history) : un échantillon par HEALTH_SAMPLE_INTERVAL
+# secondes, gardé par palier : {nom: (secondes par point, nombre de points)}
+HEALTH_SAMPLE_INTERVAL = 1
+HEALTH_HISTORY_TIERS = {
+    '1s': (1, 3600),       # 1 heure
+    '1m': (60, 1440),      # 24 heures
+    '1h': (3600, 720)      # 30 jours
+}
+# Occupation des salons (/api/stats/occupancy) : {palier: (secondes par point, nombre
+# de points ; None = sans limite)}, sauvegardée toutes les OCCUPANCY_SAVE_INTERVAL secondes
+OCCUPANCY_TIERS = {
+    '10s': (10, 8640),     # 24 heures
+    '5m': (300, 8640),     # 30 jours
+    '1h': (3600, None)     # sans limite
+}
+OCCUPANCY_SAVE_INTERVAL = 300
+# Cartes de chaleur jour x heure (/api/stats/heatmap) : période par défaut (jours)
+# et nombre de périodes gardées en cache
+HEATMAP_DEFAULT_DAYS = 28
+HEATMAP_CACHE_SIZE = 64
+# Distribution des durées (/api/stats/durations) : période par défaut (jours)
+DURATION_STATS_DEFAULT_DAYS = 30
+# Historique d'un membre (/api/stats/member/<nom>) : période par défaut (jours)
+# et sessions par page (?limit= jusqu'à 500)
+MEMBER_HISTORY_DEFAULT_DAYS = 30
+MEMBER_SESSIONS_PAGE_SIZE = 50
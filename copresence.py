@@ -0,0 +1,123 @@
+# -*- coding: utf-8 -*-
+"""
+Temps passé ensemble en vocal : recouvrement par paire de membres et par salon
+
+Deux passages (segments) dans le même salon se recouvrent sur
+min(fins) - max(débuts). Plutôt que de comparer toutes les paires de
+sessions (O(n²)), sweep_overlaps() balaie les segments de chaque salon par
+début croissant en gardant un tas des fins des segments encore ouverts :
+O(n log n + paires qui se recouvrent).
+
+En fonctionnement, StatsTracker compte chaque paire une seule fois, quand le
+second des deux segments est enregistré : RecentSegments garde, par salon,
+les segments déjà enregistrés qu'un segment pas encore écrit peut encore
+recouvrir (ceux qui finissent après l'arrivée de la plus ancienne session
+en cours).
+"""
+
+import heapq
+import math
+from bisect import bisect_right, insort
+from collections import defaultdict
+from xml.sax.saxutils import escape, quoteattr
+
+def pair_key(member, other, channel):
+    """Clé d'une paire, membres dans l'ordre (une seule ligne par paire et par salon)"""
+    return (member, other, channel) if member < other else (other, member, channel)
+
+def sweep_overlaps(segments):
+    """
+    Recouvrements de segments [(membre, salon, début, fin)]
+
+    Returns:
+        {(membre a, membre b, salon): secondes ensemble}, avec a < b
+    """
+    # Membres numérotés : la boucle interne additionne sous une clé entière
+    by_channel = defaultdict(list)
+    codes = {}
+    for member, channel, start, end in segments:
+        if end > start:
+            by_channel[channel].append((start, end, codes.setdefault(member, len(codes))))
+    names = list(codes)
+    size = len(names)
+
+    overlaps = {}
+    for channel, items in by_channel.items():
+        items.sort()
+        pairs = defaultdict(float)
+        open_segments = []     # tas (fin, membre) des segments commencés et pas encore finis
+        for start, end, member in items:
+            while open_segments and open_segments[0][0] <= start:
+                heapq.heappop(open_segments)
+            # Chaque segment ouvert a commencé avant celui-ci : recouvrement depuis `start`
+            for other_end, other in open_segments:
+                if other != member:
+                    key = member * size + other if member < other else other * size + member
+                    pairs[key] += (end if end < other_end else other_end) - start
+            heapq.heappush(open_segments, (end, member))
+        for key, seconds in pairs.items():
+            overlaps[pair_key(names[key // size], names[key % size], channel)] = seconds
+    return overlaps
+
+class RecentSegments:
+    """Segments enregistrés qui peuvent encore recouvrir un segment à venir, par salon, triés par fin"""
+
+    def __init__(self):
+        self.channels = defaultdict(list)   # salon -> [(fin, début, membre)]
+
+    def insert(self, segments):
+        """Ajoute des segments déjà comptés (rechargement au démarrage)"""
+        for member, channel, start, end in segments:
+            if end > start:
+                insort(self.channels[channel], (end, start, member))
+
+    def add(self, segments):
+        """
+        Compte les recouvrements des nouveaux segments [(membre, salon, début, fin)]
+        avec ceux déjà enregistrés, puis les ajoute
+
+        Returns:
+            {(membre a, membre b, salon): secondes}
+        """
+        overlaps = defaultdict(float)
+        for member, channel, start, end in segments:
+            if end <= start:
+                continue
+            recent = self.channels[channel]
+            # Seuls les segments finis après `start` peuvent recouvrir celui-ci
+            for other_end, other_start, other in recent[bisect_right(recent, (start, math.inf)):]:
+                overlap = min(end, other_end) - max(start, other_start)
+                if overlap > 0 and other != member:
+                    overlaps[pair_key(member, other, channel)] += overlap
+            insort(recent, (end, start, member))
+        return overlaps
+
+    def prune(self, horizon):
+        """Oublie les segments finis avant `horizon` : aucun segment à venir ne commence avant"""
+        for channel in list(self.channels):
+            recent = self.channels[channel]
+            del recent[:bisect_right(recent, (horizon, math.inf))]
+            if not recent:
+                del self.channels[channel]
+
+    def __len__(self):
+        return sum(len(recent) for recent in self.channels.values())
+
+def to_graphml(graph):
+    """Graphe {'nodes': [...], 'edges': [...]} au format GraphML (Gephi, yEd, networkx)"""
+    lines = [
+        '<?xml version="1.0" encoding="UTF-8"?>',
+        '<graphml xmlns="http://graphml.graphdrawing.org/xmlns">',
+        '  <key id="total_seconds" for="node" attr.name="total_seconds" attr.type="double"/>',
+        '  <key id="seconds" for="edge" attr.name="seconds" attr.type="double"/>',
+        '  <graph id="copresence" edgedefault="undirected">'
+    ]
+    for node in graph['nodes']:
+        lines.append(f'    <node id={quoteattr(node["id"])}>'
+                     f'<data key="total_seconds">{node["total_seconds"]}</data></node>')
+    for edge in graph['edges']:
+        lines.append(f'    <edge source={quoteattr(edge["source"])} target={quoteattr(edge["target"])}>'
+                     f'<data key="seconds">{escape(str(edge["seconds"]))}</data></edge>')
+    lines.append('  </graph>')
+    lines.append('</graphml>')
+    return '\n'.join(lines) + '\n'
@@ -1,31 +1,123 @@
 # -*- coding: utf-8 -*-
 import discord
 import asyncio
-import copy
+import time
+from datetime import datetime
 from discord.ext import commands, tasks
-from config import DISCORD_TOKEN, VOICE_CHANNEL_IDS, TEST_MODE
-from test_data import get_test_data
+from config import DISCORD_TOKEN, VOICE_CHANNEL_IDS, TEST_MODE, LEAN_GATEWAY_MODE, PROFILE_CACHE_TTL, JOURNAL_PATH
+import test_data
 from health_monitor import health_monitor
 from activity_logger import activity_logger
 from stats_tracker import stats_tracker
+from occupancy import occupancy
+from gateway_journal import JournalRecorder
+from metrics import metrics, timed
+from tracing import tracer, traced
 
-intents = discord.Intents.default()
-intents.guilds = True
-intents.voice_states = True
-intents.members = True
-intents.presences = True
+def build_gateway_settings(lean=LEAN_GATEWAY_MODE):
+    """
+    Retourne les intents et le cache membres selon le mode gateway
+    
+    En mode lean, les intents members/presences sont désactivés et seuls
+    les membres en vocal sont gardés en cache.
+    """
+    intents = discord.Intents.default()
+    intents.guilds = True
+    intents.voice_states = True
+    
+    if lean:
+        intents.members = False
+        intents.presences = False
+        member_cache_flags = discord.MemberCacheFlags.none()
+        member_cache_flags.voice = True
+    else:
+        intents.members = True
+        intents.presences = True
+        member_cache_flags = discord.MemberCacheFlags.from_intents(intents)
+    
+    return intents, member_cache_flags
+
+intents, member_cache_flags = build_gateway_settings()
+
+bot = commands.Bot(
+    command_prefix="!",
+    intents=intents,
+    member_cache_flags=member_cache_flags,
+    chunk_guilds_at_startup=not LEAN_GATEWAY_MODE
+)
 
-bot = commands.Bot(command_prefix="!", intents=intents)
+# Salons suivis (ensemble pour un test d'appartenance en O(1))
+tracked_channel_ids = set(VOICE_CHANNEL_IDS)
+
+# Source des données en mode test (simulateur ou rejeu d'un journal)
+simulator = test_data.simulator
+
+def use_simulator(sim):
+    """Remplace la source de données du mode test"""
+    global simulator
+    simulator = sim
+    tracked_channel_ids.update(sim.channel_ids)
+
+# Enregistreur du journal gateway (rejeu hors ligne), si activé ; ouvert par
+# open_journal() au lancement du bot seulement (ni au rejeu, ni dans les workers web)
+journal_recorder = None
+
+def open_journal():
+    """Ouvre le journal gateway si JOURNAL_PATH est configuré (processus du bot)"""
+    global journal_recorder
+    if JOURNAL_PATH and journal_recorder is None:
+        journal_recorder = JournalRecorder(JOURNAL_PATH, tracked_channel_ids, lambda m: member_status(m))
+
+# Profils récupérés via l'API REST en mode lean : {member_id: (expiration, membre)}
+profile_cache = {}
 
 voice_data = {}
-previous_voice_data = {}
+# voice_data, sa version (incrémentée à chaque remplacement) et sa date,
+# remplacés d'un bloc : (version, horodatage ISO, données)
+voice_snapshot = (0, None, voice_data)
+
+# État vocal de chaque membre encodé en masque de bits : {salon: {membre: masque}}
+voice_flags = {}
+previous_voice_flags = {}
+
+FLAG_MUTED = 1 << 0
+FLAG_DEAFENED = 1 << 1
+FLAG_SERVER_MUTED = 1 << 2
+FLAG_SERVER_DEAFENED = 1 << 3
+FLAG_STREAM = 1 << 4
+FLAG_WEBCAM = 1 << 5
+
+VOICE_FLAGS = (
+    ('muted', FLAG_MUTED),
+    ('deafened', FLAG_DEAFENED),
+    ('server_muted', FLAG_SERVER_MUTED),
+    ('server_deafened', FLAG_SERVER_DEAFENED),
+    ('stream', FLAG_STREAM),
+    ('webcam', FLAG_WEBCAM)
+)
+
+# Table de dispatch des transitions : (bit, état, log activation, log désactivation)
+FLAG_TRANSITIONS = (
+    (FLAG_MUTED, 'muted', activity_logger.log_mute, activity_logger.log_unmute),
+    (FLAG_DEAFENED, 'deafened', activity_logger.log_deafen, activity_logger.log_undeafen),
+    (FLAG_SERVER_MUTED, 'server_muted', activity_logger.log_server_mute, activity_logger.log_server_unmute),
+    (FLAG_STREAM, 'stream', activity_logger.log_stream_start, activity_logger.log_stream_stop),
+    (FLAG_WEBCAM, 'webcam', activity_logger.log_webcam_on, activity_logger.log_webcam_off)
+)
 
 socketio_instance = None
 
+TRACK_CHANGES_SECONDS = metrics.histogram('bot_track_voice_changes_seconds',
+                                          'Durée de track_voice_changes (détection et log des changements)')
+GATEWAY_TO_BROADCAST_SECONDS = metrics.histogram('bot_gateway_to_broadcast_seconds',
+                                                 'Délai entre un événement gateway et la diffusion de voice_update',
+                                                 ('event',))
+
 def set_socketio(socketio):
     global socketio_instance
     socketio_instance = socketio
 
+@traced()
 def broadcast_update():
     """Envoie les données mises à jour à tous les clients connectés"""
     if socketio_instance:
@@ -36,151 +128,112 @@ def broadcast_update():
             health_monitor.bot_error(f"Broadcast error: {e}")
             print(f"❌ Erreur broadcast: {e}")
 
+def voice_flags_of(member):
+    """Encode l'état vocal d'un membre (dict) en masque de bits"""
+    mask = 0
+    for key, bit in VOICE_FLAGS:
+        if member.get(key, False):
+            mask |= bit
+    return mask
+
+def build_voice_flags(data):
+    """Construit {salon: {membre: masque}} à partir de voice_data"""
+    return {
+        channel_name: {m['name']: voice_flags_of(m) for m in channel['members']}
+        for channel_name, channel in data.items()
+    }
+
+def active_states(mask):
+    """Liste des états actifs d'un masque"""
+    return [key for key, bit in VOICE_FLAGS if mask & bit]
+
+def emit_log(log):
+    """Diffuse une entrée du journal d'activité aux clients"""
+    if socketio_instance:
+        socketio_instance.emit('activity_log', log)
+
+@traced()
+@timed(TRACK_CHANGES_SECONDS)
 def track_voice_changes():
     """Compare l'état actuel avec l'état précédent et log tous les changements"""
-    global previous_voice_data, voice_data
-    
-    # Crée un set des membres actuels par salon
-    current_state = {}
-    for channel_name, data in voice_data.items():
-        current_state[channel_name] = {}
-        for m in data['members']:
-            current_state[channel_name][m['name']] = {
-                'muted': m.get('muted', False),
-                'deafened': m.get('deafened', False),
-                'server_muted': m.get('server_muted', False),
-                'server_deafened': m.get('server_deafened', False),
-                'stream': m.get('stream', False),
-                'webcam': m.get('webcam', False)
-            }
+    global previous_voice_flags
     
-    # Crée un set des membres précédents par salon
-    previous_state = {}
-    for channel_name, data in previous_voice_data.items():
-        previous_state[channel_name] = {}
-        for m in data['members']:
-            previous_state[channel_name][m['name']] = {
-                'muted': m.get('muted', False),
-                'deafened': m.get('deafened', False),
-                'server_muted': m.get('server_muted', False),
-                'server_deafened': m.get('server_deafened', False),
-                'stream': m.get('stream', False),
-                'webcam': m.get('webcam', False)
-            }
+    current_state = voice_flags
+    previous_state = previous_voice_flags
+    
+    # Index membre -> salon pour détecter les déplacements
+    current_location = {member: channel for channel, members in current_state.items() for member in members}
+    previous_location = {member: channel for channel, members in previous_state.items() for member in members}
     
     # Détecte les changements
     all_channels = set(current_state.keys()) | set(previous_state.keys())
     
     for channel_name in all_channels:
-        current_members = set(current_state.get(channel_name, {}).keys())
-        previous_members = set(previous_state.get(channel_name, {}).keys())
+        current_members = current_state.get(channel_name, {})
+        previous_members = previous_state.get(channel_name, {})
         
         # Nouveaux membres (rejoints)
-        joined = current_members - previous_members
-        for member in joined:
+        for member in current_members.keys() - previous_members.keys():
             # Vérifie s'il vient d'un autre salon (move)
-            came_from = None
-            for other_channel, other_members in previous_state.items():
-                if member in other_members and other_channel != channel_name:
-                    came_from = other_channel
-                    break
+            came_from = previous_location.get(member)
+            states = active_states(current_members[member])
             
             if came_from:
                 log = activity_logger.log_move(member, came_from, channel_name)
-                stats_tracker.member_moved(member, came_from, channel_name)  # ← AJOUT
+                stats_tracker.member_moved(member, came_from, channel_name, states)
             else:
                 log = activity_logger.log_join(member, channel_name)
-                stats_tracker.member_joined(member, channel_name)  # ← AJOUT
+                stats_tracker.member_joined(member, channel_name, states)
             
-            if socketio_instance:
-                socketio_instance.emit('activity_log', log)
+            emit_log(log)
         
-        # Membres partis
-        left = previous_members - current_members
-        for member in left:
-            # Vérifie s'il est allé dans un autre salon
-            went_to = None
-            for other_channel, other_members in current_state.items():
-                if member in other_members and other_channel != channel_name:
-                    went_to = other_channel
-                    break
-            
-            # Si pas de déplacement, c'est une vraie déconnexion
-            if not went_to:
+        # Membres partis (sans déplacement = vraie déconnexion)
+        for member in previous_members.keys() - current_members.keys():
+            if member not in current_location:
                 log = activity_logger.log_leave(member, channel_name)
-                stats_tracker.member_left(member)  # ← AJOUT
-                if socketio_instance:
-                    socketio_instance.emit('activity_log', log)
+                stats_tracker.member_left(member)
+                emit_log(log)
         
-        # Membres qui sont restés dans le même salon - vérifier les changements d'état
-        staying = current_members & previous_members
-        for member in staying:
-            prev = previous_state[channel_name][member]
-            curr = current_state[channel_name][member]
-            
-            # Mute/Unmute
-            if not prev['muted'] and curr['muted']:
-                log = activity_logger.log_mute(member, channel_name)
-                if socketio_instance:
-                    socketio_instance.emit('activity_log', log)
-            elif prev['muted'] and not curr['muted']:
-                log = activity_logger.log_unmute(member, channel_name)
-                if socketio_instance:
-                    socketio_instance.emit('activity_log', log)
+        # Membres restés dans le même salon : un XOR suffit à trouver les bits modifiés
+        for member, curr in current_members.items():
+            prev = previous_members.get(member)
+            if prev is None or prev == curr:
+                continue
             
-            # Deafen/Undeafen
-            if not prev['deafened'] and curr['deafened']:
-                log = activity_logger.log_deafen(member, channel_name)
-                if socketio_instance:
-                    socketio_instance.emit('activity_log', log)
-            elif prev['deafened'] and not curr['deafened']:
-                log = activity_logger.log_undeafen(member, channel_name)
-                if socketio_instance:
-                    socketio_instance.emit('activity_log', log)
-            
-            # Server Mute/Unmute
-            if not prev['server_muted'] and curr['server_muted']:
-                log = activity_logger.log_server_mute(member, channel_name)
-                if socketio_instance:
-                    socketio_instance.emit('activity_log', log)
-            elif prev['server_muted'] and not curr['server_muted']:
-                log = activity_logger.log_server_unmute(member, channel_name)
-                if socketio_instance:
-                    socketio_instance.emit('activity_log', log)
-            
-            # Stream Start/Stop
-            if not prev['stream'] and curr['stream']:
-                log = activity_logger.log_stream_start(member, channel_name)
-                if socketio_instance:
-                    socketio_instance.emit('activity_log', log)
-            elif prev['stream'] and not curr['stream']:
-                log = activity_logger.log_stream_stop(member, channel_name)
-                if socketio_instance:
-                    socketio_instance.emit('activity_log', log)
-            
-            # Webcam On/Off
-            if not prev['webcam'] and curr['webcam']:
-                log = activity_logger.log_webcam_on(member, channel_name)
-                if socketio_instance:
-                    socketio_instance.emit('activity_log', log)
-            elif prev['webcam'] and not curr['webcam']:
-                log = activity_logger.log_webcam_off(member, channel_name)
-                if socketio_instance:
-                    socketio_instance.emit('activity_log', log)
+            changed = prev ^ curr
+            for bit, state, log_on, log_off in FLAG_TRANSITIONS:
+                if changed & bit:
+                    active = bool(curr & bit)
+                    log = log_on(member, channel_name) if active else log_off(member, channel_name)
+                    stats_tracker.member_state_changed(member, state, active)
+                    emit_log(log)
     
     # Sauvegarde l'état actuel pour la prochaine comparaison
-    previous_voice_data = copy.deepcopy(voice_data)
+    previous_voice_flags = current_state
+    
+    # Première synchronisation faite : sessions récupérées reprises ou abandonnées
+    stats_tracker.end_recovery()
 
+def publish_voice_data(data, flags_by_channel, track=True):
+    """Publie d'un bloc le nouvel état des salons (nouvelle version de voice_data)"""
+    global voice_flags
+    set_voice_data(data)
+    voice_flags = flags_by_channel
+    if track:
+        track_voice_changes()
+        occupancy.record({name: channel['count'] for name, channel in data.items()})
+
+@traced()
 def update_voice_data():
     """Met à jour les données des salons vocaux"""
-    global voice_data
-    voice_data = {}
+    data = {}
+    flags_by_channel = {}
     
     try:
         if TEST_MODE:
-            voice_data = get_test_data()
-            health_monitor.bot_update(1)
-            track_voice_changes()
+            data = simulator.snapshot()
+            health_monitor.bot_update(len({ch['guild_id'] for ch in simulator.channels}))
+            publish_voice_data(data, build_voice_flags(data))
             return
         
         guild_count = 0
@@ -190,30 +243,100 @@ def update_voice_data():
                 channel = guild.get_channel(channel_id)
                 if channel and isinstance(channel, discord.VoiceChannel):
                     members = []
+                    flags = {}
                     for m in channel.members:
                         voice_state = m.voice
-                        members.append({
+                        member = {
                             "name": m.display_name,
                             "avatar": str(m.display_avatar.url),
-                            "status": str(m.status),
+                            "status": member_status(m),
                             "webcam": voice_state.self_video if voice_state else False,
                             "stream": voice_state.self_stream if voice_state else False,
                             "muted": voice_state.self_mute if voice_state else False,
                             "deafened": voice_state.self_deaf if voice_state else False,
                             "server_muted": voice_state.mute if voice_state else False,
                             "server_deafened": voice_state.deaf if voice_state else False
-                        })
-                    voice_data[channel.name] = {
+                        }
+                        members.append(member)
+                        flags[member["name"]] = voice_flags_of(member)
+                    data[channel.name] = {
                         "members": members,
-                        "count": len(members)
+                        "count": len(members),
+                        "guild_id": str(guild.id)
                     }
+                    flags_by_channel[channel.name] = flags
         
         health_monitor.bot_update(guild_count)
-        track_voice_changes()
+        publish_voice_data(data, flags_by_channel)
         
     except Exception as e:
         health_monitor.bot_error(f"Update error: {e}")
         print(f"❌ Erreur mise à jour: {e}")
+        # État partiel publié, sans détection des changements
+        publish_voice_data(data, flags_by_channel, track=False)
+
+def member_status(member):
+    """Statut du membre ('unknown' en mode lean, faute de presences)"""
+    if LEAN_GATEWAY_MODE:
+        return 'unknown'
+    return str(member.status)
+
+def get_cached_profile(guild, member):
+    """
+    En mode lean, rafraîchit le profil d'un membre via l'API REST (cache court)
+    
+    Doit être appelé hors de la boucle du bot (thread Flask) ; renvoie le
+    membre du cache vocal si la récupération est impossible.
+    """
+    if not LEAN_GATEWAY_MODE:
+        return member
+    
+    cached = profile_cache.get(member.id)
+    if cached and cached[0] > time.monotonic():
+        return cached[1]
+    
+    try:
+        loop = bot.loop
+        try:
+            if asyncio.get_running_loop() is loop:
+                return member
+        except RuntimeError:
+            pass
+        future = asyncio.run_coroutine_threadsafe(fetch_profile(guild, member), loop)
+        return future.result(timeout=5)
+    except Exception as e:
+        print(f"⚠️ Profil indisponible pour {member.display_name}: {e}")
+        return member
+
+async def fetch_profile(guild, member):
+    """Version asynchrone de get_cached_profile, sur la boucle du bot"""
+    if not LEAN_GATEWAY_MODE:
+        return member
+    
+    now = time.monotonic()
+    cached = profile_cache.get(member.id)
+    if cached and cached[0] > now:
+        return cached[1]
+    
+    try:
+        fetched = await asyncio.wait_for(guild.fetch_member(member.id), timeout=5)
+    except Exception as e:
+        print(f"⚠️ Profil indisponible pour {member.display_name}: {e}")
+        return member
+    
+    profile_cache[member.id] = (now + PROFILE_CACHE_TTL, fetched)
+    return fetched
+
+def find_voice_member(member_name):
+    """Retourne (serveur, salon, membre) d'un membre en vocal, ou None"""
+    for guild in bot.guilds:
+        for channel_id in VOICE_CHANNEL_IDS:
+            channel = guild.get_channel(channel_id)
+            if channel and isinstance(channel, discord.VoiceChannel):
+                for member in channel.members:
+                    if member.display_name.lower() == member_name.lower() or member.name.lower() == member_name.lower():
+                        return guild, channel, member
+    return None
 
 def get_member_full_info(member_name):
     """
@@ -225,155 +348,174 @@ def get_member_full_info(member_name):
     Returns:
         dict avec toutes les infos du membre ou None si non trouvé
     """
+    found = find_voice_member(member_name)
+    if not found:
+        return None
+    guild, channel, member = found
+    voice_state = member.voice
+    return build_member_info(guild, channel, get_cached_profile(guild, member), voice_state)
+
+async def fetch_member_full_info(member_name):
+    """Version asynchrone de get_member_full_info, sur la boucle du bot"""
+    found = find_voice_member(member_name)
+    if not found:
+        return None
+    guild, channel, member = found
+    voice_state = member.voice
+    return build_member_info(guild, channel, await fetch_profile(guild, member), voice_state)
+
+def build_member_info(guild, channel, member, voice_state):
+    """Profil complet d'un membre (voice_state lu avant un éventuel rafraîchissement REST)"""
+    presence_known = not LEAN_GATEWAY_MODE
+    
+    # Informations du profil
+    member_info = {
+        # Identité
+        'id': str(member.id),
+        'username': member.name,
+        'discriminator': member.discriminator,
+        'display_name': member.display_name,
+        'nick': member.nick,
+        'mention': member.mention,
+    
+        # Avatars et bannière
+        'avatar_url': str(member.display_avatar.url),
+        'avatar_url_static': str(member.display_avatar.with_static_format('png').url),
+        'default_avatar_url': str(member.default_avatar.url),
+        'guild_avatar_url': str(member.guild_avatar.url) if member.guild_avatar else None,
+    
+        # Statut et activité
+        'status': member_status(member),
+        'raw_status': str(member.raw_status) if presence_known else 'unknown',
+        'mobile_status': str(member.mobile_status) if presence_known else 'unknown',
+        'desktop_status': str(member.desktop_status) if presence_known else 'unknown',
+        'web_status': str(member.web_status) if presence_known else 'unknown',
+    
+        # Activités en cours
+        'activities': [],
+        'custom_activity': None,
+        'spotify': None,
+    
+        # État vocal
+        'voice': {
+            'channel': channel.name,
+            'channel_id': str(channel.id),
+            'muted': voice_state.self_mute if voice_state else False,
+            'deafened': voice_state.self_deaf if voice_state else False,
+            'server_muted': voice_state.mute if voice_state else False,
+            'server_deafened': voice_state.deaf if voice_state else False,
+            'streaming': voice_state.self_stream if voice_state else False,
+            'video': voice_state.self_video if voice_state else False,
+            'suppress': voice_state.suppress if voice_state else False,
+            'requested_to_speak_at': voice_state.requested_to_speak_at.isoformat() if voice_state and voice_state.requested_to_speak_at else None
+        },
+    
+        # Rôles
+        'roles': [
+            {
+                'id': str(role.id),
+                'name': role.name,
+                'color': str(role.color),
+                'position': role.position,
+                'hoist': role.hoist,
+                'mentionable': role.mentionable
+            }
+            for role in member.roles if role.name != "@everyone"
+        ],
+        'top_role': {
+            'name': member.top_role.name,
+            'color': str(member.top_role.color),
+            'position': member.top_role.position
+        },
+        'color': str(member.color),
+    
+        # Dates importantes
+        'created_at': member.created_at.isoformat(),
+        'joined_at': member.joined_at.isoformat() if member.joined_at else None,
+        'premium_since': member.premium_since.isoformat() if member.premium_since else None,
+    
+        # Badges et flags
+        'public_flags': [flag.name for flag in member.public_flags.all()],
+        'is_bot': member.bot,
+        'is_system': member.system,
+    
+        # Permissions
+        'guild_permissions': {
+            'administrator': member.guild_permissions.administrator,
+            'manage_guild': member.guild_permissions.manage_guild,
+            'manage_roles': member.guild_permissions.manage_roles,
+            'manage_channels': member.guild_permissions.manage_channels,
+            'kick_members': member.guild_permissions.kick_members,
+            'ban_members': member.guild_permissions.ban_members,
+            'manage_messages': member.guild_permissions.manage_messages,
+            'mention_everyone': member.guild_permissions.mention_everyone,
+            'view_audit_log': member.guild_permissions.view_audit_log,
+        },
+    
+        # Serveur
+        'guild': {
+            'id': str(guild.id),
+            'name': guild.name,
+            'icon_url': str(guild.icon.url) if guild.icon else None
+        }
+    }
+    
+    # Activités détaillées
+    for activity in member.activities:
+        if isinstance(activity, discord.Spotify):
+            member_info['spotify'] = {
+                'title': activity.title,
+                'artist': activity.artist,
+                'album': activity.album,
+                'album_cover_url': activity.album_cover_url,
+                'track_url': activity.track_url,
+                'duration': activity.duration.total_seconds() if activity.duration else None,
+                'start': activity.start.isoformat() if activity.start else None,
+                'end': activity.end.isoformat() if activity.end else None
+            }
+        elif isinstance(activity, discord.CustomActivity):
+            member_info['custom_activity'] = {
+                'name': activity.name,
+                'emoji': str(activity.emoji) if activity.emoji else None,
+                'state': activity.state
+            }
+        elif isinstance(activity, discord.Game):
+            member_info['activities'].append({
+                'type': 'game',
+                'name': activity.name,
+                'details': getattr(activity, 'details', None),
+                'state': getattr(activity, 'state', None)
+            })
+        elif isinstance(activity, discord.Streaming):
+            member_info['activities'].append({
+                'type': 'streaming',
+                'name': activity.name,
+                'url': activity.url,
+                'details': getattr(activity, 'details', None),
+                'platform': activity.platform if hasattr(activity, 'platform') else None
+            })
+        else:
+            member_info['activities'].append({
+                'type': str(activity.type).split('.')[-1].lower(),
+                'name': activity.name
+            })
+    
+    return member_info
+
+def tracked_channels():
+    """Salons vocaux suivis, tous serveurs confondus"""
     for guild in bot.guilds:
         for channel_id in VOICE_CHANNEL_IDS:
             channel = guild.get_channel(channel_id)
             if channel and isinstance(channel, discord.VoiceChannel):
-                for member in channel.members:
-                    if member.display_name.lower() == member_name.lower() or member.name.lower() == member_name.lower():
-                        # Informations de base
-                        voice_state = member.voice
-                        
-                        # Informations du profil
-                        member_info = {
-                            # Identité
-                            'id': str(member.id),
-                            'username': member.name,
-                            'discriminator': member.discriminator,
-                            'display_name': member.display_name,
-                            'nick': member.nick,
-                            'mention': member.mention,
-                            
-                            # Avatars et bannière
-                            'avatar_url': str(member.display_avatar.url),
-                            'avatar_url_static': str(member.display_avatar.with_static_format('png').url),
-                            'default_avatar_url': str(member.default_avatar.url),
-                            'guild_avatar_url': str(member.guild_avatar.url) if member.guild_avatar else None,
-                            
-                            # Statut et activité
-                            'status': str(member.status),
-                            'raw_status': str(member.raw_status),
-                            'mobile_status': str(member.mobile_status),
-                            'desktop_status': str(member.desktop_status),
-                            'web_status': str(member.web_status),
-                            
-                            # Activités en cours
-                            'activities': [],
-                            'custom_activity': None,
-                            'spotify': None,
-                            
-                            # État vocal
-                            'voice': {
-                                'channel': channel.name,
-                                'channel_id': str(channel.id),
-                                'muted': voice_state.self_mute if voice_state else False,
-                                'deafened': voice_state.self_deaf if voice_state else False,
-                                'server_muted': voice_state.mute if voice_state else False,
-                                'server_deafened': voice_state.deaf if voice_state else False,
-                                'streaming': voice_state.self_stream if voice_state else False,
-                                'video': voice_state.self_video if voice_state else False,
-                                'suppress': voice_state.suppress if voice_state else False,
-                                'requested_to_speak_at': voice_state.requested_to_speak_at.isoformat() if voice_state and voice_state.requested_to_speak_at else None
-                            },
-                            
-                            # Rôles
-                            'roles': [
-                                {
-                                    'id': str(role.id),
-                                    'name': role.name,
-                                    'color': str(role.color),
-                                    'position': role.position,
-                                    'hoist': role.hoist,
-                                    'mentionable': role.mentionable
-                                }
-                                for role in member.roles if role.name != "@everyone"
-                            ],
-                            'top_role': {
-                                'name': member.top_role.name,
-                                'color': str(member.top_role.color),
-                                'position': member.top_role.position
-                            },
-                            'color': str(member.color),
-                            
-                            # Dates importantes
-                            'created_at': member.created_at.isoformat(),
-                            'joined_at': member.joined_at.isoformat() if member.joined_at else None,
-                            'premium_since': member.premium_since.isoformat() if member.premium_since else None,
-                            
-                            # Badges et flags
-                            'public_flags': [flag.name for flag in member.public_flags.all()],
-                            'is_bot': member.bot,
-                            'is_system': member.system,
-                            
-                            # Permissions
-                            'guild_permissions': {
-                                'administrator': member.guild_permissions.administrator,
-                                'manage_guild': member.guild_permissions.manage_guild,
-                                'manage_roles': member.guild_permissions.manage_roles,
-                                'manage_channels': member.guild_permissions.manage_channels,
-                                'kick_members': member.guild_permissions.kick_members,
-                                'ban_members': member.guild_permissions.ban_members,
-                                'manage_messages': member.guild_permissions.manage_messages,
-                                'mention_everyone': member.guild_permissions.mention_everyone,
-                                'view_audit_log': member.guild_permissions.view_audit_log,
-                            },
-                            
-                            # Serveur
-                            'guild': {
-                                'id': str(guild.id),
-                                'name': guild.name,
-                                'icon_url': str(guild.icon.url) if guild.icon else None
-                            }
-                        }
-                        
-                        # Activités détaillées
-                        for activity in member.activities:
-                            if isinstance(activity, discord.Spotify):
-                                member_info['spotify'] = {
-                                    'title': activity.title,
-                                    'artist': activity.artist,
-                                    'album': activity.album,
-                                    'album_cover_url': activity.album_cover_url,
-                                    'track_url': activity.track_url,
-                                    'duration': activity.duration.total_seconds() if activity.duration else None,
-                                    'start': activity.start.isoformat() if activity.start else None,
-                                    'end': activity.end.isoformat() if activity.end else None
-                                }
-                            elif isinstance(activity, discord.CustomActivity):
-                                member_info['custom_activity'] = {
-                                    'name': activity.name,
-                                    'emoji': str(activity.emoji) if activity.emoji else None,
-                                    'state': activity.state
-                                }
-                            elif isinstance(activity, discord.Game):
-                                member_info['activities'].append({
-                                    'type': 'game',
-                                    'name': activity.name,
-                                    'details': getattr(activity, 'details', None),
-                                    'state': getattr(activity, 'state', None)
-                                })
-                            elif isinstance(activity, discord.Streaming):
-                                member_info['activities'].append({
-                                    'type': 'streaming',
-                                    'name': activity.name,
-                                    'url': activity.url,
-                                    'details': getattr(activity, 'details', None),
-                                    'platform': activity.platform if hasattr(activity, 'platform') else None
-                                })
-                            else:
-                                member_info['activities'].append({
-                                    'type': str(activity.type).split('.')[-1].lower(),
-                                    'name': activity.name
-                                })
-                        
-                        return member_info
-    
-    return None
+                yield channel
 
 @bot.event
 async def on_ready():
     print(f"✅ Bot connecté en tant que {bot.user}")
     health_monitor.bot_heartbeat()
+    if journal_recorder:
+        journal_recorder.record_snapshot(tracked_channels())
     update_voice_data()
     broadcast_update()
     
@@ -383,14 +525,42 @@ async def on_ready():
 @bot.event
 async def on_voice_state_update(member, before, after):
     """Mise à jour automatique lors des changements vocaux"""
-    update_voice_data()
-    broadcast_update()
+    received = time.perf_counter()
+    with tracer.span('gateway voice_state_update', member=member.display_name):
+        if journal_recorder:
+            with tracer.span('journal'):
+                journal_recorder.record_voice(member, before, after)
+        update_voice_data()
+        broadcast_update()
+    GATEWAY_TO_BROADCAST_SECONDS.observe(time.perf_counter() - received, 'voice_state_update')
 
-@tasks.loop(seconds=10)
+@bot.event
+async def on_socket_event_type(event_type):
+    """Compte les événements gateway reçus (comparaison des modes de cache)"""
+    health_monitor.gateway_event(event_type)
+
+HEARTBEAT_INTERVAL = 10
+# Horaire (time.monotonic) de la prochaine exécution de heartbeat_task
+heartbeat_due = None
+
+@tasks.loop(seconds=HEARTBEAT_INTERVAL)
 async def heartbeat_task():
     """Envoie un heartbeat toutes les 10 secondes"""
-    health_monitor.bot_heartbeat()
-    
+    global heartbeat_due
+    # Retard sur l'horaire : la boucle asyncio a été bloquée (tasks.loop ne cumule pas la dérive)
+    now = time.monotonic()
+    if heartbeat_due is not None:
+        health_monitor.bot_heartbeat_lag(max(0.0, now - heartbeat_due))
+    heartbeat_due = (heartbeat_due or now) + HEARTBEAT_INTERVAL
+    with tracer.span('heartbeat'):
+        health_monitor.bot_heartbeat()
+        stats_tracker.check_day_rollover()
+        stats_tracker.save_alive_if_due()
+        occupancy.save_if_due()
+        broadcast_health()
+
+def broadcast_health():
+    """Diffuse le statut de santé à tous les clients"""
     if socketio_instance:
         try:
             status = health_monitor.get_status()
@@ -402,9 +572,15 @@ async def heartbeat_task():
 async def on_presence_update(before, after):
     """Mise à jour automatique lors des changements de statut"""
     if after.voice and after.voice.channel:
-        if after.voice.channel.id in VOICE_CHANNEL_IDS:
-            update_voice_data()
-            broadcast_update()
+        if after.voice.channel.id in tracked_channel_ids:
+            received = time.perf_counter()
+            with tracer.span('gateway presence_update', member=after.display_name):
+                if journal_recorder:
+                    with tracer.span('journal'):
+                        journal_recorder.record_presence(after)
+                update_voice_data()
+                broadcast_update()
+            GATEWAY_TO_BROADCAST_SECONDS.observe(time.perf_counter() - received, 'presence_update')
 
 @bot.event
 async def on_error(event, *args, **kwargs):
@@ -417,9 +593,84 @@ async def on_error(event, *args, **kwargs):
 def get_voice_data():
     return voice_data
 
+def get_voice_snapshot():
+    """(version, horodatage ISO, voice_data) cohérents entre eux"""
+    return voice_snapshot
+
+def memory_structures():
+    """
+    Structures mesurées par /admin/memory : ({nom: fonction renvoyant l'objet},
+    objets partagés à ne pas parcourir)
+    """
+    state = bot._connection
+    structures = {
+        'voice_data': get_voice_data,
+        'ActivityLogger.logs': lambda: activity_logger.logs,
+        # Cache de discord.py : serveurs (membres, salons, rôles), utilisateurs, messages
+        'discord.py cache': lambda: (state._guilds, dict(state._users), state._messages)
+    }
+    # Pas de StatsTracker dans un worker web (il n'en construit pas)
+    if stats_tracker.lazy_created():
+        structures['StatsTracker.active_sessions'] = lambda: stats_tracker.active_sessions
+    return structures, (bot, state, bot.http)
+
+def set_voice_data(data):
+    """Remplace voice_data (nouvelle version) ; dans un worker web, copie reçue du bus"""
+    global voice_data, voice_snapshot
+    voice_snapshot = (voice_snapshot[0] + 1, datetime.now().isoformat(), data)
+    voice_data = data
+
+async def dispatch_simulated_event(event):
+    """Fait passer un événement du simulateur par les handlers gateway"""
+    member, before, after = simulator.gateway_args(event)
+    if event['kind'] == 'presence':
+        await on_presence_update(member, member)
+    else:
+        await on_voice_state_update(member, before, after)
+
+async def run_simulation(tick=0.01):
+    """Mode test : rejoue en continu les événements du simulateur, hors ligne"""
+    use_simulator(simulator)
+    simulator.populate()
+    
+    print("🧪 Mode test : simulateur démarré")
+    health_monitor.bot_heartbeat()
+    update_voice_data()
+    broadcast_update()
+    heartbeat_task.start()
+    
+    while True:
+        for event in simulator.due_events():
+            try:
+                await dispatch_simulated_event(event)
+            except Exception as e:
+                health_monitor.bot_error(f"Simulation error: {e}")
+                print(f"❌ Erreur simulation: {e}")
+        await asyncio.sleep(tick)
+
 def run_bot():
+    open_journal()
+    if TEST_MODE:
+        asyncio.run(run_simulation())
+        return
+    
     try:
         bot.run(DISCORD_TOKEN)
+    except Exception as e:
+        health_monitor.bot_error(f"Bot crash: {e}")
+        print(f"❌ Bot crashed: {e}")
+
+async def start_bot():
+    """Équivalent de run_bot sur la boucle courante (mode single_loop)"""
+    open_journal()
+    if TEST_MODE:
+        await run_simulation()
+        return
+    
+    discord.utils.setup_logging()
+    try:
+        async with bot:
+            await bot.start(DISCORD_TOKEN)
     except Exception as e:
         health_monitor.bot_error(f"Bot crash: {e}")
         print(f"❌ Bot crashed: {e}")
\ No newline at end of file
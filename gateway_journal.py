@@ -0,0 +1,309 @@
+# -*- coding: utf-8 -*-
+"""
+Journal des événements gateway (enregistrement + rejeu déterministe)
+
+Le bot peut enregistrer les entrées de on_voice_state_update et
+on_presence_update dans un journal compact (JSON lines gzip). Le rejeu
+renvoie ce journal dans les mêmes handlers, à vitesse réelle, accélérée ou
+maximale, avec une horloge simulée : les résultats de StatsTracker sont
+identiques d'un rejeu à l'autre. Il produit un rapport de latence par
+événement.
+
+Usage :
+    python gateway_journal.py replay journal.jsonl.gz --speed max
+    python gateway_journal.py replay journal.jsonl.gz --speed 10 --stats
+"""
+
+import argparse
+import asyncio
+import atexit
+import gzip
+import json
+import os
+import tempfile
+import time
+from datetime import datetime, timedelta
+from threading import Lock
+
+JOURNAL_VERSION = 1
+
+# Attributs de VoiceState, dans l'ordre des bits de discord_bot.VOICE_FLAGS
+VOICE_STATE_ATTRS = ('self_mute', 'self_deaf', 'mute', 'deaf', 'self_stream', 'self_video')
+FLAG_KEYS = ('muted', 'deafened', 'server_muted', 'server_deafened', 'stream', 'webcam')
+
+class JournalRecorder:
+    """
+    Enregistre les événements gateway reçus par le bot
+
+    Format (une ligne JSON par entrée, temps en ms depuis l'en-tête) :
+        {"version": 1, "started_at": "..."}                 en-tête
+        ["s", t, [[membre..., salon...], ...]]              état initial
+        ["v", t, membre..., salon avant..., salon après...]  on_voice_state_update
+        ["p", t, membre..., salon...]                       on_presence_update
+    avec membre = id, nom, avatar, statut, serveur
+    et salon = id, nom, masque d'états vocaux.
+    """
+
+    def __init__(self, path, tracked_channel_ids, status_of=lambda member: str(member.status), flush_every=100):
+        self.lock = Lock()
+        self.tracked_channel_ids = tracked_channel_ids
+        self.status_of = status_of
+        self.flush_every = flush_every
+        self.pending = 0
+        self.start = time.monotonic()
+        self.file = gzip.open(path, 'at', encoding='utf-8')
+        self._write({'version': JOURNAL_VERSION, 'started_at': datetime.now().isoformat()})
+        atexit.register(self.close)
+
+    def _elapsed_ms(self):
+        return round((time.monotonic() - self.start) * 1000, 3)
+
+    def _write(self, entry):
+        with self.lock:
+            if self.file is None:
+                return
+            self.file.write(json.dumps(entry, separators=(',', ':'), ensure_ascii=False) + '\n')
+            self.pending += 1
+            if self.pending >= self.flush_every:
+                self.file.flush()
+                self.pending = 0
+
+    def _member(self, member):
+        guild = getattr(member, 'guild', None)
+        return [member.id, member.display_name, str(member.display_avatar.url),
+                self.status_of(member), guild.id if guild else None]
+
+    def _voice(self, state):
+        """(id, nom, masque) du salon, ou vide si hors des salons suivis"""
+        if state is None or state.channel is None or state.channel.id not in self.tracked_channel_ids:
+            return [None, None, 0]
+        mask = 0
+        for bit, attr in enumerate(VOICE_STATE_ATTRS):
+            if getattr(state, attr, False):
+                mask |= 1 << bit
+        return [state.channel.id, state.channel.name, mask]
+
+    def record_snapshot(self, channels):
+        """Enregistre les membres présents dans les salons suivis"""
+        members = [self._member(m) + self._voice(m.voice) for channel in channels for m in channel.members]
+        self._write(['s', self._elapsed_ms(), members])
+
+    def record_voice(self, member, before, after):
+        self._write(['v', self._elapsed_ms()] + self._member(member) + self._voice(before) + self._voice(after))
+
+    def record_presence(self, member):
+        self._write(['p', self._elapsed_ms()] + self._member(member) + self._voice(member.voice))
+
+    def close(self):
+        with self.lock:
+            if self.file is not None:
+                self.file.close()
+                self.file = None
+
+def read_journal(path):
+    """Itère sur (datetime absolue, entrée) ; gère plusieurs segments concaténés"""
+    started_at = None
+    with gzip.open(path, 'rt', encoding='utf-8') as f:
+        for line in f:
+            entry = json.loads(line)
+            if isinstance(entry, dict):
+                started_at = datetime.fromisoformat(entry['started_at'])
+                continue
+            yield started_at + timedelta(milliseconds=entry[1]), entry
+
+class FakeClock:
+    """Horloge pilotée par le rejeu (datetime et secondes monotones)"""
+
+    def __init__(self, current=None):
+        self.current = current or datetime(2000, 1, 1)
+        self.epoch = self.current
+
+    def now(self):
+        return self.current
+
+    def monotonic(self):
+        return (self.current - self.epoch).total_seconds()
+
+def _apply_flags(world, index, mask):
+    data = world.members[index]['data']
+    for bit, key in enumerate(FLAG_KEYS):
+        data[key] = bool(mask & (1 << bit))
+
+def _place(world, index, channel_id):
+    """Amène le membre dans le salon (join/move/leave selon sa position)"""
+    current = world.location.get(index)
+    if channel_id is None:
+        if current is not None:
+            world.leave(index)
+    elif current is None:
+        world.join(index, channel_id)
+    elif current != channel_id:
+        world.move(index, channel_id)
+
+def apply_entry(world, entry):
+    """Applique une entrée du journal au monde simulé, retourne l'événement à dispatcher"""
+    kind = entry[0]
+
+    if kind == 's':
+        present = set()
+        for member_id, name, avatar, status, guild_id, channel_id, channel_name, mask in entry[2]:
+            index = world.ensure_member(member_id, name, avatar, status, guild_id)
+            if channel_id is None:
+                continue
+            world.ensure_channel(channel_id, channel_name, guild_id)
+            _apply_flags(world, index, mask)
+            _place(world, index, channel_id)
+            present.add(index)
+        for index in list(world.location):
+            if index not in present:
+                world.leave(index)
+        return {'kind': 'snapshot'}
+
+    member_id, name, avatar, status, guild_id = entry[2:7]
+    index = world.ensure_member(member_id, name, avatar, status, guild_id)
+
+    if kind == 'v':
+        before_id, before_name, _ = entry[7:10]
+        after_id, after_name, after_mask = entry[10:13]
+        for channel_id, channel_name in ((before_id, before_name), (after_id, after_name)):
+            if channel_id is not None:
+                world.ensure_channel(channel_id, channel_name, guild_id)
+        _apply_flags(world, index, after_mask)
+        _place(world, index, after_id)
+        return {'kind': 'voice', 'member': index, 'before': before_id, 'after': after_id}
+
+    channel_id, channel_name, _ = entry[7:10]
+    if channel_id is not None:
+        world.ensure_channel(channel_id, channel_name, guild_id)
+    return {'kind': 'presence', 'member': index, 'before': None, 'after': world.location.get(index)}
+
+def percentile(sorted_values, p):
+    """Percentile (interpolation linéaire) d'une liste triée"""
+    if not sorted_values:
+        return 0
+    k = (len(sorted_values) - 1) * p / 100
+    low = int(k)
+    high = min(low + 1, len(sorted_values) - 1)
+    return sorted_values[low] + (sorted_values[high] - sorted_values[low]) * (k - low)
+
+def latency_report(latencies):
+    """Percentiles de latence (ms) par type d'événement"""
+    report = {}
+    for kind, values in latencies.items():
+        if not values:
+            continue
+        values = sorted(values)
+        report[kind] = {
+            'count': len(values),
+            'mean_ms': sum(values) / len(values) * 1000,
+            'p50_ms': percentile(values, 50) * 1000,
+            'p90_ms': percentile(values, 90) * 1000,
+            'p99_ms': percentile(values, 99) * 1000,
+            'max_ms': values[-1] * 1000
+        }
+    return report
+
+async def replay(path, speed=None):
+    """
+    Rejoue un journal dans les handlers du bot
+
+    Args:
+        path: Fichier journal
+        speed: Facteur de vitesse (1 = temps réel), None = vitesse maximale
+
+    Returns:
+        dict avec le rapport de latence par type d'événement
+    """
+    import discord_bot
+    from test_data import VoiceSimulator
+    from stats_tracker import stats_tracker
+    from activity_logger import activity_logger
+
+    clock = FakeClock()
+    world = VoiceSimulator(guilds=0, channels=0, members=0, clock=clock.monotonic)
+    discord_bot.TEST_MODE = True
+    discord_bot.use_simulator(world)
+    stats_tracker.clock = clock.now
+    discord_bot.occupancy.clock = clock.now
+    activity_logger.clock = clock.now
+
+    latencies = {'snapshot': [], 'voice': [], 'presence': []}
+    first_at = None
+    wall_start = time.perf_counter()
+
+    for at, entry in read_journal(path):
+        if first_at is None:
+            first_at = at
+            clock.current = clock.epoch = at
+            stats_tracker.current_day = at.date()
+
+        if speed:
+            delay = (at - first_at).total_seconds() / speed - (time.perf_counter() - wall_start)
+            if delay > 0:
+                await asyncio.sleep(delay)
+
+        clock.current = at
+        event = apply_entry(world, entry)
+        discord_bot.tracked_channel_ids.update(world.channel_ids)
+
+        start = time.perf_counter()
+        if event['kind'] == 'snapshot':
+            discord_bot.update_voice_data()
+            discord_bot.broadcast_update()
+        elif event['kind'] == 'voice':
+            await discord_bot.on_voice_state_update(*world.gateway_args(event))
+        else:
+            member, _, _ = world.gateway_args(event)
+            await discord_bot.on_presence_update(member, member)
+        latencies[event['kind']].append(time.perf_counter() - start)
+
+        stats_tracker.check_day_rollover()
+
+    return {
+        'journal': path,
+        'speed': speed or 'max',
+        'events': sum(len(values) for values in latencies.values()),
+        'journal_span_s': (clock.current - first_at).total_seconds() if first_at else 0,
+        'wall_time_s': time.perf_counter() - wall_start,
+        'latency': latency_report(latencies)
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    replay_parser = subparsers.add_parser('replay', help='Rejoue un journal')
+    replay_parser.add_argument('journal')
+    replay_parser.add_argument('--speed', default='max', help="Facteur de vitesse (1, 10...) ou 'max'")
+    replay_parser.add_argument('--db', help='Base SQLite du rejeu (temporaire par défaut)')
+    replay_parser.add_argument('--overwrite', action='store_true', help='Remplace la base --db si elle existe')
+    replay_parser.add_argument('--stats', action='store_true', help='Affiche les stats calculées à la fin')
+    args = parser.parse_args()
+
+    # La base doit être choisie avant l'import de stats_tracker
+    import config
+    if args.db:
+        # Jamais de suppression implicite : --db peut désigner la base de production
+        if os.path.exists(args.db):
+            if not args.overwrite:
+                parser.error(f'{args.db} existe déjà (--overwrite pour la remplacer)')
+            os.remove(args.db)
+        db_path = args.db
+    else:
+        db_path = os.path.join(tempfile.mkdtemp(), 'replay.db')
+    config.DATABASE_PATH = db_path
+
+    speed = None if args.speed == 'max' else float(args.speed)
+    report = asyncio.run(replay(args.journal, speed))
+
+    if args.stats:
+        from stats_tracker import stats_tracker
+        report['stats'] = {
+            'daily': stats_tracker.get_daily_stats(),
+            'current_sessions': stats_tracker.get_current_sessions(),
+            'records': stats_tracker.get_records()
+        }
+
+    print(json.dumps(report, indent=2, ensure_ascii=False))
+
+if __name__ == '__main__':
+    main()
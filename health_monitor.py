@@ -1,7 +1,30 @@
 
+import math
+import os
+import threading
 import time
+from array import array
 from datetime import datetime
 from threading import Lock
+from config import LEAN_GATEWAY_MODE, HEALTH_SAMPLE_INTERVAL, HEALTH_HISTORY_TIERS
+from metrics import metrics
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+def current_rss_bytes():
+    """Mémoire résidente du processus (None si indisponible)"""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, AttributeError):
+        pass
+    if resource:
+        # ru_maxrss : pic de mémoire, en Ko sous Linux
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+    return None
 
 class HealthMonitor:
     """Monitore la santé de l'application"""
@@ -14,13 +37,22 @@ class HealthMonitor:
             'last_update': None,
             'guild_count': 0,
             'error_count': 0,
-            'last_error': None
+            'last_error': None,
+            'heartbeat_lag': None
         }
         self.web_status = {
-            'connected_clients': 0,
-            'last_request': None,
-            'total_requests': 0
+            'connected_clients': 0
+        }
+        # Compté sans le verrou global (compteur fragmenté, voir metrics.py)
+        self.web_requests = metrics.counter('web_requests_total', 'Requêtes comptées par /api/status (pages et API)')
+        self.last_request = None
+        self.gateway_status = {
+            'mode': 'lean' if LEAN_GATEWAY_MODE else 'full',
+            'events_total': 0,
+            'events_by_type': {}
         }
+        self.remote_status = None
+        self.delivery_status = {}
         self.start_time = datetime.now()
     
     def bot_heartbeat(self):
@@ -29,6 +61,11 @@ class HealthMonitor:
             self.bot_status['last_heartbeat'] = datetime.now()
             self.bot_status['connected'] = True
     
+    def bot_heartbeat_lag(self, lag):
+        """Retard (secondes) de heartbeat_task sur son horaire : boucle asyncio surchargée"""
+        with self.lock:
+            self.bot_status['heartbeat_lag'] = lag
+    
     def bot_update(self, guild_count):
         """Appelé quand le bot met à jour les données"""
         with self.lock:
@@ -44,11 +81,31 @@ class HealthMonitor:
                 'timestamp': datetime.now()
             }
     
+    def gateway_event(self, event_type):
+        """Compte un événement reçu de la gateway Discord"""
+        with self.lock:
+            self.gateway_status['events_total'] += 1
+            by_type = self.gateway_status['events_by_type']
+            by_type[event_type] = by_type.get(event_type, 0) + 1
+    
     def web_request(self):
-        """Enregistre une requête web"""
+        """Enregistre une requête web (sans verrou global)"""
+        self.web_requests.inc()
+        self.last_request = datetime.now()
+    
+    def set_remote_status(self, status):
+        """Worker web : reprend l'état du bot et de la gateway publié sur le bus"""
+        with self.lock:
+            self.remote_status = {
+                'bot': status['bot'],
+                'gateway': status['gateway'],
+                'received': datetime.now()
+            }
+    
+    def set_delivery_status(self, status):
+        """Files d'envoi Socket.IO (clients lents, conflation), voir subscriptions.RoomEmitter"""
         with self.lock:
-            self.web_status['last_request'] = datetime.now()
-            self.web_status['total_requests'] += 1
+            self.delivery_status = status
     
     def client_connected(self):
         """Incrémente le nombre de clients connectés"""
@@ -72,25 +129,233 @@ class HealthMonitor:
             
             uptime = now - self.start_time
             
+            bot = {
+                'alive': bot_alive,
+                'connected': self.bot_status['connected'],
+                'last_heartbeat': self.bot_status['last_heartbeat'].isoformat() if self.bot_status['last_heartbeat'] else None,
+                'last_update': self.bot_status['last_update'].isoformat() if self.bot_status['last_update'] else None,
+                'guild_count': self.bot_status['guild_count'],
+                'error_count': self.bot_status['error_count'],
+                'last_error': self.bot_status['last_error'],
+                'heartbeat_lag_seconds': self.bot_status['heartbeat_lag']
+            }
+            gateway = {
+                'mode': self.gateway_status['mode'],
+                'events_total': self.gateway_status['events_total'],
+                'events_per_second': self.gateway_status['events_total'] / max(uptime.total_seconds(), 1),
+                'events_by_type': dict(self.gateway_status['events_by_type'])
+            }
+            
+            # Worker web : état publié par le bot (10 s entre deux publications)
+            if self.remote_status:
+                received = (now - self.remote_status['received']).total_seconds()
+                bot_alive = self.remote_status['bot']['alive'] and received < 30
+                bot = dict(self.remote_status['bot'], alive=bot_alive)
+                gateway = self.remote_status['gateway']
+            
             return {
                 'status': 'healthy' if bot_alive else 'degraded',
                 'uptime_seconds': uptime.total_seconds(),
-                'bot': {
-                    'alive': bot_alive,
-                    'connected': self.bot_status['connected'],
-                    'last_heartbeat': self.bot_status['last_heartbeat'].isoformat() if self.bot_status['last_heartbeat'] else None,
-                    'last_update': self.bot_status['last_update'].isoformat() if self.bot_status['last_update'] else None,
-                    'guild_count': self.bot_status['guild_count'],
-                    'error_count': self.bot_status['error_count'],
-                    'last_error': self.bot_status['last_error']
-                },
+                'bot': bot,
                 'web': {
                     'connected_clients': self.web_status['connected_clients'],
-                    'total_requests': self.web_status['total_requests'],
-                    'last_request': self.web_status['last_request'].isoformat() if self.web_status['last_request'] else None
+                    'total_requests': self.web_requests.total(),
+                    'last_request': self.last_request.isoformat() if self.last_request else None,
+                    'delivery': self.delivery_status
+                },
+                'gateway': gateway,
+                'process': {
+                    'rss_bytes': current_rss_bytes()
                 },
                 'timestamp': now.isoformat()
             }
 
-# Instance globale
-health_monitor = HealthMonitor()
\ No newline at end of file
+    def history_snapshot(self):
+        """Compteurs et jauges relevés à chaque échantillon de l'historique"""
+        with self.lock:
+            bot = self.bot_status
+            events_total = self.gateway_status['events_total']
+            if self.remote_status:
+                # Worker web : valeurs du bot publiées sur le bus
+                bot = {'heartbeat_lag': self.remote_status['bot'].get('heartbeat_lag_seconds'),
+                       'error_count': self.remote_status['bot']['error_count']}
+                events_total = self.remote_status['gateway']['events_total']
+            delivery = self.delivery_status
+            return {
+                'heartbeat_lag': bot['heartbeat_lag'],
+                'events_total': events_total,
+                'errors_total': bot['error_count'],
+                'requests_total': self.web_requests.total(),
+                'connected_clients': self.web_status['connected_clients'],
+                'slow_clients': delivery.get('slow_clients', 0),
+                'max_backlog': delivery.get('max_backlog', 0),
+                'queued': delivery.get('queued_logs', 0) + delivery.get('queued_snapshots', 0)
+            }
+    
+    def metrics_snapshot(self):
+        """Valeurs lues par les jauges de /metrics"""
+        with self.lock:
+            return {
+                'connected_clients': self.web_status['connected_clients'],
+                'bot_errors': self.bot_status['error_count'],
+                'guilds': self.bot_status['guild_count'],
+                'gateway_events': dict(self.gateway_status['events_by_type']),
+                'slow_clients': self.delivery_status.get('slow_clients', 0)
+            }
+
+# ============================================
+# HISTORIQUE (/api/status/history)
+# ============================================
+
+# Champs de l'historique et agrégation dans un créneau de plusieurs échantillons
+HISTORY_FIELDS = (
+    ('heartbeat_lag_seconds', 'max'),
+    ('gateway_events_per_second', 'mean'),
+    ('bot_errors_per_second', 'mean'),
+    ('web_requests_per_second', 'mean'),
+    ('connected_clients', 'max'),
+    ('db_query_ms', 'mean'),
+    ('slow_clients', 'max'),
+    ('socketio_max_backlog', 'max'),
+    ('socketio_queued', 'max'),
+    ('rss_bytes', 'max')
+)
+
+class HistoryTier:
+    """
+    Série circulaire de taille fixe : `capacity` créneaux de `step` secondes,
+    un tableau de flottants par champ (NaN = pas de valeur). Le créneau le
+    plus ancien est réutilisé quand le temps avance.
+    """
+
+    def __init__(self, step, capacity, fields=HISTORY_FIELDS):
+        self.step = step
+        self.capacity = capacity
+        self.fields = fields
+        self.buckets = array('d', [0.0]) * capacity     # début du créneau (epoch), 0 = vide
+        self.values = {name: array('d', [math.nan]) * capacity for name, _ in fields}
+        self.counts = {name: array('I', [0]) * capacity for name, _ in fields}
+
+    def add(self, timestamp, sample):
+        bucket = timestamp - timestamp % self.step
+        slot = int(bucket // self.step) % self.capacity
+        if self.buckets[slot] != bucket:
+            self.buckets[slot] = bucket
+            for name, _ in self.fields:
+                self.values[name][slot] = math.nan
+                self.counts[name][slot] = 0
+        for name, aggregate in self.fields:
+            value = sample.get(name)
+            if value is None:
+                continue
+            values, counts = self.values[name], self.counts[name]
+            count = counts[slot] + 1
+            counts[slot] = count
+            if count == 1:
+                values[slot] = value
+            elif aggregate == 'max':
+                values[slot] = max(values[slot], value)
+            else:
+                values[slot] += (value - values[slot]) / count
+
+    def series(self, now, limit=None):
+        """(horodatages, {champ: valeurs}) des créneaux remplis, du plus ancien au plus récent"""
+        newest = now - now % self.step
+        slots = []
+        for age in range(min(limit or self.capacity, self.capacity)):
+            bucket = newest - age * self.step
+            slot = int(bucket // self.step) % self.capacity
+            if self.buckets[slot] == bucket:
+                slots.append(slot)
+        slots.reverse()
+        timestamps = [datetime.fromtimestamp(self.buckets[slot]).isoformat() for slot in slots]
+        series = {name: [None if math.isnan(self.values[name][slot]) else self.values[name][slot] for slot in slots]
+                  for name, _ in self.fields}
+        return timestamps, series
+
+class HealthHistory:
+    """
+    Historique de santé en mémoire fixe : un échantillon toutes les
+    HEALTH_SAMPLE_INTERVAL secondes, ajouté à chaque palier de HEALTH_HISTORY_TIERS
+    """
+
+    def __init__(self, monitor, tiers=HEALTH_HISTORY_TIERS, interval=HEALTH_SAMPLE_INTERVAL):
+        self.lock = Lock()
+        self.monitor = monitor
+        self.interval = interval
+        self.tiers = {name: HistoryTier(step, capacity) for name, (step, capacity) in tiers.items()}
+        self.previous = None
+        self.thread = None
+
+    def start(self):
+        """Démarre l'échantillonnage (un thread par processus, appels suivants ignorés)"""
+        with self.lock:
+            if self.thread is not None:
+                return
+            self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def _run(self):
+        while True:
+            try:
+                self.sample()
+            except Exception as e:
+                print(f"❌ Erreur historique santé: {e}")
+            time.sleep(self.interval)
+
+    def sample(self, now=None):
+        """Relève un échantillon ; les taux sont calculés depuis le précédent"""
+        now = time.time() if now is None else now
+        snapshot = self.monitor.history_snapshot()
+        queries = metrics.metrics.get('stats_query_duration_seconds')
+        snapshot['queries'] = queries.totals() if queries is not None else (0, 0.0)
+
+        sample = {
+            'heartbeat_lag_seconds': snapshot['heartbeat_lag'],
+            'connected_clients': snapshot['connected_clients'],
+            'slow_clients': snapshot['slow_clients'],
+            'socketio_max_backlog': snapshot['max_backlog'],
+            'socketio_queued': snapshot['queued'],
+            'rss_bytes': current_rss_bytes()
+        }
+        with self.lock:
+            previous, self.previous = self.previous, (now, snapshot)
+            if previous is not None and now > previous[0]:
+                elapsed = now - previous[0]
+                before = previous[1]
+                sample['gateway_events_per_second'] = (snapshot['events_total'] - before['events_total']) / elapsed
+                sample['bot_errors_per_second'] = (snapshot['errors_total'] - before['errors_total']) / elapsed
+                sample['web_requests_per_second'] = (snapshot['requests_total'] - before['requests_total']) / elapsed
+                count = snapshot['queries'][0] - before['queries'][0]
+                if count > 0:
+                    sample['db_query_ms'] = (snapshot['queries'][1] - before['queries'][1]) / count * 1000
+            for tier in self.tiers.values():
+                tier.add(now, sample)
+
+    def get_history(self, resolution, limit=None):
+        """Série d'un palier ('1s', '1m', '1h') ; None si le palier n'existe pas"""
+        tier = self.tiers.get(resolution)
+        if tier is None:
+            return None
+        with self.lock:
+            timestamps, series = tier.series(time.time(), limit)
+        return {
+            'resolution': resolution,
+            'step_seconds': tier.step,
+            'timestamps': timestamps,
+            'series': series
+        }
+
+# Instances globales
+health_monitor = HealthMonitor()
+health_history = HealthHistory(health_monitor)
+
+metrics.gauge('web_connected_clients', 'Clients Socket.IO connectés',
+              lambda: health_monitor.metrics_snapshot()['connected_clients'])
+metrics.gauge('socketio_slow_clients', 'Clients Socket.IO dont les diffusions sont en file',
+              lambda: health_monitor.metrics_snapshot()['slow_clients'])
+metrics.gauge('bot_guilds', 'Serveurs Discord suivis', lambda: health_monitor.metrics_snapshot()['guilds'])
+metrics.callback_counter('bot_errors_total', 'Erreurs du bot', lambda: health_monitor.metrics_snapshot()['bot_errors'])
+metrics.callback_counter('gateway_events_total', 'Événements reçus de la gateway Discord',
+                         lambda: health_monitor.metrics_snapshot()['gateway_events'], ('type',))
+metrics.gauge('process_resident_memory_bytes', 'Mémoire résidente du processus', current_rss_bytes)
\ No newline at end of file
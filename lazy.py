@@ -0,0 +1,42 @@
+# -*- coding: utf-8 -*-
+"""
+Instances globales construites au premier usage
+
+StatsTracker et OccupancyStore ouvrent la base et rechargent leur état à la
+construction. Les workers web importent leurs modules sans jamais s'en servir
+(ils lisent tout via le bus) : derrière un LazyInstance, ce travail n'est fait
+que par le processus qui utilise réellement l'instance.
+"""
+
+from threading import Lock
+
+class LazyInstance:
+    """
+    Mandataire d'une instance globale : la construit au premier accès à un
+    attribut, puis lui délègue lectures et affectations
+    """
+    
+    def __init__(self, factory):
+        object.__setattr__(self, '_factory', factory)
+        object.__setattr__(self, '_instance', None)
+        object.__setattr__(self, '_lock', Lock())
+    
+    def lazy_created(self):
+        """Indique si l'instance a déjà été construite (sans la construire)"""
+        return self._instance is not None
+    
+    def lazy_instance(self):
+        """Instance réelle, construite au premier appel"""
+        instance = self._instance
+        if instance is None:
+            with self._lock:
+                if self._instance is None:
+                    object.__setattr__(self, '_instance', self._factory())
+                instance = self._instance
+        return instance
+    
+    def __getattr__(self, name):
+        return getattr(self.lazy_instance(), name)
+    
+    def __setattr__(self, name, value):
+        setattr(self.lazy_instance(), name, value)
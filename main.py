@@ -1,16 +1,63 @@
+import asyncio
+import os
 from threading import Thread
-from web_server import run_server
-from discord_bot import run_bot
-from config import FLASK_PORT
+from web_server import run_server, stop_server, emit_stats_update, handle_bus_request
+from discord_bot import run_bot, start_bot, set_socketio
+from health_monitor import health_history
+from config import FLASK_PORT, WEB_SERVER_MODE, BUS_AUTHKEY
 
-if __name__ == "__main__":
+def run_threaded():
+    """Serveur web dans un thread, bot Discord dans le thread principal"""
     # Lance le serveur Flask dans un thread séparé
     flask_thread = Thread(target=run_server)
     flask_thread.daemon = True
     flask_thread.start()
     
+    # Lance le bot Discord (bloquant)
+    try:
+        run_bot()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        stop_server()
+
+def run_single_loop():
+    """Bot et serveur web sur la même boucle asyncio (WEB_SERVER_MODE = 'single_loop')"""
+    import asgi_server
+    try:
+        asyncio.run(asgi_server.serve_with(start_bot()))
+    except KeyboardInterrupt:
+        pass
+
+def run_workers():
+    """Bot et broker du bus dans ce processus, serveur web dans WEB_WORKERS processus"""
+    import web_worker
+    from message_bus import MessageBroker, BusPublisher
+    
+    # Clé du bus : celle de la configuration, sinon une clé aléatoire propre à ce lancement
+    authkey = BUS_AUTHKEY or os.urandom(32)
+    broker = MessageBroker(authkey=authkey)
+    broker.start()
+    set_socketio(BusPublisher(authkey=authkey, handle_request=handle_bus_request))
+    health_history.start()
+    Thread(target=emit_stats_update, daemon=True).start()
+    workers = web_worker.start_workers(authkey=authkey)
+    
+    try:
+        run_bot()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        web_worker.stop_workers(workers)
+        broker.close()
+
+if __name__ == "__main__":
     print(f"🌐 Interface web disponible sur http://localhost:{FLASK_PORT}")
     print("🤖 Démarrage du bot Discord...")
     
-    # Lance le bot Discord (bloquant)
-    run_bot()
\ No newline at end of file
+    if WEB_SERVER_MODE == 'single_loop':
+        run_single_loop()
+    elif WEB_SERVER_MODE == 'workers':
+        run_workers()
+    else:
+        run_threaded()
\ No newline at end of file
@@ -0,0 +1,358 @@
+# -*- coding: utf-8 -*-
+"""
+Bus de messages local entre le bot et les workers web (WEB_SERVER_MODE = 'workers')
+
+Le bot publie ses diffusions (voice_update, activity_log, stats_update,
+health_status) sur un broker intégré (multiprocessing.connection, clé
+partagée). Le broker garde le dernier état (salons vocaux, logs récents,
+dernières stats et santé) et le transmet à chaque worker qui s'abonne, puis
+relaie les événements. Les workers web peuvent aussi interroger le bot
+(profil d'un membre, stats d'une période) par requête/réponse.
+
+voice_update est publié sous forme de patchs (salons modifiés seulement).
+
+Usage (broker séparé du bot) :
+    python message_bus.py broker
+"""
+
+import argparse
+import itertools
+import json
+import queue
+import threading
+import time
+from collections import deque
+from multiprocessing.connection import Client, Listener
+from threading import Lock
+
+from config import BUS_ADDRESS, BUS_AUTHKEY
+
+# Logs conservés par le broker pour les workers qui s'abonnent
+RETAINED_LOGS = 100
+
+def require_authkey(authkey):
+    """
+    Clé du bus, obligatoire : multiprocessing.connection dépickle les messages,
+    une connexion sans clé (ou avec une clé connue) permettrait d'exécuter du
+    code dans le bot
+    """
+    if not authkey:
+        raise ValueError('Clé du bus manquante (BUS_AUTHKEY, ou clé générée par main.py)')
+    return authkey
+
+def apply_voice_patch(voice_data, patch):
+    """Retourne un nouveau voice_data avec le patch appliqué (l'ancien n'est pas modifié)"""
+    data = dict(voice_data)
+    data.update(patch['set'])
+    for channel_name in patch['removed']:
+        data.pop(channel_name, None)
+    return data
+
+# ============================================
+# BROKER
+# ============================================
+
+class MessageBroker:
+    """Relaie les publications du bot vers les workers abonnés"""
+
+    def __init__(self, address=BUS_ADDRESS, authkey=BUS_AUTHKEY):
+        self.lock = Lock()
+        self.address = address
+        self.authkey = require_authkey(authkey)
+        self.listener = None
+        self.publisher = None
+        self.publisher_lock = Lock()
+        self.subscribers = {}   # connexion -> file d'envoi
+        self.requests = {}      # id de requête -> (connexion du worker, id côté worker)
+        self.request_ids = itertools.count()
+
+        # État retenu pour les nouveaux abonnés
+        self.voice_data = {}
+        self.logs = deque(maxlen=RETAINED_LOGS)
+        self.retained = {}
+
+    def start(self):
+        """Démarre l'écoute dans un thread ; retourne l'adresse effective"""
+        self.listener = Listener(self.address, authkey=self.authkey)
+        threading.Thread(target=self._accept_loop, daemon=True).start()
+        return self.listener.address
+
+    def _accept_loop(self):
+        while True:
+            try:
+                conn = self.listener.accept()
+            except OSError:
+                return
+            except Exception as e:
+                print(f"⚠️ Bus : connexion refusée ({e})")
+                continue
+            threading.Thread(target=self._serve_connection, args=(conn,), daemon=True).start()
+
+    def _serve_connection(self, conn):
+        try:
+            role = conn.recv()
+            if role == 'publish':
+                self._serve_publisher(conn)
+            elif role == 'subscribe':
+                self._serve_subscriber(conn)
+        except (EOFError, OSError):
+            pass
+        finally:
+            self._drop(conn)
+            conn.close()
+
+    def _serve_publisher(self, conn):
+        with self.lock:
+            self.publisher = conn
+        while True:
+            message = conn.recv()
+            if message[0] == 'reply':
+                _, request_id, result = message
+                with self.lock:
+                    target = self.requests.pop(request_id, None)
+                if target:
+                    self._reply(*target, result)
+                continue
+
+            _, event, data = message
+            with self.lock:
+                self._retain(event, data)
+                outboxes = list(self.subscribers.values())
+            for outbox in outboxes:
+                outbox.put(('event', event, data))
+
+    def _retain(self, event, data):
+        if event == 'voice_update':
+            self.voice_data = data
+        elif event == 'voice_patch':
+            self.voice_data = apply_voice_patch(self.voice_data, data)
+        elif event == 'activity_log':
+            self.logs.append(data)
+        else:
+            self.retained[event] = data
+
+    def _serve_subscriber(self, conn):
+        outbox = queue.Queue()
+        with self.lock:
+            outbox.put(('event', 'voice_update', self.voice_data))
+            outbox.put(('event', 'activity_logs', list(self.logs)))
+            for event, data in self.retained.items():
+                outbox.put(('event', event, data))
+            self.subscribers[conn] = outbox
+        threading.Thread(target=self._send_loop, args=(conn, outbox), daemon=True).start()
+
+        # Requêtes du worker, transmises au bot sous un id propre au broker
+        while True:
+            _, worker_request_id, kind, args = conn.recv()
+            with self.lock:
+                publisher = self.publisher
+                request_id = next(self.request_ids)
+                self.requests[request_id] = (conn, worker_request_id)
+            try:
+                if publisher is None:
+                    raise OSError('bot non connecté')
+                with self.publisher_lock:
+                    publisher.send(('request', request_id, kind, args))
+            except OSError:
+                with self.lock:
+                    self.requests.pop(request_id, None)
+                self._reply(conn, worker_request_id, None)
+
+    def _reply(self, conn, worker_request_id, result):
+        outbox = self.subscribers.get(conn)
+        if outbox is not None:
+            outbox.put(('reply', worker_request_id, result))
+
+    def _send_loop(self, conn, outbox):
+        """Un thread d'envoi par abonné : un worker lent ne bloque pas les autres"""
+        while True:
+            message = outbox.get()
+            if message is None:
+                return
+            try:
+                conn.send(message)
+            except (OSError, ValueError):
+                return
+
+    def _drop(self, conn):
+        with self.lock:
+            if self.publisher is conn:
+                self.publisher = None
+            outbox = self.subscribers.pop(conn, None)
+            if outbox is not None:
+                outbox.put(None)
+
+    def close(self):
+        if self.listener:
+            self.listener.close()
+
+# ============================================
+# CÔTÉ BOT
+# ============================================
+
+class BusPublisher:
+    """
+    Publie les diffusions du bot sur le bus
+
+    Expose emit() comme flask_socketio.SocketIO : s'installe avec
+    discord_bot.set_socketio(). L'envoi se fait dans un thread, le bot
+    n'attend jamais le broker ; en cas de coupure, l'état complet est
+    renvoyé à la reconnexion.
+    """
+
+    def __init__(self, address=BUS_ADDRESS, authkey=BUS_AUTHKEY, handle_request=None):
+        self.address = address
+        self.authkey = require_authkey(authkey)
+        self.handle_request = handle_request
+        self.outbox = queue.Queue()
+        self.lock = Lock()
+        self.channels = {}      # salon -> JSON publié (détection des changements)
+        self.voice_data = {}
+        threading.Thread(target=self._run, daemon=True).start()
+
+    def emit(self, event, data=None, to=None):
+        if to is not None:
+            return
+        if event == 'voice_update':
+            patch = self._voice_patch(data)
+            if patch['set'] or patch['removed']:
+                self.outbox.put(('publish', 'voice_patch', patch))
+            return
+        self.outbox.put(('publish', event, data))
+
+    def _voice_patch(self, voice_data):
+        """Salons ajoutés/modifiés/supprimés depuis la dernière publication"""
+        with self.lock:
+            encoded = {name: json.dumps(data, sort_keys=True) for name, data in voice_data.items()}
+            patch = {
+                'set': {name: json.loads(text) for name, text in encoded.items() if self.channels.get(name) != text},
+                'removed': [name for name in self.channels if name not in encoded]
+            }
+            self.channels = encoded
+            self.voice_data = apply_voice_patch(self.voice_data, patch)
+            return patch
+
+    def _run(self):
+        while True:
+            try:
+                conn = Client(self.address, authkey=self.authkey)
+            except (OSError, EOFError):
+                time.sleep(1)
+                continue
+            try:
+                conn.send('publish')
+                with self.lock:
+                    conn.send(('publish', 'voice_update', self.voice_data))
+                threading.Thread(target=self._receive_loop, args=(conn,), daemon=True).start()
+                while True:
+                    conn.send(self.outbox.get())
+            except (OSError, EOFError, ValueError):
+                conn.close()
+                time.sleep(1)
+
+    def _receive_loop(self, conn):
+        """Répond aux requêtes des workers (profil d'un membre, stats...)"""
+        while True:
+            try:
+                _, request_id, kind, args = conn.recv()
+            except (OSError, EOFError):
+                return
+            threading.Thread(target=self._answer, args=(request_id, kind, args), daemon=True).start()
+
+    def _answer(self, request_id, kind, args):
+        try:
+            result = self.handle_request(kind, *args) if self.handle_request else None
+        except Exception as e:
+            print(f"❌ Erreur requête bus {kind}: {e}")
+            result = None
+        self.outbox.put(('reply', request_id, result))
+
+# ============================================
+# CÔTÉ WORKER WEB
+# ============================================
+
+class BusSubscriber:
+    """Reçoit les événements du bus et envoie des requêtes au bot"""
+
+    def __init__(self, on_event, address=BUS_ADDRESS, authkey=BUS_AUTHKEY):
+        self.on_event = on_event
+        self.address = address
+        self.authkey = require_authkey(authkey)
+        self.lock = Lock()
+        self.conn = None
+        self.request_ids = itertools.count()
+        self.pending = {}   # id -> [Event, résultat]
+
+    def start(self):
+        threading.Thread(target=self._run, daemon=True).start()
+
+    def _run(self):
+        while True:
+            try:
+                conn = Client(self.address, authkey=self.authkey)
+                conn.send('subscribe')
+            except (OSError, EOFError):
+                time.sleep(1)
+                continue
+            with self.lock:
+                self.conn = conn
+            try:
+                while True:
+                    message = conn.recv()
+                    if message[0] == 'reply':
+                        self._resolve(message[1], message[2])
+                    else:
+                        try:
+                            self.on_event(message[1], message[2])
+                        except Exception as e:
+                            print(f"❌ Erreur événement bus {message[1]}: {e}")
+            except (OSError, EOFError):
+                pass
+            with self.lock:
+                self.conn = None
+                for request_id in list(self.pending):
+                    self._resolve(request_id, None)
+            conn.close()
+            time.sleep(1)
+
+    def _resolve(self, request_id, result):
+        waiter = self.pending.pop(request_id, None)
+        if waiter:
+            waiter[1] = result
+            waiter[0].set()
+
+    def request(self, kind, *args, timeout=5):
+        """Interroge le bot (bloquant) ; None si le bus ou le bot ne répond pas"""
+        with self.lock:
+            conn = self.conn
+            if conn is None:
+                return None
+            request_id = next(self.request_ids)
+            waiter = self.pending[request_id] = [threading.Event(), None]
+            try:
+                conn.send(('request', request_id, kind, args))
+            except OSError:
+                self.pending.pop(request_id, None)
+                return None
+        if not waiter[0].wait(timeout):
+            self.pending.pop(request_id, None)
+            return None
+        return waiter[1]
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('command', choices=('broker',))
+    parser.parse_args()
+    if not BUS_AUTHKEY:
+        parser.error('BUS_AUTHKEY doit être configuré pour un broker séparé du bot')
+
+    broker = MessageBroker()
+    print(f"📡 Broker du bus en écoute sur {broker.start()}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        broker.close()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,270 @@
+# -*- coding: utf-8 -*-
+"""
+Métriques exportées au format texte Prometheus (/metrics)
+
+Compteurs et histogrammes sont découpés en SHARDS fragments : chaque thread
+écrit toujours dans le même fragment, dont le verrou n'est pratiquement
+jamais disputé ; les fragments ne sont additionnés qu'à la lecture. Les
+jauges sont calculées à la lecture par une fonction.
+
+    requests = metrics.counter('exemple_total', 'Description', ('route',))
+    requests.inc('/api/bot')
+    latency = metrics.histogram('exemple_duration_seconds', 'Description', ('route',))
+    latency.observe(0.003, '/api/bot')
+"""
+
+import bisect
+import itertools
+import threading
+import time
+from functools import wraps
+from threading import Lock
+
+SHARDS = 16
+
+# Bornes des histogrammes de durée (secondes)
+DURATION_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025,
+                    0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+_next_shard = itertools.count()
+_thread_shard = threading.local()
+
+def shard_index():
+    """Fragment du thread courant, attribué à tour de rôle au premier appel"""
+    try:
+        return _thread_shard.index
+    except AttributeError:
+        _thread_shard.index = next(_next_shard) % SHARDS
+        return _thread_shard.index
+
+class Shard:
+    __slots__ = ('lock', 'values')
+
+    def __init__(self):
+        self.lock = Lock()
+        self.values = {}    # valeurs des labels -> valeur
+
+class ShardedMetric:
+    """Base des compteurs et histogrammes : une valeur par combinaison de labels"""
+
+    type = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.shards = [Shard() for _ in range(SHARDS)]
+
+    def _snapshot(self):
+        """[(labels, valeur)] de tous les fragments"""
+        items = []
+        for shard in self.shards:
+            with shard.lock:
+                items.extend((labels, self._copy(value)) for labels, value in shard.values.items())
+        return items
+
+    @staticmethod
+    def _copy(value):
+        return value
+
+    def _labels(self, values):
+        return dict(zip(self.labelnames, values))
+
+class Counter(ShardedMetric):
+    type = 'counter'
+
+    def inc(self, *labels, value=1):
+        shard = self.shards[shard_index()]
+        with shard.lock:
+            shard.values[labels] = shard.values.get(labels, 0) + value
+
+    def values(self):
+        """{labels: total}"""
+        # Sans labels, le compteur est exposé même à zéro
+        totals = {} if self.labelnames else {(): 0}
+        for labels, value in self._snapshot():
+            totals[labels] = totals.get(labels, 0) + value
+        return totals
+
+    def total(self):
+        return sum(self.values().values())
+
+    def samples(self):
+        for labels, value in sorted(self.values().items()):
+            yield self.name, self._labels(labels), value
+
+class Histogram(ShardedMetric):
+    type = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DURATION_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, *labels):
+        index = bisect.bisect_left(self.buckets, value)
+        shard = self.shards[shard_index()]
+        with shard.lock:
+            state = shard.values.get(labels)
+            if state is None:
+                # [nombre par intervalle (le dernier : au-delà de la plus grande borne), somme]
+                state = shard.values[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+            state[0][index] += 1
+            state[1] += value
+
+    @staticmethod
+    def _copy(value):
+        return [list(value[0]), value[1]]
+
+    def totals(self):
+        """(nombre d'observations, somme) tous labels confondus"""
+        count, total = 0, 0.0
+        for _, (counts, value_sum) in self._snapshot():
+            count += sum(counts)
+            total += value_sum
+        return count, total
+
+    def samples(self):
+        merged = {} if self.labelnames else {(): [[0] * (len(self.buckets) + 1), 0.0]}
+        for labels, (counts, total) in self._snapshot():
+            state = merged.setdefault(labels, [[0] * (len(self.buckets) + 1), 0.0])
+            state[0] = [a + b for a, b in zip(state[0], counts)]
+            state[1] += total
+        for labels, (counts, total) in sorted(merged.items()):
+            base = self._labels(labels)
+            cumulative = 0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                yield f'{self.name}_bucket', dict(base, le=format_value(bound)), cumulative
+            cumulative += counts[-1]
+            yield f'{self.name}_bucket', dict(base, le='+Inf'), cumulative
+            yield f'{self.name}_sum', base, total
+            yield f'{self.name}_count', base, cumulative
+
+class CallbackMetric:
+    """Jauge (ou compteur tenu ailleurs) lue à la demande : collect() -> {labels: valeur} ou nombre"""
+
+    def __init__(self, name, documentation, collect, labelnames=(), metric_type='gauge'):
+        self.name = name
+        self.documentation = documentation
+        self.collect = collect
+        self.labelnames = tuple(labelnames)
+        self.type = metric_type
+
+    def samples(self):
+        values = self.collect()
+        if values is None:
+            return
+        if not isinstance(values, dict):
+            values = {(): values}
+        for labels, value in sorted(values.items()):
+            if value is not None:
+                labels = labels if isinstance(labels, tuple) else (labels,)
+                yield self.name, dict(zip(self.labelnames, labels)), value
+
+def timed(histogram, label=None):
+    """
+    Décorateur : observe la durée de chaque appel ; le label (nom de la
+    fonction par défaut) n'est passé que si l'histogramme en a un
+    """
+    def decorator(func):
+        labels = (label or func.__name__,) if histogram.labelnames else ()
+
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                histogram.observe(time.perf_counter() - start, *labels)
+        return wrapper
+    return decorator
+
+class MetricsRegistry:
+    """Métriques de l'application, par nom"""
+
+    def __init__(self):
+        self.lock = Lock()
+        self.metrics = {}
+
+    def _register(self, metric):
+        # Une métrique déjà déclarée (module rechargé, plusieurs instances) est réutilisée
+        with self.lock:
+            return self.metrics.setdefault(metric.name, metric)
+
+    def counter(self, name, documentation, labelnames=()):
+        return self._register(Counter(name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DURATION_BUCKETS):
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def gauge(self, name, documentation, collect, labelnames=()):
+        return self._register(CallbackMetric(name, documentation, collect, labelnames))
+
+    def callback_counter(self, name, documentation, collect, labelnames=()):
+        return self._register(CallbackMetric(name, documentation, collect, labelnames, metric_type='counter'))
+
+    def collect(self):
+        """[(nom, type, description, [(nom de l'échantillon, labels, valeur)])] (picklable)"""
+        with self.lock:
+            metrics = list(self.metrics.values())
+        families = []
+        for metric in metrics:
+            try:
+                samples = list(metric.samples())
+            except Exception as e:
+                print(f"❌ Erreur métrique {metric.name}: {e}")
+                continue
+            families.append((metric.name, metric.type, metric.documentation, samples))
+        return families
+
+# ============================================
+# FORMAT TEXTE PROMETHEUS
+# ============================================
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+def format_value(value):
+    if isinstance(value, bool):
+        return '1' if value else '0'
+    if isinstance(value, int):
+        return str(value)
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value))
+
+def escape_label(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+def with_labels(families, **labels):
+    """Ajoute des labels à tous les échantillons (ex: process="bot")"""
+    return [(name, metric_type, documentation, [(sample, dict(sample_labels, **labels), value)
+                                                for sample, sample_labels, value in samples])
+            for name, metric_type, documentation, samples in families]
+
+def merge_families(*family_lists):
+    """Réunit les échantillons de familles de même nom (plusieurs processus)"""
+    merged = {}
+    for families in family_lists:
+        for name, metric_type, documentation, samples in families:
+            if name in merged:
+                merged[name][3].extend(samples)
+            else:
+                merged[name] = (name, metric_type, documentation, list(samples))
+    return list(merged.values())
+
+def render(families):
+    """Texte d'exposition Prometheus (version 0.0.4)"""
+    lines = []
+    for name, metric_type, documentation, samples in sorted(families, key=lambda family: family[0]):
+        lines.append(f'# HELP {name} {documentation}')
+        lines.append(f'# TYPE {name} {metric_type}')
+        for sample, labels, value in samples:
+            if labels:
+                label_text = ','.join(f'{key}="{escape_label(val)}"' for key, val in labels.items())
+                lines.append(f'{sample}{{{label_text}}} {format_value(value)}')
+            else:
+                lines.append(f'{sample} {format_value(value)}')
+    return '\n'.join(lines) + '\n'
+
+# Instance globale
+metrics = MetricsRegistry()
@@ -0,0 +1,361 @@
+# -*- coding: utf-8 -*-
+"""
+Série temporelle de l'occupation des salons (membres connectés)
+
+Pour chaque salon suivi, le nombre de membres est relevé à chaque changement
+de voice_data et intégré dans des paliers de créneaux (OCCUPANCY_TIERS) :
+chaque créneau garde l'aire (membres × secondes), la durée couverte et le
+maximum. Les paliers bornés sont circulaires (le créneau le plus ancien est
+réutilisé) ; un palier sans limite grandit d'un créneau par intervalle.
+
+Les tableaux sont sauvegardés tels quels (BLOB) dans la table
+occupancy_series toutes les OCCUPANCY_SAVE_INTERVAL secondes : une courbe se
+lit sans parcourir les sessions.
+"""
+
+import math
+import sys
+from array import array
+from datetime import datetime
+from threading import Lock
+
+from config import DATABASE_PATH, OCCUPANCY_TIERS, OCCUPANCY_SAVE_INTERVAL
+from tracing import sqlite_connect, traced
+from lazy import LazyInstance
+
+# Nombre maximum de points renvoyés par get_series (le pas est élargi au besoin)
+MAX_POINTS = 2000
+
+def _to_blob(values):
+    """Tableau -> octets petit-boutistes (base portable d'une machine à l'autre)"""
+    if sys.byteorder == 'big':
+        values = array(values.typecode, values)
+        values.byteswap()
+    return values.tobytes()
+
+def _from_blob(typecode, blob):
+    values = array(typecode)
+    values.frombytes(blob)
+    if sys.byteorder == 'big':
+        values.byteswap()
+    return values
+
+class SeriesTier:
+    """
+    Créneaux de `step` secondes d'un salon ; `capacity` créneaux en anneau,
+    ou sans limite (None) à partir du premier créneau écrit (`origin`)
+    """
+
+    def __init__(self, step, capacity=None):
+        self.step = step
+        self.capacity = capacity
+        self.origin = None
+        size = capacity or 0
+        self.slots = array('i', [-1]) * size     # numéro du créneau (epoch // step), -1 = vide
+        self.area = array('f', [0.0]) * size     # membres × secondes
+        self.covered = array('f', [0.0]) * size  # secondes observées
+        self.peak = array('H', [0]) * size       # maximum de membres
+
+    def _slot(self, number, create):
+        """Position du créneau `number` dans les tableaux (None si absent)"""
+        if self.capacity:
+            index = number % self.capacity
+        else:
+            if self.origin is None:
+                if not create:
+                    return None
+                self.origin = number
+            index = number - self.origin
+            if index < 0:
+                return None
+            if index >= len(self.slots):
+                if not create:
+                    return None
+                missing = index + 1 - len(self.slots)
+                self.slots.extend([-1] * missing)
+                self.area.extend([0.0] * missing)
+                self.covered.extend([0.0] * missing)
+                self.peak.extend([0] * missing)
+        if self.slots[index] != number:
+            if not create:
+                return None
+            self.slots[index] = number
+            self.area[index] = 0.0
+            self.covered[index] = 0.0
+            self.peak[index] = 0
+        return index
+
+    def add(self, start, end, value):
+        """Intègre `value` membres entre start et end (epoch)"""
+        if self.capacity:
+            start = max(start, end - self.capacity * self.step)
+        number = int(start // self.step)
+        while start < end:
+            segment_end = min(end, (number + 1) * self.step)
+            index = self._slot(number, True)
+            if index is not None:
+                self.area[index] += value * (segment_end - start)
+                self.covered[index] += segment_end - start
+                if value > self.peak[index]:
+                    self.peak[index] = value
+            start = segment_end
+            number += 1
+
+    def touch(self, at, value):
+        """Maximum du créneau courant, même pour un changement aussitôt annulé"""
+        index = self._slot(int(at // self.step), True)
+        if index is not None and value > self.peak[index]:
+            self.peak[index] = value
+
+    def window(self, first, count):
+        """
+        (aires, secondes couvertes, maximums) des créneaux first..first+count-1,
+        des listes de `count` valeurs (0 pour un créneau absent)
+        """
+        area, covered, peak = [0.0] * count, [0.0] * count, [0] * count
+        position = 0
+        while position < count:
+            number = first + position
+            if self.capacity:
+                index = number % self.capacity
+                length = min(count - position, self.capacity - index)
+            else:
+                if self.origin is None:
+                    break
+                index = number - self.origin
+                if index < 0:
+                    position = min(count, self.origin - first)
+                    continue
+                length = min(count - position, len(self.slots) - index)
+                if length <= 0:
+                    break
+            # Tranches contiguës des tableaux, comparées aux numéros attendus
+            rows = zip(self.slots[index:index + length], self.area[index:index + length],
+                       self.covered[index:index + length], self.peak[index:index + length])
+            for offset, (slot, slot_area, slot_covered, slot_peak) in enumerate(rows):
+                if slot == number + offset:
+                    area[position + offset] = slot_area
+                    covered[position + offset] = slot_covered
+                    peak[position + offset] = slot_peak
+            position += length
+        return area, covered, peak
+
+class OccupancyStore:
+    """Occupation de chaque salon suivi, par palier, avec persistance SQLite"""
+
+    def __init__(self, db_path=None, clock=datetime.now, tiers=OCCUPANCY_TIERS):
+        self.lock = Lock()
+        self.db_path = db_path or DATABASE_PATH
+        # Horloge injectable (horloge simulée lors d'un rejeu)
+        self.clock = clock
+        self.tiers = tiers
+        # salon -> {'tiers': {nom: SeriesTier}, 'value': membres, 'since': epoch du dernier relevé}
+        self.channels = {}
+        self.dirty = set()
+        self.last_save = self.clock().timestamp()
+
+        self._init_database()
+        self._load()
+
+    def _init_database(self):
+        with self.lock:
+            conn = sqlite_connect(self.db_path)
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS occupancy_series (
+                    channel TEXT NOT NULL,
+                    tier TEXT NOT NULL,
+                    step INTEGER NOT NULL,
+                    capacity INTEGER,
+                    origin INTEGER,
+                    slots BLOB,
+                    area BLOB,
+                    covered BLOB,
+                    peak BLOB,
+                    PRIMARY KEY (channel, tier)
+                )
+            ''')
+            conn.commit()
+            conn.close()
+
+    def _load(self):
+        """Recharge les paliers sauvegardés (ignorés si OCCUPANCY_TIERS a changé)"""
+        with self.lock:
+            conn = sqlite_connect(self.db_path)
+            rows = conn.execute('''
+                SELECT channel, tier, step, capacity, origin, slots, area, covered, peak
+                FROM occupancy_series
+            ''').fetchall()
+            conn.close()
+
+            for channel, name, step, capacity, origin, slots, area, covered, peak in rows:
+                if self.tiers.get(name) != (step, capacity):
+                    continue
+                tier = SeriesTier(step, capacity)
+                tier.origin = origin
+                tier.slots = _from_blob('i', slots)
+                tier.area = _from_blob('f', area)
+                tier.covered = _from_blob('f', covered)
+                tier.peak = _from_blob('H', peak)
+                if capacity and len(tier.slots) != capacity:
+                    continue
+                self._channel(channel)['tiers'][name] = tier
+
+    def _channel(self, name):
+        channel = self.channels.get(name)
+        if channel is None:
+            channel = self.channels[name] = {'tiers': {}, 'value': None, 'since': None}
+        for tier_name, (step, capacity) in self.tiers.items():
+            if tier_name not in channel['tiers']:
+                channel['tiers'][tier_name] = SeriesTier(step, capacity)
+        return channel
+
+    def _integrate(self, name, channel, now):
+        """Intègre la valeur courante du salon jusqu'à `now`"""
+        if channel['since'] is not None and now > channel['since']:
+            for tier in channel['tiers'].values():
+                tier.add(channel['since'], now, channel['value'])
+            channel['since'] = now
+            self.dirty.add(name)
+
+    def record(self, counts):
+        """Relève le nombre de membres de chaque salon ({salon: membres}) ; absent = 0"""
+        now = self.clock().timestamp()
+        with self.lock:
+            # Salon relevé depuis le démarrage mais absent de voice_data : vide
+            counts = dict(counts)
+            for name, channel in self.channels.items():
+                if name not in counts and channel['value'] is not None:
+                    counts[name] = 0
+            for name, count in counts.items():
+                channel = self._channel(name)
+                if channel['value'] == count:
+                    continue
+                self._integrate(name, channel, now)
+                if channel['since'] is None:
+                    # Premier relevé depuis le démarrage : rien à intégrer avant
+                    channel['since'] = now
+                channel['value'] = count
+                for tier in channel['tiers'].values():
+                    tier.touch(now, count)
+                self.dirty.add(name)
+
+    def _advance(self, now):
+        for name, channel in self.channels.items():
+            self._integrate(name, channel, now)
+
+    @traced()
+    def save(self):
+        """Écrit les paliers des salons modifiés depuis la dernière sauvegarde"""
+        now = self.clock().timestamp()
+        with self.lock:
+            self._advance(now)
+            rows = []
+            for name in self.dirty:
+                for tier_name, tier in self.channels[name]['tiers'].items():
+                    rows.append((name, tier_name, tier.step, tier.capacity, tier.origin,
+                                 _to_blob(tier.slots), _to_blob(tier.area),
+                                 _to_blob(tier.covered), _to_blob(tier.peak)))
+            self.dirty = set()
+            self.last_save = now
+            if not rows:
+                return
+
+            conn = sqlite_connect(self.db_path)
+            conn.executemany('''
+                INSERT OR REPLACE INTO occupancy_series
+                    (channel, tier, step, capacity, origin, slots, area, covered, peak)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ''', rows)
+            conn.commit()
+            conn.close()
+
+    def save_if_due(self):
+        """Sauvegarde toutes les OCCUPANCY_SAVE_INTERVAL secondes (appelée par le heartbeat)"""
+        if self.clock().timestamp() - self.last_save >= OCCUPANCY_SAVE_INTERVAL:
+            self.save()
+
+    def _choose_tier(self, start, now, step):
+        """
+        Palier qui couvre encore `start` : le plus grossier dont le pas divise
+        `step` (moins de créneaux à additionner), le plus fin si `step` est None
+        """
+        candidates = sorted(self.tiers.items(), key=lambda item: item[1][0])
+        for name, (tier_step, capacity) in reversed(candidates):
+            if step is None or step % tier_step:
+                continue
+            if capacity is None or start >= now - capacity * tier_step:
+                return name, tier_step
+        # Aucun palier ne convient exactement : le plus fin qui remonte jusque-là
+        for name, (tier_step, capacity) in candidates:
+            if capacity is None or start >= now - capacity * tier_step:
+                return name, tier_step
+        return candidates[-1][0], candidates[-1][1][0]
+
+    def get_series(self, channel=None, start=None, end=None, step=None):
+        """
+        Occupation moyenne et maximale par pas de `step` secondes
+
+        Args:
+            channel: salon (None = tous)
+            start, end: epoch (défaut : les dernières 24 heures)
+            step: secondes par point (défaut : selon la période, MAX_POINTS au plus)
+
+        Returns:
+            dict (horodatages, {salon: {'mean': [...], 'max': [...]}}), ou None
+            si le salon est inconnu
+        """
+        now = self.clock().timestamp()
+        end = now if end is None else min(end, now)
+        start = end - 86400 if start is None else start
+        with self.lock:
+            self._advance(now)
+            if channel is not None and channel not in self.channels:
+                return None
+            names = [channel] if channel is not None else sorted(self.channels)
+
+            tier_name, tier_step = self._choose_tier(start, now, step)
+            # Début borné aux créneaux que le palier peut contenir : une période
+            # démesurée n'alloue pas plus que le palier lui-même
+            capacity = self.tiers[tier_name][1]
+            if capacity:
+                start = max(start, now - capacity * tier_step)
+            else:
+                origins = [self.channels[name]['tiers'][tier_name].origin for name in names]
+                origins = [origin for origin in origins if origin is not None]
+                start = max(start, min(origins) * tier_step if origins else end)
+            # Pas : multiple du pas du palier, MAX_POINTS points au plus
+            step = max(tier_step, step or tier_step)
+            step = math.ceil(step / tier_step) * tier_step
+            step = max(step, math.ceil((end - start) / MAX_POINTS / tier_step) * tier_step)
+            # Un point ne couvre jamais plus que la période (pas démesuré)
+            step = min(step, max(tier_step, math.ceil((end - start) / tier_step) * tier_step))
+            first = int(start // step) * step
+            points = max(0, math.ceil((end - first) / step))
+            per_point = step // tier_step
+
+            channels = {}
+            for name in names:
+                tier = self.channels[name]['tiers'][tier_name]
+                area, covered, peak = tier.window(int(first // tier_step), points * per_point)
+                means, peaks = [], []
+                for point in range(0, points * per_point, per_point):
+                    point_covered = sum(covered[point:point + per_point])
+                    if point_covered:
+                        means.append(round(sum(area[point:point + per_point]) / point_covered, 3))
+                        peaks.append(max(peak[point:point + per_point]))
+                    else:
+                        means.append(None)
+                        peaks.append(None)
+                channels[name] = {'mean': means, 'max': peaks}
+
+        return {
+            'from': datetime.fromtimestamp(first).isoformat(),
+            'to': datetime.fromtimestamp(end).isoformat(),
+            'step_seconds': step,
+            'resolution': tier_name,
+            'timestamps': [datetime.fromtimestamp(first + point * step).isoformat() for point in range(points)],
+            'channels': channels
+        }
+
+# Instance globale (construite au premier usage : pas dans les workers web)
+occupancy = LazyInstance(OccupancyStore)
@@ -0,0 +1,231 @@
+# -*- coding: utf-8 -*-
+"""
+Profilage à la demande du processus en cours (routes /admin/profile et /admin/memory)
+
+CPU : un profileur par échantillonnage relève toutes les PROFILE_INTERVAL_MS
+la pile de chaque thread (sys._current_frames) pendant N secondes, puis
+renvoie les piles au format « collapsed » de flamegraph.pl / speedscope :
+    MainThread;run (main.py:40);serve (asgi_server.py:301) 12
+
+Le profileur tourne dans le thread de la requête qui le lance et n'existe
+que pendant la mesure : désactivé, il ne coûte rien.
+
+Mémoire : tracemalloc n'est démarré qu'à la demande (il ralentit toutes les
+allocations) ; un instantané est comparé à celui pris au démarrage. La
+taille des structures suivies (voice_data, logs...) est mesurée en
+parcourant les objets qu'elles contiennent.
+"""
+
+import asyncio
+import gc
+import os
+import sys
+import threading
+import time
+import tracemalloc
+import types
+import weakref
+from collections import Counter
+from datetime import datetime
+from threading import Lock
+
+from config import PROFILE_INTERVAL_MS, PROFILE_MAX_SECONDS, TRACEMALLOC_FRAMES
+
+# Objets jamais parcourus par deep_sizeof (partagés par tout le processus)
+SKIPPED_TYPES = (type, types.ModuleType, types.FunctionType, types.BuiltinFunctionType,
+                 types.MethodType, types.CodeType, types.FrameType, weakref.ref, threading.Thread,
+                 asyncio.AbstractEventLoop)
+
+# Dossier de l'application (attribution des allocations par fichier)
+APP_DIR = os.path.dirname(os.path.abspath(__file__)).replace('\\', '/')
+
+class SamplingProfiler:
+    """Profileur CPU par échantillonnage des piles de tous les threads"""
+
+    def __init__(self):
+        # Un seul profilage à la fois
+        self.lock = Lock()
+        self.labels = {}    # code -> libellé de frame (cache)
+
+    def _label(self, code):
+        label = self.labels.get(code)
+        if label is None:
+            name = getattr(code, 'co_qualname', code.co_name)
+            label = f'{name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})'.replace(';', ':')
+            self.labels[code] = label
+        return label
+
+    def sample(self, seconds, interval_ms=PROFILE_INTERVAL_MS):
+        """
+        Échantillonne les piles pendant `seconds` secondes
+
+        Returns:
+            Counter {(thread, frame racine, ..., frame feuille): échantillons},
+            ou None si un profilage est déjà en cours
+        """
+        if not self.lock.acquire(blocking=False):
+            return None
+        try:
+            seconds = max(0.1, min(float(seconds), PROFILE_MAX_SECONDS))
+            interval = max(1.0, float(interval_ms)) / 1000
+            me = threading.get_ident()
+            stacks = Counter()
+            deadline = time.perf_counter() + seconds
+            while time.perf_counter() < deadline:
+                names = {thread.ident: thread.name for thread in threading.enumerate()}
+                for ident, frame in sys._current_frames().items():
+                    if ident == me:
+                        continue
+                    stack = []
+                    while frame is not None:
+                        stack.append(self._label(frame.f_code))
+                        frame = frame.f_back
+                    stack.append(names.get(ident, f'thread-{ident}').replace(';', ':'))
+                    stacks[tuple(reversed(stack))] += 1
+                time.sleep(interval)
+            return stacks
+        finally:
+            self.lock.release()
+
+    def collapsed(self, seconds, interval_ms=PROFILE_INTERVAL_MS, root=None):
+        """Piles échantillonnées au format collapsed (une ligne par pile) ; None si occupé"""
+        stacks = self.sample(seconds, interval_ms)
+        if stacks is None:
+            return None
+        prefix = f'{root};' if root else ''
+        return ''.join(f"{prefix}{';'.join(stack)} {count}\n" for stack, count in stacks.most_common())
+
+# ============================================
+# MÉMOIRE
+# ============================================
+
+def deep_sizeof(obj, exclude=()):
+    """
+    Taille (octets) d'un objet et de tout ce qu'il contient, chaque objet
+    compté une fois ; `exclude` : objets à ne pas parcourir (état partagé)
+    """
+    seen = {id(item) for item in exclude}
+    total = 0
+    pending = [obj]
+    while pending:
+        item = pending.pop()
+        if id(item) in seen or isinstance(item, SKIPPED_TYPES):
+            continue
+        seen.add(id(item))
+        total += sys.getsizeof(item)
+        if isinstance(item, (str, bytes, int, float, bool)) or item is None:
+            continue
+        if isinstance(item, dict):
+            pending.extend(item.keys())
+            pending.extend(item.values())
+        else:
+            # Conteneurs, objets avec __dict__ ou __slots__
+            pending.extend(gc.get_referents(item))
+    return total
+
+def structure_sizes(structures, exclude=()):
+    """{nom: octets} ; structures : {nom: fonction renvoyant l'objet}"""
+    sizes = {}
+    for name, get in structures.items():
+        # Structure modifiée par un autre thread pendant le parcours : nouvel essai
+        for _ in range(3):
+            try:
+                obj = get()
+                sizes[name] = deep_sizeof(obj, exclude) if obj is not None else 0
+                break
+            except RuntimeError:
+                sizes[name] = None
+    return sizes
+
+def component(filename):
+    """Composant d'un fichier source : 'discord.py', 'python', ou le module de l'application"""
+    path = filename.replace('\\', '/')
+    if '/discord/' in path:
+        return 'discord.py'
+    if '/site-packages/' in path or '/dist-packages/' in path:
+        return path.split('-packages/', 1)[1].split('/', 1)[0]
+    if path.startswith(APP_DIR):
+        return os.path.basename(path)
+    return 'python'
+
+class MemoryProfiler:
+    """Instantanés tracemalloc comparés à une référence"""
+
+    def __init__(self):
+        self.lock = Lock()
+        self.baseline = None
+        self.started_at = None
+
+    def start(self, frames=TRACEMALLOC_FRAMES):
+        """Démarre tracemalloc et prend l'instantané de référence"""
+        with self.lock:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start(max(1, int(frames)))
+            self.baseline = tracemalloc.take_snapshot()
+            self.started_at = datetime.now()
+            return self.status()
+
+    def stop(self):
+        with self.lock:
+            if tracemalloc.is_tracing():
+                tracemalloc.stop()
+            self.baseline = None
+            self.started_at = None
+            return self.status()
+
+    def status(self):
+        tracing = tracemalloc.is_tracing()
+        current, peak = tracemalloc.get_traced_memory() if tracing else (0, 0)
+        return {
+            'tracing': tracing,
+            'started_at': self.started_at.isoformat() if self.started_at else None,
+            'traced_bytes': current,
+            'peak_bytes': peak
+        }
+
+    def report(self, structures, exclude=(), limit=20, reset_baseline=False):
+        """
+        Taille des structures suivies ; si tracemalloc tourne, mémoire allouée
+        par composant et plus fortes variations depuis la référence
+        """
+        report = {
+            'timestamp': datetime.now().isoformat(),
+            'structures': structure_sizes(structures, exclude)
+        }
+        with self.lock:
+            report['tracemalloc'] = self.status()
+            if not tracemalloc.is_tracing():
+                return report
+            snapshot = tracemalloc.take_snapshot().filter_traces((
+                tracemalloc.Filter(False, tracemalloc.__file__),
+                tracemalloc.Filter(False, '<frozen importlib._bootstrap>'),
+            ))
+            by_component = Counter()
+            for stat in snapshot.statistics('filename'):
+                by_component[component(stat.traceback[0].filename)] += stat.size
+            report['by_component'] = [{'component': name, 'size': size} for name, size in by_component.most_common()]
+            report['top'] = [self._stat(stat) for stat in snapshot.statistics('lineno')[:limit]]
+            if self.baseline is not None:
+                report['diff'] = [self._stat(stat, diff=True)
+                                  for stat in snapshot.compare_to(self.baseline, 'lineno')[:limit]]
+            if reset_baseline:
+                self.baseline = snapshot
+        return report
+
+    @staticmethod
+    def _stat(stat, diff=False):
+        frame = stat.traceback[0]
+        entry = {
+            'location': f'{frame.filename}:{frame.lineno}',
+            'component': component(frame.filename),
+            'size': stat.size,
+            'count': stat.count
+        }
+        if diff:
+            entry['size_diff'] = stat.size_diff
+            entry['count_diff'] = stat.count_diff
+        return entry
+
+# Instances globales
+cpu_profiler = SamplingProfiler()
+memory_profiler = MemoryProfiler()
@@ -0,0 +1,93 @@
+# -*- coding: utf-8 -*-
+"""
+Histogrammes de durées à classes logarithmiques fixes (résumés fusionnables)
+
+Une durée de v secondes tombe dans la classe floor(log2(v) × BUCKETS_PER_DOUBLING) :
+quatre classes par doublement, soit des bornes espacées d'un facteur 2^(1/4)
+(≈ 1,19). Un percentile estimé au milieu géométrique de sa classe est donc à
+moins de 9 % de la vraie valeur.
+
+Les classes étant les mêmes partout, deux histogrammes se fusionnent en
+additionnant leurs comptes : StatsTracker en tient un par jour (table
+duration_buckets) et une période quelconque additionne ceux de ses jours.
+"""
+
+import math
+
+BUCKETS_PER_DOUBLING = 4
+
+# Percentiles calculés par défaut
+PERCENTILES = (50, 90, 99)
+
+def bucket_of(seconds):
+    """Classe d'une durée (les durées de moins d'une seconde vont dans la classe 0)"""
+    if not seconds or seconds < 1:
+        return 0
+    return int(math.log2(seconds) * BUCKETS_PER_DOUBLING)
+
+def bucket_bounds(bucket):
+    """(borne basse, borne haute) d'une classe, en secondes"""
+    return 2 ** (bucket / BUCKETS_PER_DOUBLING), 2 ** ((bucket + 1) / BUCKETS_PER_DOUBLING)
+
+def bucket_value(bucket):
+    """Valeur représentative d'une classe : son milieu géométrique"""
+    return 2 ** ((bucket + 0.5) / BUCKETS_PER_DOUBLING)
+
+class LogHistogram:
+    """Comptes par classe, nombre et somme exacte des durées"""
+
+    __slots__ = ('counts', 'count', 'total')
+
+    def __init__(self):
+        self.counts = {}    # classe -> nombre de durées
+        self.count = 0
+        self.total = 0.0
+
+    def add_bucket(self, bucket, count, total):
+        self.counts[bucket] = self.counts.get(bucket, 0) + count
+        self.count += count
+        self.total += total
+
+    def add(self, seconds):
+        self.add_bucket(bucket_of(seconds), 1, seconds)
+
+    def merge(self, other):
+        for bucket, count in other.counts.items():
+            self.counts[bucket] = self.counts.get(bucket, 0) + count
+        self.count += other.count
+        self.total += other.total
+        return self
+
+    def percentile(self, q):
+        """Durée estimée du q-ième percentile (rang le plus proche) ; None si vide"""
+        if not self.count:
+            return None
+        rank = max(1, math.ceil(q / 100 * self.count))
+        seen = 0
+        for bucket in sorted(self.counts):
+            seen += self.counts[bucket]
+            if seen >= rank:
+                return bucket_value(bucket)
+        return bucket_value(max(self.counts))
+
+    def histogram(self):
+        """Comptes regroupés par doublement : [{'min_seconds', 'max_seconds', 'count'}]"""
+        doublings = {}
+        for bucket, count in self.counts.items():
+            doubling = bucket // BUCKETS_PER_DOUBLING
+            doublings[doubling] = doublings.get(doubling, 0) + count
+        return [{'min_seconds': 2 ** doubling if doubling else 0, 'max_seconds': 2 ** (doubling + 1), 'count': count}
+                for doubling, count in sorted(doublings.items())]
+
+    def summary(self, percentiles=PERCENTILES):
+        """Nombre, total, moyenne, percentiles et histogramme"""
+        summary = {
+            'count': self.count,
+            'total_seconds': round(self.total, 1),
+            'mean': round(self.total / self.count, 1) if self.count else 0
+        }
+        for q in percentiles:
+            value = self.percentile(q)
+            summary[f'p{q}'] = round(value, 1) if value is not None else None
+        summary['histogram'] = self.histogram()
+        return summary
@@ -1,4 +1,13 @@
-const socket = io();
+// Abonnement : tous les salons, ou ceux passés dans l'URL (?channel=...&guild=...)
+const pageParams = new URLSearchParams(window.location.search);
+const subscription = {
+    feeds: ['voice', 'logs', 'health'],
+    channels: pageParams.getAll('channel'),
+    guilds: pageParams.getAll('guild'),
+    encoding: payloadEncoding
+};
+const scoped = subscription.channels.length > 0 || subscription.guilds.length > 0;
+const socket = io({ auth: { subscribe: subscription } });
 const channelsGrid = document.getElementById('channelsGrid');
 const statusDot = document.getElementById('statusDot');
 const statusText = document.getElementById('statusText');
@@ -8,6 +17,7 @@ let healthPanelCollapsed = false;
 let logsPanelCollapsed = true;
 let lastPingTime = Date.now();
 let connectionLost = false;
+let voiceState = {};
 
 // ===============================
 // CONNEXION
@@ -32,12 +42,30 @@ socket.on('disconnect', () => {
     console.log('❌ Déconnecté du serveur');
     statusDot.className = 'status-dot disconnected';
     statusText.textContent = 'Connexion perdue - Reconnexion...';
+    // L'instantané complet sera renvoyé à la reconnexion
+    afterPayloads(() => { voiceState = {}; });
 });
 
-socket.on('voice_update', (data) => {
+socket.on('subscribed', decoded(() => {
+    voiceState = {};
+}));
+
+socket.on('voice_update', decoded((data) => {
     console.log('📡 Mise à jour reçue:', data);
-    renderChannels(data);
-});
+    if (scoped) {
+        // Mises à jour partielles : seuls les salons modifiés (null = supprimé)
+        for (const [channelName, channelData] of Object.entries(data)) {
+            if (channelData === null) {
+                delete voiceState[channelName];
+            } else {
+                voiceState[channelName] = channelData;
+            }
+        }
+    } else {
+        voiceState = data;
+    }
+    renderChannels(voiceState);
+}));
 
 // ===============================
 // RENDER CHANNELS
@@ -286,6 +314,8 @@ function addLogEntry(log) {
         text = `<span class="log-time">${log.time_str}</span><span class="log-member">${log.member}</span> <span class="log-action">a été muté par le serveur 🔇</span> <span class="log-channel">${log.channel}</span>`;
     } else if (log.type === 'server_unmute') {
         text = `<span class="log-time">${log.time_str}</span><span class="log-member">${log.member}</span> <span class="log-action">a été démuté par le serveur 🔊</span> <span class="log-channel">${log.channel}</span>`;
+    } else if (log.type === 'skipped') {
+        text = `<span class="log-action">… ${log.count} événement(s) non reçus (connexion lente)</span>`;
     }
     
     entry.innerHTML = text;
@@ -307,6 +337,11 @@ socket.on('activity_log', (log) => {
     addLogEntry(log);
 });
 
+// Connexion lente : le serveur a résumé les logs les plus anciens
+socket.on('activity_log_skipped', (data) => {
+    addLogEntry({ type: 'skipped', count: data.count });
+});
+
 socket.on('logs_history', (data) => {
     console.log('📋 Logs history received:', data.logs.length);
     data.logs.forEach(log => addLogEntry(log));
@@ -0,0 +1,25 @@
+// Encodage des diffusions : voice_update et stats_update arrivent en JSON
+// compressé (binaire) si le navigateur sait le décompresser
+const payloadEncoding = 'DecompressionStream' in window ? 'deflate' : 'json';
+
+// La décompression est asynchrone : les messages sont traités dans l'ordre de réception
+let payloadQueue = Promise.resolve();
+
+function decodePayload(data) {
+    if (!(data instanceof ArrayBuffer || ArrayBuffer.isView(data) || data instanceof Blob)) {
+        return Promise.resolve(data);
+    }
+    const stream = new Blob([data]).stream().pipeThrough(new DecompressionStream('deflate'));
+    return new Response(stream).json();
+}
+
+function afterPayloads(callback) {
+    payloadQueue = payloadQueue
+        .then(callback)
+        .catch((error) => console.error('❌ Erreur de décodage:', error));
+}
+
+// Enveloppe un handler Socket.IO : reçoit les données décodées, dans l'ordre
+function decoded(handler) {
+    return (data) => afterPayloads(() => decodePayload(data).then(handler));
+}
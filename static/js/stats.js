@@ -1,4 +1,5 @@
-const socket = io();
+// Seul le flux stats est affiché sur cette page
+const socket = io({ auth: { subscribe: { feeds: ['stats'], encoding: payloadEncoding } } });
 
 let currentPeriod = 'today';
 let statsData = null;
@@ -9,29 +10,54 @@ let statsData = null;
 
 socket.on('connect', () => {
     console.log('✅ Connecté au serveur');
-    socket.emit('get_stats', { period: currentPeriod });
+    requestStats();
 });
 
 socket.on('disconnect', () => {
     console.log('❌ Déconnecté du serveur');
 });
 
-socket.on('stats_update', (data) => {
+socket.on('stats_update', decoded((data) => {
     console.log('📊 Stats reçues:', data);
+    // La diffusion périodique concerne le jour : ignorée sur une autre période
+    if (data.period !== currentPeriod) return;
+    if (currentPeriod === 'custom' && data.from !== rangeFrom.value) return;
     statsData = data;
     renderStats();
-});
+}));
 
 // ===============================
 // PERIOD TOGGLE
 // ===============================
 
+const rangeFrom = document.getElementById('rangeFrom');
+const rangeTo = document.getElementById('rangeTo');
+
+// Période nommée, ou dates choisies (période 'custom', fin par défaut aujourd'hui)
+function requestStats() {
+    if (currentPeriod === 'custom') {
+        socket.emit('get_stats', { from: rangeFrom.value, to: rangeTo.value || null });
+    } else {
+        socket.emit('get_stats', { period: currentPeriod });
+    }
+}
+
 document.querySelectorAll('.period-btn').forEach(btn => {
     btn.addEventListener('click', () => {
+        if (btn.dataset.period === 'custom' && !rangeFrom.value) {
+            rangeFrom.focus();
+            return;
+        }
         document.querySelectorAll('.period-btn').forEach(b => b.classList.remove('active'));
         btn.classList.add('active');
         currentPeriod = btn.dataset.period;
-        socket.emit('get_stats', { period: currentPeriod });
+        requestStats();
+    });
+});
+
+[rangeFrom, rangeTo].forEach(input => {
+    input.addEventListener('change', () => {
+        if (currentPeriod === 'custom' && rangeFrom.value) requestStats();
     });
 });
 
@@ -183,12 +209,37 @@ function renderDetailedStats(allStats) {
                 <span class="user-stat-label">📍 Canaux visités</span>
                 <span class="user-stat-value">${stats.channels_visited.length}</span>
             </div>
+            ${renderStateTime(stats.state_time)}
         `;
         
         container.appendChild(card);
     });
 }
 
+function renderStateTime(stateTime) {
+    if (!stateTime) return '';
+    
+    const labels = {
+        muted: '🔇 Micro coupé',
+        deafened: '🔕 Sourdine',
+        server_muted: '🚫 Muté serveur',
+        stream: '📡 Stream',
+        webcam: '📹 Webcam'
+    };
+    
+    let rows = '';
+    for (const [state, label] of Object.entries(labels)) {
+        if (!stateTime[state]) continue;
+        rows += `
+            <div class="user-stat-row">
+                <span class="user-stat-label">${label}</span>
+                <span class="user-stat-value">${formatDuration(stateTime[state])}</span>
+            </div>
+        `;
+    }
+    return rows;
+}
+
 // ===============================
 // HELPER FUNCTIONS
 // ===============================
@@ -214,6 +265,4 @@ function formatDuration(seconds) {
 // ===============================
 
 // Rafraîchir toutes les 5 secondes
-setInterval(() => {
-    socket.emit('get_stats', { period: currentPeriod });
-}, 5000);
\ No newline at end of file
+setInterval(requestStats, 5000);
\ No newline at end of file
@@ -1,22 +1,151 @@
 # -*- coding: utf-8 -*-
 
-from datetime import datetime, timedelta
+from datetime import date, datetime, timedelta
 from threading import Lock
 from collections import defaultdict
-import sqlite3
+from itertools import chain, groupby
+from operator import itemgetter
 import json
-from config import DATABASE_PATH
+from config import DATABASE_PATH, SESSION_ALIVE_INTERVAL
+from copresence import RecentSegments, sweep_overlaps
+from sketches import LogHistogram, bucket_of
+from metrics import metrics, timed
+from tracing import sqlite_connect, traced
+from lazy import LazyInstance
+
+# États vocaux dont on comptabilise la durée
+TRACKED_STATES = ('muted', 'deafened', 'server_muted', 'stream', 'webcam')
+
+# Durée des méthodes qui interrogent ou écrivent la base SQLite
+QUERY_SECONDS = metrics.histogram('stats_query_duration_seconds', 'Durée des méthodes SQLite de StatsTracker', ('method',))
+
+# Origine des « secondes locales » des segments : heure murale sans fuseau,
+# une heure de la journée reste la même heure en été comme en hiver
+LOCAL_EPOCH = datetime(1970, 1, 1)
+
+def local_seconds(moment):
+    """Secondes locales d'un datetime naïf (heure murale)"""
+    return (moment - LOCAL_EPOCH).total_seconds()
+
+def _month_index(day):
+    return day.year * 12 + day.month - 1
+
+def _month_start(index):
+    return date(index // 12, index % 12 + 1, 1)
+
+def split_months(start_day, end_day):
+    """
+    Découpe la période [start_day, end_day] (dates incluses, None = sans limite)
+    en mois entiers, lus dans les cumuls mensuels, et en jours des mois entamés
+    
+    Returns:
+        ((premier mois, dernier mois) ou None, [(premier jour, dernier jour)]), en ISO
+    """
+    first = _month_index(start_day) + (start_day.day != 1) if start_day else 0
+    last = _month_index(end_day) - ((end_day + timedelta(days=1)).day != 1) if end_day else 9999 * 12 + 11
+    if first > last:
+        return None, [(start_day.isoformat(), end_day.isoformat())]
+    
+    days = []
+    if start_day and start_day.day != 1:
+        days.append((start_day.isoformat(), (_month_start(first) - timedelta(days=1)).isoformat()))
+    if end_day and (end_day + timedelta(days=1)).day != 1:
+        days.append((_month_start(last + 1).isoformat(), end_day.isoformat()))
+    months = (f'{first // 12:04d}-{first % 12 + 1:02d}', f'{last // 12:04d}-{last % 12 + 1:02d}')
+    return months, days
+
+def range_union(start_day, end_day, monthly, daily, columns, where='', params=()):
+    """
+    Sous-requête qui lit la période [start_day, end_day] (jours ISO inclus,
+    None = sans limite) dans une table mensuelle (colonne month) pour les mois
+    entiers et dans sa table quotidienne (colonne day) pour le reste
+    
+    Args:
+        columns: colonnes sélectionnées
+        where: condition supplémentaire (« AND ... ») et ses paramètres `params`
+    
+    Returns:
+        (requête UNION ALL, paramètres)
+    """
+    months, days = split_months(date.fromisoformat(start_day) if start_day else None,
+                                date.fromisoformat(end_day) if end_day else None)
+    ranges = ([(monthly, 'month', months)] if months else []) + [(daily, 'day', day_range) for day_range in days]
+    parts, values = [], []
+    for table, column, (first, last) in ranges:
+        parts.append(f'SELECT {columns} FROM {table} WHERE {column} BETWEEN ? AND ?{where}')
+        values += [first, last, *params]
+    return ' UNION ALL '.join(parts), values
+
+# Lignes lues par lot (fetchmany) par les remplissages depuis l'historique
+FETCH_BATCH = 10000
+
+def fetch_batches(cursor, size=FETCH_BATCH):
+    """Résultat du dernier SELECT de `cursor`, lu par lots de `size` lignes"""
+    while True:
+        rows = cursor.fetchmany(size)
+        if not rows:
+            return
+        yield rows
+
+def split_days(start, end):
+    """Découpe l'intervalle [start, end[ (datetimes naïfs) à minuit : [(jour ISO, secondes)]"""
+    chunks = []
+    while start < end:
+        next_midnight = datetime.combine(start.date() + timedelta(days=1), datetime.min.time())
+        chunk_end = min(end, next_midnight)
+        chunks.append((start.date().isoformat(), (chunk_end - start).total_seconds()))
+        start = chunk_end
+    return chunks
+
+def top_users(stats, limit=10):
+    """Membres d'un résultat de get_range_stats classés par temps total : [{'member', 'total_time'}]"""
+    ranking = sorted(stats.items(), key=lambda item: item[1]['total_time'], reverse=True)
+    return [{'member': member_name, 'total_time': entry['total_time']} for member_name, entry in ranking[:limit]]
+
+# Périodes nommées des statistiques
+PERIODS = ('today', 'week', 'month', 'year')
+
+# Regroupements de get_range_stats
+RANGE_GROUP_BY = ('member', 'channel', 'day')
+
+def period_days(period, today):
+    """Premier et dernier jour (inclus) d'une période nommée contenant `today`, en ISO"""
+    if period == 'today':
+        first = today
+    elif period == 'week':
+        first = today - timedelta(days=today.weekday())
+    elif period == 'month':
+        first = today.replace(day=1)
+    elif period == 'year':
+        first = today.replace(month=1, day=1)
+    else:
+        raise ValueError(f'Période inconnue : {period}')
+    return first.isoformat(), today.isoformat()
 
 class StatsTracker:
     """Suit les statistiques d'utilisation des vocaux avec persistance SQLite"""
     
-    def __init__(self, db_path=None):
+    def __init__(self, db_path=None, clock=datetime.now):
         self.lock = Lock()
         self.db_path = db_path or DATABASE_PATH
+        # Horloge injectable (horloge simulée lors d'un rejeu)
+        self.clock = clock
         
         # Sessions actives en mémoire
         self.active_sessions = {}
         
+        # Sessions récupérées au démarrage, en attente de la première synchronisation,
+        # et dernier instant connu avant l'arrêt (fin des sessions non reprises)
+        self.recovering = False
+        self.last_alive = None
+        self.last_alive_save = None
+        
+        # Segments enregistrés qu'un segment à venir peut encore recouvrir (co-présence)
+        self.recent_segments = RecentSegments()
+        
+        # Jour courant (pour découper les cumuls d'états à minuit)
+        self.current_day = self.clock().date()
+        
         # Initialiser la base de données
         self._init_database()
         
@@ -26,7 +155,7 @@ class StatsTracker:
     def _init_database(self):
         """Crée les tables si elles n'existent pas"""
         with self.lock:
-            conn = sqlite3.connect(self.db_path)
+            conn = sqlite_connect(self.db_path)
             cursor = conn.cursor()
             
             # Table des sessions complètes
@@ -43,6 +172,14 @@ class StatsTracker:
                 )
             ''')
             
+            # Dernier instant où le bot tournait (clé 'last_alive'), lu au redémarrage
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS tracker_state (
+                    key TEXT PRIMARY KEY,
+                    value TEXT
+                )
+            ''')
+            
             # Table des records
             cursor.execute('''
                 CREATE TABLE IF NOT EXISTS records (
@@ -55,6 +192,111 @@ class StatsTracker:
                 )
             ''')
             
+            # Table de cumul du temps passé dans chaque état vocal (par jour)
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS state_durations (
+                    member_name TEXT NOT NULL,
+                    day TEXT NOT NULL,
+                    state TEXT NOT NULL,
+                    duration REAL DEFAULT 0,
+                    PRIMARY KEY (member_name, day, state)
+                )
+            ''')
+            
+            # Passages dans chaque salon (une session = un segment par salon visité)
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS session_segments (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    session_id INTEGER,
+                    member_name TEXT NOT NULL,
+                    channel TEXT NOT NULL,
+                    start_ts REAL NOT NULL,
+                    end_ts REAL NOT NULL
+                )
+            ''')
+            
+            # Temps passé ensemble par paire de membres (member_a < member_b) et par salon
+            cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'copresence'")
+            new_copresence = cursor.fetchone() is None
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS copresence (
+                    member_a TEXT NOT NULL,
+                    member_b TEXT NOT NULL,
+                    channel TEXT NOT NULL,
+                    seconds REAL DEFAULT 0,
+                    PRIMARY KEY (member_a, member_b, channel)
+                )
+            ''')
+            
+            # Tables cumulées, remplies depuis l'historique à leur création
+            cursor.execute('''
+                SELECT name FROM sqlite_master
+                WHERE type = 'table' AND name IN ('duration_buckets', 'duration_buckets_monthly', 'daily_activity',
+                                                  'monthly_activity', 'state_durations_monthly')
+            ''')
+            existing = {row[0] for row in cursor.fetchall()}
+            
+            # Histogrammes des durées par jour et par mois (classes logarithmiques, voir
+            # sketches.py) : sessions par membre (scope 'member'), passages par salon (scope 'channel')
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS duration_buckets (
+                    scope TEXT NOT NULL,
+                    name TEXT NOT NULL,
+                    day TEXT NOT NULL,
+                    bucket INTEGER NOT NULL,
+                    count INTEGER DEFAULT 0,
+                    seconds REAL DEFAULT 0,
+                    PRIMARY KEY (scope, name, day, bucket)
+                )
+            ''')
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS duration_buckets_monthly (
+                    scope TEXT NOT NULL,
+                    name TEXT NOT NULL,
+                    month TEXT NOT NULL,
+                    bucket INTEGER NOT NULL,
+                    count INTEGER DEFAULT 0,
+                    seconds REAL DEFAULT 0,
+                    PRIMARY KEY (scope, name, month, bucket)
+                )
+            ''')
+            
+            # Activité par jour, membre et salon : temps passé (découpé à minuit),
+            # sessions commencées (comptées dans leur premier salon) et passages commencés
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS daily_activity (
+                    day TEXT NOT NULL,
+                    member_name TEXT NOT NULL,
+                    channel TEXT NOT NULL,
+                    seconds REAL DEFAULT 0,
+                    sessions INTEGER DEFAULT 0,
+                    visits INTEGER DEFAULT 0,
+                    PRIMARY KEY (day, member_name, channel)
+                )
+            ''')
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS monthly_activity (
+                    month TEXT NOT NULL,
+                    member_name TEXT NOT NULL,
+                    channel TEXT NOT NULL,
+                    seconds REAL DEFAULT 0,
+                    sessions INTEGER DEFAULT 0,
+                    visits INTEGER DEFAULT 0,
+                    PRIMARY KEY (month, member_name, channel)
+                )
+            ''')
+            
+            # Cumul mensuel de state_durations
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS state_durations_monthly (
+                    member_name TEXT NOT NULL,
+                    month TEXT NOT NULL,
+                    state TEXT NOT NULL,
+                    duration REAL DEFAULT 0,
+                    PRIMARY KEY (member_name, month, state)
+                )
+            ''')
+            
             # Initialiser les records s'ils n'existent pas
             record_types = ['longest_session_today', 'longest_session_week', 
                           'longest_session_month', 'longest_session_ever']
@@ -68,107 +310,549 @@ class StatsTracker:
             cursor.execute('CREATE INDEX IF NOT EXISTS idx_member_name ON sessions(member_name)')
             cursor.execute('CREATE INDEX IF NOT EXISTS idx_start_time ON sessions(start_time)')
             cursor.execute('CREATE INDEX IF NOT EXISTS idx_is_active ON sessions(is_active)')
+            cursor.execute('CREATE INDEX IF NOT EXISTS idx_state_day ON state_durations(day)')
+            cursor.execute('CREATE INDEX IF NOT EXISTS idx_segment_start ON session_segments(start_ts)')
+            cursor.execute('CREATE INDEX IF NOT EXISTS idx_copresence_b ON copresence(member_b)')
+            cursor.execute('CREATE INDEX IF NOT EXISTS idx_duration_day ON duration_buckets(scope, day)')
+            cursor.execute('CREATE INDEX IF NOT EXISTS idx_duration_month ON duration_buckets_monthly(scope, month)')
+            cursor.execute('CREATE INDEX IF NOT EXISTS idx_state_month ON state_durations_monthly(month)')
+            # Historique par membre : ses jours, ses mois, ses sessions
+            cursor.execute('CREATE INDEX IF NOT EXISTS idx_activity_member ON daily_activity(member_name, day)')
+            cursor.execute('CREATE INDEX IF NOT EXISTS idx_activity_member_month ON monthly_activity(member_name, month)')
+            cursor.execute('CREATE INDEX IF NOT EXISTS idx_sessions_member_start ON sessions(member_name, start_time, duration)')
+            
+            self._backfill_segments(cursor)
+            if new_copresence:
+                self._backfill_copresence(cursor)
+            if 'duration_buckets' not in existing:
+                self._backfill_duration_buckets(cursor)
+            if 'duration_buckets_monthly' not in existing:
+                self._backfill_monthly_durations(cursor)
+            if 'daily_activity' not in existing:
+                self._backfill_daily_activity(cursor)
+            if 'monthly_activity' not in existing:
+                self._backfill_monthly_activity(cursor)
+            if 'state_durations_monthly' not in existing:
+                self._backfill_monthly_states(cursor)
             
             conn.commit()
             conn.close()
     
+    def _backfill_segments(self, cursor):
+        """
+        Segments des sessions enregistrées avant la table session_segments :
+        les heures de passage d'un salon à l'autre n'ont pas été gardées, la
+        session entière est attribuée au premier salon
+        """
+        cursor.execute('SELECT 1 FROM session_segments LIMIT 1')
+        if cursor.fetchone():
+            return
+        cursor.execute('''
+            INSERT INTO session_segments (session_id, member_name, channel, start_ts, end_ts)
+            SELECT id, member_name, COALESCE(json_extract(channels, '$[0]'), 'Unknown'),
+                   (julianday(start_time) - 2440587.5) * 86400.0,
+                   (julianday(end_time) - 2440587.5) * 86400.0
+            FROM sessions
+            WHERE is_active = 0 AND end_time IS NOT NULL
+            ORDER BY start_time
+        ''')
+        if cursor.rowcount > 0:
+            print(f"📊 {cursor.rowcount} segments de session reconstitués")
+    
+    def _backfill_copresence(self, cursor):
+        """
+        Co-présence des segments déjà enregistrés : lus par lots, triés par salon,
+        un salon balayé et écrit à la fois (seul le salon courant est en mémoire)
+        """
+        writer = cursor.connection.cursor()
+        cursor.execute('SELECT member_name, channel, start_ts, end_ts FROM session_segments ORDER BY channel')
+        pairs = 0
+        for _, segments in groupby(chain.from_iterable(fetch_batches(cursor)), key=itemgetter(1)):
+            overlaps = sweep_overlaps(segments)
+            self._flush_copresence(writer, overlaps)
+            pairs += len(overlaps)
+        if pairs:
+            print(f"📊 Co-présence calculée pour {pairs} paires (membres, salon)")
+    
+    def _flush_copresence(self, cursor, overlaps):
+        """Ajoute des secondes ensemble {(membre a, membre b, salon): secondes} à la table"""
+        cursor.executemany('''
+            INSERT INTO copresence (member_a, member_b, channel, seconds)
+            VALUES (?, ?, ?, ?)
+            ON CONFLICT(member_a, member_b, channel) DO UPDATE SET seconds = seconds + excluded.seconds
+        ''', [(member_a, member_b, channel, seconds) for (member_a, member_b, channel), seconds in overlaps.items()])
+    
+    def _backfill_duration_buckets(self, cursor):
+        """Histogrammes par jour des sessions et segments déjà enregistrés"""
+        cursor.connection.create_function('duration_bucket', 1, bucket_of)
+        cursor.execute('''
+            INSERT INTO duration_buckets (scope, name, day, bucket, count, seconds)
+            SELECT 'member', member_name, DATE(start_time), duration_bucket(duration), COUNT(*), SUM(duration)
+            FROM sessions
+            WHERE is_active = 0 AND duration IS NOT NULL
+            GROUP BY member_name, DATE(start_time), duration_bucket(duration)
+        ''')
+        cursor.execute('''
+            INSERT INTO duration_buckets (scope, name, day, bucket, count, seconds)
+            SELECT 'channel', channel, DATE(start_ts, 'unixepoch'), duration_bucket(end_ts - start_ts),
+                   COUNT(*), SUM(end_ts - start_ts)
+            FROM session_segments
+            GROUP BY channel, DATE(start_ts, 'unixepoch'), duration_bucket(end_ts - start_ts)
+        ''')
+    
+    def _backfill_monthly_durations(self, cursor):
+        """Cumuls mensuels des histogrammes quotidiens"""
+        cursor.execute('''
+            INSERT INTO duration_buckets_monthly (scope, name, month, bucket, count, seconds)
+            SELECT scope, name, SUBSTR(day, 1, 7), bucket, SUM(count), SUM(seconds)
+            FROM duration_buckets
+            GROUP BY scope, name, SUBSTR(day, 1, 7), bucket
+        ''')
+    
+    def _add_durations(self, cursor, durations):
+        """Ajoute des durées [(scope, nom, jour, secondes)] aux histogrammes du jour et du mois"""
+        rows = [(scope, name, day, bucket_of(seconds), seconds) for scope, name, day, seconds in durations]
+        cursor.executemany('''
+            INSERT INTO duration_buckets (scope, name, day, bucket, count, seconds)
+            VALUES (?, ?, ?, ?, 1, ?)
+            ON CONFLICT(scope, name, day, bucket) DO UPDATE
+            SET count = count + 1, seconds = seconds + excluded.seconds
+        ''', rows)
+        cursor.executemany('''
+            INSERT INTO duration_buckets_monthly (scope, name, month, bucket, count, seconds)
+            VALUES (?, ?, SUBSTR(?, 1, 7), ?, 1, ?)
+            ON CONFLICT(scope, name, month, bucket) DO UPDATE
+            SET count = count + 1, seconds = seconds + excluded.seconds
+        ''', rows)
+    
+    def _backfill_daily_activity(self, cursor):
+        """Activité par jour des segments et sessions déjà enregistrés"""
+        # Segments sur un seul jour : agrégés en SQL ; les autres sont découpés à minuit
+        cursor.execute('''
+            INSERT INTO daily_activity (day, member_name, channel, seconds, sessions, visits)
+            SELECT DATE(start_ts, 'unixepoch'), member_name, channel, SUM(end_ts - start_ts), 0, COUNT(*)
+            FROM session_segments
+            WHERE CAST(start_ts / 86400 AS INTEGER) = CAST(end_ts / 86400 AS INTEGER)
+            GROUP BY DATE(start_ts, 'unixepoch'), member_name, channel
+        ''')
+        # Lus et ajoutés par lots (les ajouts s'additionnent), écrits par un second curseur
+        writer = cursor.connection.cursor()
+        cursor.execute('''
+            SELECT member_name, channel, start_ts, end_ts
+            FROM session_segments
+            WHERE CAST(start_ts / 86400 AS INTEGER) != CAST(end_ts / 86400 AS INTEGER)
+        ''')
+        for rows in fetch_batches(cursor):
+            activity = defaultdict(lambda: [0.0, 0, 0])
+            for member_name, channel, start_ts, end_ts in rows:
+                start, end = LOCAL_EPOCH + timedelta(seconds=start_ts), LOCAL_EPOCH + timedelta(seconds=end_ts)
+                activity[(start.date().isoformat(), member_name, channel)][2] += 1
+                for day, seconds in split_days(start, end):
+                    activity[(day, member_name, channel)][0] += seconds
+            self._upsert_activity(writer, 'daily_activity', 'day', [key + tuple(row) for key, row in activity.items()])
+        
+        # Sessions : comptées le jour de leur arrivée, dans leur premier salon (celui
+        # de leur premier segment ; à défaut, le premier de la liste channels)
+        cursor.execute('''
+            SELECT DATE(s.start_time), s.member_name,
+                   COALESCE(f.channel, json_extract(s.channels, '$[0]'), 'Unknown') AS first_channel, 0, COUNT(*), 0
+            FROM sessions s
+            LEFT JOIN (
+                SELECT session_id, channel, MIN(id) FROM session_segments GROUP BY session_id
+            ) f ON f.session_id = s.id
+            WHERE s.is_active = 0 AND s.end_time IS NOT NULL
+            GROUP BY DATE(s.start_time), s.member_name, first_channel
+        ''')
+        for rows in fetch_batches(cursor):
+            self._upsert_activity(writer, 'daily_activity', 'day', rows)
+    
+    def _backfill_monthly_activity(self, cursor):
+        """Cumuls mensuels de l'activité quotidienne"""
+        cursor.execute('''
+            INSERT INTO monthly_activity (month, member_name, channel, seconds, sessions, visits)
+            SELECT SUBSTR(day, 1, 7), member_name, channel, SUM(seconds), SUM(sessions), SUM(visits)
+            FROM daily_activity
+            GROUP BY SUBSTR(day, 1, 7), member_name, channel
+        ''')
+    
+    def _backfill_monthly_states(self, cursor):
+        """Cumuls mensuels des durées d'états"""
+        cursor.execute('''
+            INSERT INTO state_durations_monthly (member_name, month, state, duration)
+            SELECT member_name, SUBSTR(day, 1, 7), state, SUM(duration)
+            FROM state_durations
+            GROUP BY member_name, SUBSTR(day, 1, 7), state
+        ''')
+    
+    def _upsert_activity(self, cursor, table, column, rows):
+        """Ajoute des lignes [(jour ou mois, membre, salon, secondes, sessions, passages)] à une table d'activité"""
+        cursor.executemany(f'''
+            INSERT INTO {table} ({column}, member_name, channel, seconds, sessions, visits)
+            VALUES (?, ?, ?, ?, ?, ?)
+            ON CONFLICT({column}, member_name, channel) DO UPDATE
+            SET seconds = seconds + excluded.seconds, sessions = sessions + excluded.sessions,
+                visits = visits + excluded.visits
+        ''', rows)
+    
+    def _session_activity(self, visits):
+        """
+        Activité d'une session à partir de ses passages [(salon, début, fin)] :
+        {(jour, salon): [secondes, sessions, passages]}
+        """
+        activity = defaultdict(lambda: [0.0, 0, 0])
+        for index, (channel, start, end) in enumerate(visits):
+            row = activity[(start.date().isoformat(), channel)]
+            row[2] += 1
+            if index == 0:
+                row[1] += 1
+            for day, seconds in split_days(start, end):
+                activity[(day, channel)][0] += seconds
+        return activity
+    
+    def _add_activity(self, cursor, member_name, visits):
+        """Ajoute l'activité d'une session terminée aux tables du jour et du mois"""
+        rows = [(day, member_name, channel, *row) for (day, channel), row in self._session_activity(visits).items()]
+        self._upsert_activity(cursor, 'daily_activity', 'day', rows)
+        self._upsert_activity(cursor, 'monthly_activity', 'month', [(row[0][:7],) + row[1:] for row in rows])
+    
+    def _prune_recent_segments(self, now):
+        """Les segments à venir commencent au plus tôt à l'arrivée de la plus ancienne session en cours"""
+        horizon = min((session['join_time'] for session in self.active_sessions.values()), default=now)
+        self.recent_segments.prune(local_seconds(horizon))
+    
     def _load_active_sessions(self):
         """Charge les sessions actives depuis la DB (récupération après crash)"""
         with self.lock:
-            conn = sqlite3.connect(self.db_path)
+            conn = sqlite_connect(self.db_path)
             cursor = conn.cursor()
             
             cursor.execute('''
-                SELECT member_name, start_time, channels
+                SELECT id, member_name, start_time, channels
                 FROM sessions
                 WHERE is_active = 1 AND end_time IS NULL
             ''')
             
             for row in cursor.fetchall():
-                member_name, start_time, channels_json = row
+                session_id, member_name, start_time, channels_json = row
                 channels = json.loads(channels_json) if channels_json else []
+                join_time = datetime.fromisoformat(start_time)
                 
                 self.active_sessions[member_name] = {
+                    'session_id': session_id,
                     'channel': channels[-1] if channels else 'Unknown',
-                    'join_time': datetime.fromisoformat(start_time),
-                    'channel_changes': []
+                    'join_time': join_time,
+                    'channel_changes': [],
+                    'segment_start': join_time,
+                    'segments': [],
+                    # États inconnus jusqu'à la reprise par member_joined
+                    'states': {},
+                    'state_time': {},
+                    'recovered': True
                 }
+            self.recovering = bool(self.active_sessions)
+            
+            # Dernier instant connu avant l'arrêt : dernier « alive » enregistré, ou
+            # à défaut dernière arrivée ou fin de session en base
+            if self.active_sessions:
+                cursor.execute('''
+                    SELECT MAX(value) FROM (
+                        SELECT value FROM tracker_state WHERE key = 'last_alive'
+                        UNION ALL SELECT MAX(start_time) FROM sessions
+                        UNION ALL SELECT MAX(end_time) FROM sessions
+                    )
+                ''')
+                last_alive = cursor.fetchone()[0]
+                self.last_alive = datetime.fromisoformat(last_alive) if last_alive else None
+            
+            # Segments que ces sessions peuvent encore recouvrir
+            if self.active_sessions:
+                horizon = min(session['join_time'] for session in self.active_sessions.values())
+                cursor.execute('''
+                    SELECT member_name, channel, start_ts, end_ts
+                    FROM session_segments
+                    WHERE end_ts > ?
+                ''', (local_seconds(horizon),))
+                self.recent_segments.insert(cursor.fetchall())
             
             conn.close()
             
             if self.active_sessions:
                 print(f"📊 {len(self.active_sessions)} sessions actives récupérées")
     
-    def member_joined(self, member_name, channel_name):
-        """Enregistre qu'un membre a rejoint un vocal"""
+    @traced()
+    @timed(QUERY_SECONDS)
+    def member_joined(self, member_name, channel_name, states=None):
+        """Enregistre qu'un membre a rejoint un vocal
+        
+        Args:
+            member_name: Nom du membre
+            channel_name: Salon rejoint
+            states: États vocaux actifs à l'arrivée (ex: ['muted', 'stream'])
+        """
         with self.lock:
-            now = datetime.now()
+            now = self.clock()
+            
+            # Membre déjà en vocal au redémarrage : reprise de sa session récupérée
+            recovered = self.active_sessions.get(member_name)
+            if recovered is not None and recovered.pop('recovered', False):
+                self._resume_session(recovered, channel_name, states, now)
+                return
             
             # Mémoire
-            self.active_sessions[member_name] = {
+            session = self.active_sessions[member_name] = {
+                'session_id': None,
                 'channel': channel_name,
                 'join_time': now,
-                'channel_changes': []
+                'channel_changes': [],
+                'segment_start': now,
+                'segments': [],
+                'states': {state: now for state in (states or []) if state in TRACKED_STATES},
+                'state_time': {}
             }
             
             # Base de données
-            conn = sqlite3.connect(self.db_path)
+            conn = sqlite_connect(self.db_path)
             cursor = conn.cursor()
             
             cursor.execute('''
                 INSERT INTO sessions (member_name, start_time, channels, is_active)
                 VALUES (?, ?, ?, 1)
             ''', (member_name, now.isoformat(), json.dumps([channel_name])))
+            session['session_id'] = cursor.lastrowid
             
             conn.commit()
             conn.close()
     
+    def _resume_session(self, session, channel_name, states, now):
+        """
+        Reprend une session récupérée : passage dans le salon actuel s'il a
+        changé pendant l'arrêt, et états ouverts selon le vocal actuel
+        """
+        if channel_name != session['channel']:
+            session['channel_changes'].append({'from': session['channel'], 'to': channel_name, 'time': now.isoformat()})
+            session['segments'].append((session['channel'], session['segment_start'], now))
+            session['segment_start'] = now
+            session['channel'] = channel_name
+        active = set(states or [])
+        for state in TRACKED_STATES:
+            self._set_state(session, state, state in active, now)
+    
+    def end_recovery(self):
+        """
+        Fin de la première synchronisation après le démarrage : les sessions
+        récupérées qui n'ont pas été reprises (membre parti pendant l'arrêt)
+        sont terminées au dernier instant connu avant l'arrêt
+        """
+        if not self.recovering:
+            return
+        with self.lock:
+            self.recovering = False
+            stale = [name for name, session in self.active_sessions.items() if session.get('recovered')]
+            for member_name in stale:
+                session = self.active_sessions[member_name]
+                self._end_session(member_name, max(self.last_alive or session['join_time'], session['join_time']))
+            if stale:
+                print(f"📊 {len(stale)} sessions récupérées terminées (membres partis pendant l'arrêt)")
+    
+    def save_alive_if_due(self):
+        """Enregistre l'instant courant toutes les SESSION_ALIVE_INTERVAL secondes (appelée par le heartbeat)"""
+        now = self.clock()
+        if self.last_alive_save is not None and (now - self.last_alive_save).total_seconds() < SESSION_ALIVE_INTERVAL:
+            return
+        self.last_alive_save = now
+        conn = sqlite_connect(self.db_path)
+        conn.execute('''
+            INSERT INTO tracker_state (key, value) VALUES ('last_alive', ?)
+            ON CONFLICT(key) DO UPDATE SET value = excluded.value
+        ''', (now.isoformat(),))
+        conn.commit()
+        conn.close()
+    
+    @traced()
+    @timed(QUERY_SECONDS)
     def member_left(self, member_name):
         """Enregistre qu'un membre a quitté le vocal"""
         with self.lock:
             if member_name not in self.active_sessions:
                 return
-            
-            session = self.active_sessions[member_name]
-            now = datetime.now()
-            duration = (now - session['join_time']).total_seconds()
-            
-            channels = [session['channel']] + [ch['to'] for ch in session['channel_changes']]
-            
-            # Mettre à jour la base de données
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            
-            cursor.execute('''
-                UPDATE sessions
-                SET end_time = ?, duration = ?, channels = ?, is_active = 0
-                WHERE member_name = ? AND is_active = 1 AND end_time IS NULL
-            ''', (now.isoformat(), duration, json.dumps(channels), member_name))
-            
-            conn.commit()
-            conn.close()
-            
-            # Vérifier les records
-            self._check_records(member_name, duration, session['join_time'])
-            
-            # Nettoyer la mémoire
-            del self.active_sessions[member_name]
+            self._end_session(member_name, self.clock())
     
-    def member_moved(self, member_name, from_channel, to_channel):
+    def _end_session(self, member_name, now):
+        """Termine la session active d'un membre à `now` (appelée sous self.lock)"""
+        session = self.active_sessions[member_name]
+        duration = (now - session['join_time']).total_seconds()
+        
+        # Premier salon (le salon courant a changé à chaque déplacement), puis les suivants
+        first_channel = session['segments'][0][0] if session['segments'] else session['channel']
+        channels = [first_channel] + [ch['to'] for ch in session['channel_changes']]
+        
+        # Clôturer les états encore actifs
+        for state, since in session['states'].items():
+            self._accumulate_state(session, state, since, now)
+        session['states'] = {}
+        
+        # Mettre à jour la base de données
+        conn = sqlite_connect(self.db_path)
+        cursor = conn.cursor()
+        
+        self._flush_state_time(cursor, member_name, session)
+        
+        # Segments : salons quittés pendant la session, puis le dernier
+        visits = session['segments'] + [(session['channel'], session['segment_start'], now)]
+        segments = [(member_name, channel, local_seconds(start), local_seconds(end)) for channel, start, end in visits]
+        cursor.executemany('''
+            INSERT INTO session_segments (session_id, member_name, channel, start_ts, end_ts)
+            VALUES (?, ?, ?, ?, ?)
+        ''', [(session['session_id'],) + segment for segment in segments])
+        
+        # Co-présence avec les segments déjà enregistrés
+        self._flush_copresence(cursor, self.recent_segments.add(segments))
+        
+        # Histogrammes de durées : la session (jour d'arrivée), chaque passage (jour d'entrée)
+        self._add_durations(cursor, [('member', member_name, session['join_time'].date().isoformat(), duration)] + [
+            ('channel', channel, start.date().isoformat(), (end - start).total_seconds())
+            for channel, start, end in visits
+        ])
+        
+        # Activité par jour et par mois
+        self._add_activity(cursor, member_name, visits)
+        
+        cursor.execute('''
+            UPDATE sessions
+            SET end_time = ?, duration = ?, channels = ?, is_active = 0
+            WHERE member_name = ? AND is_active = 1 AND end_time IS NULL
+        ''', (now.isoformat(), duration, json.dumps(channels), member_name))
+        
+        conn.commit()
+        conn.close()
+        
+        # Vérifier les records
+        self._check_records(member_name, duration, session['join_time'])
+        
+        # Nettoyer la mémoire
+        del self.active_sessions[member_name]
+        self._prune_recent_segments(now)
+    
+    def member_moved(self, member_name, from_channel, to_channel, states=None):
         """Enregistre qu'un membre a changé de canal"""
         with self.lock:
             if member_name in self.active_sessions:
-                self.active_sessions[member_name]['channel_changes'].append({
+                now = self.clock()
+                session = self.active_sessions[member_name]
+                session['channel_changes'].append({
                     'from': from_channel,
                     'to': to_channel,
-                    'time': datetime.now().isoformat()
+                    'time': now.isoformat()
                 })
-                self.active_sessions[member_name]['channel'] = to_channel
+                session['segments'].append((session['channel'], session['segment_start'], now))
+                session['segment_start'] = now
+                session['channel'] = to_channel
+                
+                # Resynchroniser les états (un changement pendant le move n'est pas vu ailleurs)
+                if states is not None:
+                    active = set(states)
+                    for state in TRACKED_STATES:
+                        self._set_state(session, state, state in active, now)
+    
+    def member_state_changed(self, member_name, state, active):
+        """Enregistre l'activation/désactivation d'un état vocal (mute, stream...)"""
+        if state not in TRACKED_STATES:
+            return
+        with self.lock:
+            session = self.active_sessions.get(member_name)
+            if session:
+                self._set_state(session, state, active, self.clock())
+    
+    def _set_state(self, session, state, active, now):
+        """Ouvre ou ferme un intervalle d'état dans la session"""
+        since = session['states'].get(state)
+        if active and since is None:
+            session['states'][state] = now
+        elif not active and since is not None:
+            self._accumulate_state(session, state, since, now)
+            del session['states'][state]
+    
+    def _accumulate_state(self, session, state, start, end):
+        """Ajoute un intervalle aux cumuls de la session, découpé par jour"""
+        while start < end:
+            next_midnight = datetime.combine(start.date() + timedelta(days=1), datetime.min.time())
+            chunk_end = min(end, next_midnight)
+            key = (start.date().isoformat(), state)
+            session['state_time'][key] = session['state_time'].get(key, 0) + (chunk_end - start).total_seconds()
+            start = chunk_end
+    
+    def _flush_state_time(self, cursor, member_name, session):
+        """Écrit les cumuls d'états de la session dans la table de rollup"""
+        for (day, state), duration in session['state_time'].items():
+            cursor.execute('''
+                INSERT INTO state_durations (member_name, day, state, duration)
+                VALUES (?, ?, ?, ?)
+                ON CONFLICT(member_name, day, state) DO UPDATE SET duration = duration + excluded.duration
+            ''', (member_name, day, state, duration))
+            cursor.execute('''
+                INSERT INTO state_durations_monthly (member_name, month, state, duration)
+                VALUES (?, SUBSTR(?, 1, 7), ?, ?)
+                ON CONFLICT(member_name, month, state) DO UPDATE SET duration = duration + excluded.duration
+            ''', (member_name, day, state, duration))
+        session['state_time'] = {}
+    
+    def check_day_rollover(self):
+        """Au changement de jour, clôture les cumuls d'états de la veille en base"""
+        with self.lock:
+            now = self.clock()
+            if now.date() == self.current_day:
+                return
+            
+            conn = sqlite_connect(self.db_path)
+            cursor = conn.cursor()
+            
+            for member_name, session in self.active_sessions.items():
+                for state, since in session['states'].items():
+                    self._accumulate_state(session, state, since, now)
+                    session['states'][state] = now
+                self._flush_state_time(cursor, member_name, session)
+            
+            conn.commit()
+            conn.close()
+            self.current_day = now.date()
+    
+    def _get_state_time(self, cursor, start_day=None, end_day=None, member_name=None, now=None):
+        """Temps passé par état et par membre sur une période de jours inclus (en cours inclus)"""
+        union, params = range_union(start_day, end_day, 'state_durations_monthly', 'state_durations',
+                                    'member_name, state, duration',
+                                    ' AND member_name = ?' if member_name else '', [member_name] if member_name else [])
+        cursor.execute(f'''
+            SELECT member_name, state, SUM(duration)
+            FROM ({union})
+            GROUP BY member_name, state
+        ''', params)
+        
+        totals = defaultdict(lambda: dict.fromkeys(TRACKED_STATES, 0))
+        for name, state, duration in cursor.fetchall():
+            if state in TRACKED_STATES:
+                totals[name][state] += duration or 0
+        
+        # Cumuls non encore écrits et intervalles ouverts
+        now = now or self.clock()
+        range_start = datetime.fromisoformat(start_day) if start_day else datetime.min
+        range_end = datetime.fromisoformat(end_day) + timedelta(days=1) if end_day else datetime.max
+        for name, session in self.active_sessions.items():
+            if member_name and name != member_name:
+                continue
+            for (day, state), duration in session['state_time'].items():
+                if (not start_day or day >= start_day) and (not end_day or day <= end_day):
+                    totals[name][state] += duration
+            for state, since in session['states'].items():
+                start, end = max(since, range_start), min(now, range_end)
+                if end > start:
+                    totals[name][state] += (end - start).total_seconds()
+        
+        return totals
     
     def _check_records(self, member_name, duration, join_time):
         """Vérifie et met à jour les records"""
-        now = datetime.now()
-        conn = sqlite3.connect(self.db_path)
+        now = self.clock()
+        conn = sqlite_connect(self.db_path)
         cursor = conn.cursor()
         
         # Record du jour
@@ -229,7 +913,7 @@ class StatsTracker:
     def get_current_sessions(self):
         """Retourne les sessions en cours avec leur durée actuelle"""
         with self.lock:
-            now = datetime.now()
+            now = self.clock()
             current = {}
             for member_name, session in self.active_sessions.items():
                 duration = (now - session['join_time']).total_seconds()
@@ -240,111 +924,292 @@ class StatsTracker:
                 }
             return current
     
-    def get_daily_stats(self, member_name=None):
-        """Retourne les stats du jour"""
+    def get_live_segments(self):
+        """
+        Segments des sessions en cours, pas encore écrits en base :
+        [(membre, salon, début, fin)] en secondes locales (fin = maintenant
+        pour le salon actuel)
+        """
+        with self.lock:
+            now = self.clock()
+            segments = []
+            for member_name, session in self.active_sessions.items():
+                for channel, start, end in session['segments']:
+                    segments.append((member_name, channel, local_seconds(start), local_seconds(end)))
+                segments.append((member_name, session['channel'], local_seconds(session['segment_start']),
+                                 local_seconds(now)))
+            return segments
+    
+    @traced()
+    @timed(QUERY_SECONDS)
+    def get_range_stats(self, start_day=None, end_day=None, group_by='member', name=None):
+        """
+        Stats d'une période, sessions en cours comprises : mois entiers lus dans
+        monthly_activity, jours des mois entamés dans daily_activity
+        
+        Args:
+            start_day, end_day: jours ISO inclus (None = sans limite)
+            group_by: 'member', 'channel' ou 'day'
+            name: un seul membre ou salon (regroupement par membre ou par salon)
+        
+        Returns:
+            par membre : {membre: total_time, session_count, average_session, channels_visited, state_time}
+            par salon : {salon: total_time, session_count (passages), member_count}
+            par jour : {jour: total_time, session_count, member_count}
+        """
+        if group_by not in RANGE_GROUP_BY:
+            raise ValueError(f'Regroupement inconnu : {group_by}')
+        if name is not None and group_by == 'day':
+            raise ValueError('name ne s\'applique qu\'aux regroupements par membre ou par salon')
         with self.lock:
-            today = datetime.now().date().isoformat()
-            conn = sqlite3.connect(self.db_path)
+            conn = sqlite_connect(self.db_path)
             cursor = conn.cursor()
             
-            if member_name:
-                cursor.execute('''
-                    SELECT SUM(duration), COUNT(*), channels
-                    FROM sessions
-                    WHERE member_name = ? AND DATE(start_time) = ? AND is_active = 0
-                ''', (member_name, today))
-            else:
-                cursor.execute('''
-                    SELECT member_name, SUM(duration), COUNT(*), GROUP_CONCAT(channels)
-                    FROM sessions
-                    WHERE DATE(start_time) = ? AND is_active = 0
-                    GROUP BY member_name
-                ''', (today,))
+            now = self.clock()
+            live = self._live_activity(now, start_day, end_day)
+            if name is not None:
+                live = {key: row for key, row in live.items() if name == (key[1] if group_by == 'member' else key[2])}
             
-            results = {}
-            for row in cursor.fetchall():
-                if member_name:
-                    total_time, session_count, channels_json = row
-                    name = member_name
-                else:
-                    name, total_time, session_count, channels_json = row
-                
-                # Extraire les canaux uniques
-                channels_visited = set()
-                if channels_json:
-                    for ch_list in channels_json.split(','):
-                        try:
-                            channels_visited.update(json.loads(ch_list))
-                        except:
-                            pass
+            if group_by == 'day':
+                results = self._get_days_activity(cursor, start_day, end_day, live)
+            else:
+                # Une ligne par (membre, salon) ou (salon, membre)
+                key, other = ('member_name', 'channel') if group_by == 'member' else ('channel', 'member_name')
+                union, params = range_union(start_day, end_day, 'monthly_activity', 'daily_activity',
+                                            f'{key}, {other}, seconds, sessions, visits',
+                                            f' AND {key} = ?' if name is not None else '',
+                                            [name] if name is not None else [])
+                cursor.execute(f'''
+                    SELECT {key}, {other}, SUM(seconds), SUM(sessions), SUM(visits)
+                    FROM ({union})
+                    GROUP BY {key}, {other}
+                ''', params)
+                activity = {(row[0], row[1]): list(row[2:]) for row in cursor.fetchall()}
+                for (day, member_name, channel), row in live.items():
+                    pair = (member_name, channel) if group_by == 'member' else (channel, member_name)
+                    total = activity.setdefault(pair, [0.0, 0, 0])
+                    for index, value in enumerate(row):
+                        total[index] += value
                 
-                # Ajouter le temps de la session en cours si elle existe
-                current_duration = 0
-                if name in self.active_sessions:
-                    now = datetime.now()
-                    current_duration = (now - self.active_sessions[name]['join_time']).total_seconds()
-                    total_time = (total_time or 0) + current_duration
-                    session_count = (session_count or 0) + 1
-                    channels_visited.add(self.active_sessions[name]['channel'])
+                results = {}
+                for (row_name, row_other), (seconds, sessions, visits) in activity.items():
+                    entry = results.setdefault(row_name, {'total_time': 0, 'session_count': 0, 'others': []})
+                    entry['total_time'] += seconds or 0
+                    entry['session_count'] += (sessions if group_by == 'member' else visits) or 0
+                    entry['others'].append(row_other)
                 
-                results[name] = {
-                    'total_time': total_time or 0,
-                    'session_count': session_count or 0,
-                    'average_session': (total_time / session_count) if session_count and total_time else 0,
-                    'channels_visited': list(channels_visited)
-                }
+                if group_by == 'member':
+                    state_time = self._get_state_time(cursor, start_day, end_day, name, now)
+                    for row_name, entry in results.items():
+                        entry['average_session'] = (entry['total_time'] / entry['session_count']
+                                                    if entry['session_count'] else 0)
+                        entry['channels_visited'] = sorted(entry.pop('others'))
+                        entry['state_time'] = state_time.get(row_name, dict.fromkeys(TRACKED_STATES, 0))
+                else:
+                    for entry in results.values():
+                        entry['member_count'] = len(entry.pop('others'))
             
             conn.close()
-            return results if not member_name else results.get(member_name, self._empty_stats())
+            return results
+    
+    def _live_activity(self, now, start_day=None, end_day=None, member_name=None):
+        """
+        Activité des sessions en cours sur la période, découpée comme elle le
+        sera à leur fin : {(jour, membre, salon): [secondes, sessions, passages]}
+        """
+        live = {}
+        for name, session in self.active_sessions.items():
+            if member_name and name != member_name:
+                continue
+            visits = session['segments'] + [(session['channel'], session['segment_start'], now)]
+            for (day, channel), row in self._session_activity(visits).items():
+                if (not start_day or day >= start_day) and (not end_day or day <= end_day):
+                    live[(day, name, channel)] = row
+        return live
+    
+    def _get_days_activity(self, cursor, start_day, end_day, live):
+        """
+        Totaux par jour de get_range_stats (table quotidienne seule), sessions en
+        cours comprises. La même requête compte aussi, par jour, les membres en
+        session déjà présents dans la table, pour ne compter qu'une fois chaque membre
+        """
+        live_days = defaultdict(set)
+        for day, member_name, _ in live:
+            live_days[day].add(member_name)
+        pairs = [(day, member_name) for day, members in live_days.items() for member_name in members]
+        # Second membre de l'union : membres en session déjà dans la table ce jour-là
+        # (recherche par clé primaire jour, membre)
+        already_counted = (f'''
+            UNION ALL
+            SELECT live.column1, 0, 0, 0, COUNT(DISTINCT live.column2)
+            FROM (VALUES {', '.join(['(?, ?)'] * len(pairs))}) AS live
+            JOIN daily_activity a ON a.day = live.column1 AND a.member_name = live.column2
+            GROUP BY live.column1''' if pairs else '')
+        cursor.execute(f'''
+            SELECT day, SUM(seconds), SUM(sessions), COUNT(DISTINCT member_name), 0
+            FROM daily_activity
+            WHERE day BETWEEN ? AND ?
+            GROUP BY day{already_counted}
+        ''', [start_day or '0000-01-01', end_day or '9999-12-31'] + [value for pair in pairs for value in pair])
+        results = {}
+        for day, seconds, sessions, members, counted in cursor.fetchall():
+            entry = results.setdefault(day, {'total_time': 0, 'session_count': 0,
+                                             'member_count': len(live_days.get(day, ()))})
+            entry['total_time'] += seconds or 0
+            entry['session_count'] += sessions or 0
+            entry['member_count'] += members - counted
+        
+        for (day, _, _), (seconds, sessions, _) in live.items():
+            entry = results.setdefault(day, {'total_time': 0, 'session_count': 0,
+                                             'member_count': len(live_days[day])})
+            entry['total_time'] += seconds
+            entry['session_count'] += sessions
+        return dict(sorted(results.items()))
+    
+    def get_daily_stats(self, member_name=None):
+        """Retourne les stats du jour"""
+        today = self.clock().date().isoformat()
+        stats = self.get_range_stats(today, today, 'member', member_name)
+        return stats if not member_name else stats.get(member_name, self._empty_stats())
     
     def get_weekly_stats(self, member_name=None):
         """Retourne les stats de la semaine"""
+        start_day, end_day = period_days('week', self.clock().date())
+        stats = self.get_range_stats(start_day, end_day, 'member', member_name)
+        return stats if not member_name else stats.get(member_name, self._empty_stats())
+    
+    @traced()
+    @timed(QUERY_SECONDS)
+    def get_member_history(self, member_name, start_day=None, end_day=None, longest=10, before=None, limit=50):
+        """
+        Historique vocal d'un membre sur une période de jours inclus (None = sans
+        limite), session en cours comprise
+        
+        Args:
+            longest: nombre de sessions les plus longues
+            before: page des sessions commencées avant cet horodatage ISO
+                (next_before de la page précédente)
+            limit: sessions par page
+        
+        Returns:
+            dict (summary, daily, channels, longest_sessions, sessions, next_before),
+            ou None si le membre n'a jamais été en vocal
+        """
         with self.lock:
-            now = datetime.now()
-            week_start = (now - timedelta(days=now.weekday())).date().isoformat()
-            
-            conn = sqlite3.connect(self.db_path)
+            conn = sqlite_connect(self.db_path)
             cursor = conn.cursor()
             
-            if member_name:
-                cursor.execute('''
-                    SELECT SUM(duration), COUNT(*), channels
-                    FROM sessions
-                    WHERE member_name = ? AND DATE(start_time) >= ? AND is_active = 0
-                ''', (member_name, week_start))
-            else:
-                cursor.execute('''
-                    SELECT member_name, SUM(duration), COUNT(*), GROUP_CONCAT(channels)
-                    FROM sessions
-                    WHERE DATE(start_time) >= ? AND is_active = 0
-                    GROUP BY member_name
-                ''', (week_start,))
+            cursor.execute('SELECT 1 FROM sessions WHERE member_name = ? LIMIT 1', (member_name,))
+            if cursor.fetchone() is None and member_name not in self.active_sessions:
+                conn.close()
+                return None
             
-            results = {}
-            for row in cursor.fetchall():
-                if member_name:
-                    total_time, session_count, channels_json = row
-                    name = member_name
-                else:
-                    name, total_time, session_count, channels_json = row
-                
-                channels_visited = set()
-                if channels_json:
-                    for ch_list in channels_json.split(','):
-                        try:
-                            channels_visited.update(json.loads(ch_list))
-                        except:
-                            pass
-                
-                results[name] = {
-                    'total_time': total_time or 0,
-                    'session_count': session_count or 0,
-                    'average_session': (total_time / session_count) if session_count and total_time else 0,
-                    'channels_visited': list(channels_visited)
-                }
+            now = self.clock()
+            live = self._live_activity(now, start_day, end_day, member_name)
+            
+            # Totaux par jour (index idx_activity_member)
+            cursor.execute('''
+                SELECT day, SUM(seconds), SUM(sessions)
+                FROM daily_activity
+                WHERE member_name = ? AND day BETWEEN ? AND ?
+                GROUP BY day
+            ''', (member_name, start_day or '0000-01-01', end_day or '9999-12-31'))
+            daily = {day: [seconds or 0, sessions or 0] for day, seconds, sessions in cursor.fetchall()}
+            
+            # Totaux par salon : mois entiers et jours des mois entamés
+            union, params = range_union(start_day, end_day, 'monthly_activity', 'daily_activity',
+                                        'channel, seconds, visits', ' AND member_name = ?', [member_name])
+            cursor.execute(f'''
+                SELECT channel, SUM(seconds), SUM(visits)
+                FROM ({union})
+                GROUP BY channel
+            ''', params)
+            channels = {channel: [seconds or 0, visits or 0] for channel, seconds, visits in cursor.fetchall()}
+            
+            for (day, _, channel), (seconds, sessions, visits) in live.items():
+                day_total = daily.setdefault(day, [0, 0])
+                day_total[0] += seconds
+                day_total[1] += sessions
+                channel_total = channels.setdefault(channel, [0, 0])
+                channel_total[0] += seconds
+                channel_total[1] += visits
+            
+            state_time = self._get_state_time(cursor, start_day, end_day, member_name, now)[member_name]
+            
+            # Sessions terminées les plus longues : triées dans l'index
+            # idx_sessions_member_start (durée comprise), seules les gagnantes sont lues
+            first = start_day or ''
+            after_last = (date.fromisoformat(end_day) + timedelta(days=1)).isoformat() if end_day else '9999'
+            cursor.execute('''
+                SELECT id, start_time, end_time, duration, channels, is_active
+                FROM sessions
+                WHERE id IN (
+                    SELECT id FROM sessions
+                    WHERE member_name = ? AND start_time >= ? AND start_time < ? AND duration IS NOT NULL
+                    ORDER BY duration DESC
+                    LIMIT ?
+                )
+                ORDER BY duration DESC
+            ''', (member_name, first, after_last, longest))
+            longest_sessions = [self._session_row(member_name, row, now) for row in cursor.fetchall()]
+            
+            # Page de sessions, les plus récentes d'abord ; un membre n'a qu'une session
+            # à la fois, son heure de début suffit à reprendre la liste
+            cursor.execute('''
+                SELECT id, start_time, end_time, duration, channels, is_active
+                FROM sessions
+                WHERE member_name = ? AND start_time >= ? AND start_time < ?
+                ORDER BY start_time DESC
+                LIMIT ?
+            ''', (member_name, first, min(after_last, before) if before else after_last, limit + 1))
+            sessions = [self._session_row(member_name, row, now) for row in cursor.fetchall()]
             
             conn.close()
-            return results if not member_name else results.get(member_name, self._empty_stats())
+        
+        # La session en cours peut figurer parmi les plus longues
+        current = next((session for session in sessions if session['active']), None)
+        if current and not before:
+            longest_sessions = sorted(longest_sessions + [current], key=lambda x: x['duration'], reverse=True)[:longest]
+        
+        total_time = sum(seconds for seconds, _ in daily.values())
+        session_count = sum(count for _, count in daily.values())
+        return {
+            'summary': {
+                'total_time': total_time,
+                'session_count': session_count,
+                'average_session': total_time / session_count if session_count else 0,
+                'active_days': sum(1 for seconds, _ in daily.values() if seconds > 0),
+                'state_time': state_time
+            },
+            'daily': [{'day': day, 'total_time': seconds, 'session_count': count}
+                      for day, (seconds, count) in sorted(daily.items())],
+            'channels': [{'channel': channel, 'total_time': seconds, 'visits': visits}
+                         for channel, (seconds, visits) in sorted(channels.items(), key=lambda x: x[1][0], reverse=True)],
+            'longest_sessions': longest_sessions,
+            'sessions': sessions[:limit],
+            'next_before': sessions[limit - 1]['start_time'] if len(sessions) > limit else None
+        }
+    
+    def _session_row(self, member_name, row, now):
+        """Ligne de la table sessions pour l'API ; durée actuelle pour la session en cours"""
+        session_id, start_time, end_time, duration, channels_json, is_active = row
+        try:
+            channels = json.loads(channels_json) if channels_json else []
+        except ValueError:
+            channels = []
+        session = self.active_sessions.get(member_name) if is_active else None
+        active = session is not None and session['session_id'] == session_id
+        if active:
+            duration = (now - session['join_time']).total_seconds()
+            channels = list(dict.fromkeys([visit[0] for visit in session['segments']] + [session['channel']]))
+        return {
+            'id': session_id,
+            'start_time': start_time,
+            'end_time': end_time,
+            'duration': duration,
+            'channels': channels,
+            'active': active
+        }
     
     def _empty_stats(self):
         """Retourne des stats vides"""
@@ -352,60 +1217,139 @@ class StatsTracker:
             'total_time': 0,
             'session_count': 0,
             'average_session': 0,
-            'channels_visited': []
+            'channels_visited': [],
+            'state_time': dict.fromkeys(TRACKED_STATES, 0)
         }
     
     def get_top_users_today(self, limit=10):
         """Retourne le top des utilisateurs du jour"""
+        return top_users(self.get_daily_stats(), limit)
+    
+    @traced()
+    @timed(QUERY_SECONDS)
+    def get_companions(self, member_name, limit=10, channel=None):
+        """
+        Membres avec qui member_name a passé le plus de temps dans le même salon
+        (sessions terminées)
+        
+        Returns:
+            [{'member', 'total_seconds', 'channels': {salon: secondes}}], du plus au moins
+        """
         with self.lock:
-            today = datetime.now().date().isoformat()
-            conn = sqlite3.connect(self.db_path)
+            conn = sqlite_connect(self.db_path)
             cursor = conn.cursor()
             
             cursor.execute('''
-                SELECT member_name, SUM(duration) as total
-                FROM sessions
-                WHERE DATE(start_time) = ? AND is_active = 0
-                GROUP BY member_name
-                ORDER BY total DESC
-                LIMIT ?
-            ''', (today, limit))
+                SELECT member_b, channel, seconds FROM copresence WHERE member_a = ?
+                UNION ALL
+                SELECT member_a, channel, seconds FROM copresence WHERE member_b = ?
+            ''', (member_name, member_name))
             
-            results = []
-            for row in cursor.fetchall():
-                member_name, total_time = row
-                
-                # Ajouter le temps de la session en cours
-                if member_name in self.active_sessions:
-                    now = datetime.now()
-                    current_duration = (now - self.active_sessions[member_name]['join_time']).total_seconds()
-                    total_time += current_duration
-                
-                results.append({
-                    'member': member_name,
-                    'total_time': total_time
-                })
+            companions = {}
+            for other, other_channel, seconds in cursor.fetchall():
+                if channel is not None and other_channel != channel:
+                    continue
+                entry = companions.setdefault(other, {'member': other, 'total_seconds': 0, 'channels': {}})
+                entry['total_seconds'] += seconds
+                entry['channels'][other_channel] = round(seconds, 1)
             
-            # Ajouter les membres qui n'ont qu'une session en cours
-            for member_name, session in self.active_sessions.items():
-                if not any(r['member'] == member_name for r in results):
-                    now = datetime.now()
-                    duration = (now - session['join_time']).total_seconds()
-                    results.append({
-                        'member': member_name,
-                        'total_time': duration
-                    })
+            conn.close()
+            results = sorted(companions.values(), key=lambda x: x['total_seconds'], reverse=True)
+            results = results[:limit] if limit else results
+            for entry in results:
+                entry['total_seconds'] = round(entry['total_seconds'], 1)
+            return results
+    
+    @traced()
+    @timed(QUERY_SECONDS)
+    def get_copresence_graph(self, channel=None, min_seconds=0):
+        """
+        Graphe de co-présence : un nœud par membre, une arête par paire pondérée
+        par les secondes passées ensemble (sessions terminées)
+        
+        Returns:
+            {'nodes': [{'id', 'total_seconds'}], 'edges': [{'source', 'target', 'seconds'}]}
+        """
+        with self.lock:
+            conn = sqlite_connect(self.db_path)
+            cursor = conn.cursor()
             
-            # Re-trier et limiter
-            results.sort(key=lambda x: x['total_time'], reverse=True)
+            if channel is not None:
+                cursor.execute('''
+                    SELECT member_a, member_b, seconds
+                    FROM copresence
+                    WHERE channel = ? AND seconds >= ?
+                ''', (channel, min_seconds))
+            else:
+                cursor.execute('''
+                    SELECT member_a, member_b, SUM(seconds) AS total
+                    FROM copresence
+                    GROUP BY member_a, member_b
+                    HAVING total >= ?
+                ''', (min_seconds,))
+            
+            edges = []
+            totals = defaultdict(float)
+            for member_a, member_b, seconds in cursor.fetchall():
+                edges.append({'source': member_a, 'target': member_b, 'seconds': round(seconds, 1)})
+                totals[member_a] += seconds
+                totals[member_b] += seconds
             
             conn.close()
-            return results[:limit]
+            return {
+                'nodes': [{'id': name, 'total_seconds': round(total, 1)} for name, total in sorted(totals.items())],
+                'edges': edges
+            }
+    
+    @traced()
+    @timed(QUERY_SECONDS)
+    def get_duration_stats(self, by='member', start_day=None, end_day=None, name=None):
+        """
+        Distribution des durées (sessions terminées par membre, passages par salon)
+        sur une période : fusion des histogrammes des mois entiers et des jours
+        des mois entamés
+        
+        Args:
+            by: 'member' ou 'channel'
+            start_day, end_day: jours ISO inclus (None = sans limite)
+            name: un seul membre ou salon
+        
+        Returns:
+            {'overall': résumé, 'durations': {nom: résumé}} ; résumé : count,
+            total_seconds, mean, p50, p90, p99, histogram
+        """
+        with self.lock:
+            conn = sqlite_connect(self.db_path)
+            cursor = conn.cursor()
+            
+            union, params = range_union(start_day, end_day, 'duration_buckets_monthly', 'duration_buckets',
+                                        'name, bucket, count, seconds',
+                                        ' AND scope = ?' + (' AND name = ?' if name is not None else ''),
+                                        [by] + ([name] if name is not None else []))
+            cursor.execute(f'''
+                SELECT name, bucket, SUM(count), SUM(seconds)
+                FROM ({union})
+                GROUP BY name, bucket
+            ''', params)
+            
+            histograms = defaultdict(LogHistogram)
+            overall = LogHistogram()
+            for row_name, bucket, count, seconds in cursor.fetchall():
+                histograms[row_name].add_bucket(bucket, count, seconds)
+                overall.add_bucket(bucket, count, seconds)
+            
+            conn.close()
+            return {
+                'overall': overall.summary(),
+                'durations': {row_name: histogram.summary() for row_name, histogram in histograms.items()}
+            }
     
+    @traced()
+    @timed(QUERY_SECONDS)
     def get_records(self):
         """Retourne tous les records"""
         with self.lock:
-            conn = sqlite3.connect(self.db_path)
+            conn = sqlite_connect(self.db_path)
             cursor = conn.cursor()
             
             cursor.execute('SELECT record_type, member_name, duration, date FROM records')
@@ -422,10 +1366,12 @@ class StatsTracker:
             conn.close()
             return records
     
+    @traced()
+    @timed(QUERY_SECONDS)
     def reset_daily_stats(self):
         """Réinitialise les stats quotidiennes"""
         with self.lock:
-            conn = sqlite3.connect(self.db_path)
+            conn = sqlite_connect(self.db_path)
             cursor = conn.cursor()
             
             cursor.execute('''
@@ -437,10 +1383,12 @@ class StatsTracker:
             conn.commit()
             conn.close()
     
+    @traced()
+    @timed(QUERY_SECONDS)
     def reset_weekly_stats(self):
         """Réinitialise les stats hebdomadaires"""
         with self.lock:
-            conn = sqlite3.connect(self.db_path)
+            conn = sqlite_connect(self.db_path)
             cursor = conn.cursor()
             
             cursor.execute('''
@@ -452,10 +1400,12 @@ class StatsTracker:
             conn.commit()
             conn.close()
     
+    @traced()
+    @timed(QUERY_SECONDS)
     def reset_monthly_stats(self):
         """Réinitialise les stats mensuelles"""
         with self.lock:
-            conn = sqlite3.connect(self.db_path)
+            conn = sqlite_connect(self.db_path)
             cursor = conn.cursor()
             
             cursor.execute('''
@@ -467,5 +1417,5 @@ class StatsTracker:
             conn.commit()
             conn.close()
 
-# Instance globale
-stats_tracker = StatsTracker()
\ No newline at end of file
+# Instance globale (construite au premier usage : pas dans les workers web)
+stats_tracker = LazyInstance(StatsTracker)
\ No newline at end of file
@@ -0,0 +1,484 @@
+# -*- coding: utf-8 -*-
+"""
+Abonnements Socket.IO : salles par flux, par salon et par serveur
+
+Un client choisit ses flux (voice, logs, stats, health) et peut limiter
+voice et logs à certains salons ou serveurs :
+    socket.emit('subscribe', {feeds: ['voice', 'logs'], channels: ['Général'], guilds: ['123']})
+ou dès la connexion : io({auth: {subscribe: {...}}}).
+Sans abonnement, un client reçoit tout (comportement historique).
+
+Salles :
+    voice, logs, stats, health                  flux complets
+    voice:channel:<salon>, logs:channel:<salon> un salon
+    voice:guild:<id>, logs:guild:<id>           un serveur
+
+Un client limité à des salons ou serveurs reçoit des voice_update partiels :
+seulement les salons modifiés (null pour un salon supprimé), à fusionner
+dans son état. L'instantané envoyé à l'abonnement contient tout son périmètre.
+
+Un client qui ne suit pas le rythme (file d'envoi pleine) ne reçoit plus que
+la dernière valeur des flux voice, stats et health quand il a rattrapé son
+retard ; ses logs sont gardés dans l'ordre (les plus anciens sont résumés par
+un événement activity_log_skipped).
+
+Avec encoding: 'deflate', voice_update et stats_update arrivent en binaire :
+JSON compressé (zlib), une seule fois par diffusion quel que soit le nombre
+de clients. Ces clients sont dans les salles voice#deflate, stats#deflate...
+"""
+
+import json
+import threading
+import time
+import zlib
+from collections import Counter, deque
+from threading import Lock
+
+from socketio import packet
+
+from config import (SOCKETIO_MAX_BACKLOG, SOCKETIO_MAX_QUEUED_LOGS, SOCKETIO_BINARY_ENCODING,
+                    SOCKETIO_COMPRESSION_LEVEL)
+from health_monitor import health_monitor
+from metrics import metrics
+
+FEEDS = ('voice', 'logs', 'stats', 'health')
+SCOPED_FEEDS = ('voice', 'logs')
+FEED_EVENTS = {
+    'voice_update': 'voice',
+    'activity_log': 'logs',
+    'stats_update': 'stats',
+    'health_status': 'health'
+}
+
+# Flux pouvant être envoyés en binaire, et suffixe de leurs salles
+ENCODINGS = ('json', 'deflate')
+BINARY_FEEDS = ('voice', 'stats')
+BINARY_ROOM_SUFFIX = '#deflate'
+
+# Nombre maximal de salons/serveurs par abonnement
+MAX_SCOPE = 100
+
+# Intervalle de mesure des files d'envoi et de rattrapage des clients lents (secondes)
+FLUSH_INTERVAL = 0.2
+
+def parse_subscription(data):
+    """Valide un message subscribe ; les clés absentes prennent la valeur par défaut"""
+    if not isinstance(data, dict):
+        data = {}
+
+    def names(key):
+        values = data.get(key) or []
+        if isinstance(values, (str, int)):
+            values = [values]
+        if not isinstance(values, list):
+            return []
+        return [str(value) for value in values if isinstance(value, (str, int))][:MAX_SCOPE]
+
+    feeds = [feed for feed in FEEDS if feed in names('feeds')] if 'feeds' in data else list(FEEDS)
+    encoding = data.get('encoding') if SOCKETIO_BINARY_ENCODING and data.get('encoding') in ENCODINGS else 'json'
+    return {'feeds': feeds, 'channels': names('channels'), 'guilds': names('guilds'), 'encoding': encoding}
+
+def is_scoped(subscription):
+    return bool(subscription['channels'] or subscription['guilds'])
+
+def subscription_rooms(subscription):
+    """Salles correspondant à un abonnement"""
+    rooms = set()
+    for feed in subscription['feeds']:
+        if feed in SCOPED_FEEDS and is_scoped(subscription):
+            feed_rooms = [f'{feed}:channel:{name}' for name in subscription['channels']]
+            feed_rooms += [f'{feed}:guild:{guild_id}' for guild_id in subscription['guilds']]
+        else:
+            feed_rooms = [feed]
+        if feed in BINARY_FEEDS and subscription['encoding'] != 'json':
+            feed_rooms = [room + BINARY_ROOM_SUFFIX for room in feed_rooms]
+        rooms.update(feed_rooms)
+    return rooms
+
+def voice_scope(rooms):
+    """
+    Périmètre vocal d'un client limité à des salons ou serveurs :
+    (salles voice:channel/guild sans suffixe, binaire), None sinon
+    """
+    scoped = [room for room in rooms if room.startswith('voice:')]
+    if not scoped:
+        return None
+    binary = scoped[0].endswith(BINARY_ROOM_SUFFIX)
+    return frozenset(room[:-len(BINARY_ROOM_SUFFIX)] if binary else room for room in scoped), binary
+
+def encode_payload(data):
+    """JSON compact compressé (zlib), décodé côté navigateur par DecompressionStream('deflate')"""
+    text = json.dumps(data, ensure_ascii=False, separators=(',', ':'))
+    return zlib.compress(text.encode('utf-8'), SOCKETIO_COMPRESSION_LEVEL)
+
+def decode_payload(data):
+    """Inverse de encode_payload (clients Python, benchmarks)"""
+    if isinstance(data, (bytes, bytearray)):
+        return json.loads(zlib.decompress(data))
+    return data
+
+def client_payload(subscription, event, data):
+    """Données d'un événement dans l'encodage choisi par le client"""
+    if subscription['encoding'] != 'json' and FEED_EVENTS.get(event) in BINARY_FEEDS:
+        return encode_payload(data)
+    return data
+
+def in_scope(subscription, channel_name, voice_data):
+    """Le salon fait-il partie du périmètre de l'abonnement ?"""
+    if not is_scoped(subscription):
+        return True
+    if channel_name in subscription['channels']:
+        return True
+    guild_id = voice_data.get(channel_name, {}).get('guild_id')
+    return guild_id is not None and guild_id in subscription['guilds']
+
+def log_channels(log):
+    """Salons concernés par une entrée du journal d'activité"""
+    return [log[key] for key in ('channel', 'from_channel', 'to_channel') if log.get(key)]
+
+def voice_view(subscription, voice_data):
+    """voice_data restreint au périmètre de l'abonnement"""
+    if not is_scoped(subscription):
+        return voice_data
+    return {name: data for name, data in voice_data.items() if in_scope(subscription, name, voice_data)}
+
+def logs_view(subscription, logs, voice_data):
+    """Logs restreints au périmètre de l'abonnement"""
+    if not is_scoped(subscription):
+        return logs
+    return [log for log in logs
+            if any(in_scope(subscription, name, voice_data) for name in log_channels(log))]
+
+class SubscriptionManager:
+    """Abonnement et salles de chaque client connecté"""
+
+    def __init__(self):
+        self.lock = Lock()
+        self.clients = {}           # sid -> abonnement
+        self.client_rooms = {}      # sid -> salles
+        self.room_counts = Counter()
+        self.voice_scopes = {}      # voice_scope() -> sids des clients de ce périmètre
+
+    def subscribe(self, sid, data=None):
+        """
+        Enregistre l'abonnement d'un client
+
+        Returns:
+            (abonnement, salles à rejoindre, salles à quitter)
+        """
+        subscription = parse_subscription(data)
+        rooms = subscription_rooms(subscription)
+        with self.lock:
+            previous = self.client_rooms.get(sid, set())
+            self.clients[sid] = subscription
+            self.client_rooms[sid] = rooms
+            self._count(rooms - previous, 1)
+            self._count(previous - rooms, -1)
+            self._scope(sid, previous, None)
+            self._scope(sid, None, rooms)
+        return subscription, rooms - previous, previous - rooms
+
+    def remove(self, sid):
+        with self.lock:
+            self.clients.pop(sid, None)
+            rooms = self.client_rooms.pop(sid, set())
+            self._count(rooms, -1)
+            self._scope(sid, rooms, None)
+
+    def _scope(self, sid, removed, added):
+        """Retire le client du périmètre vocal de `removed` ou l'ajoute à celui de `added` (salles)"""
+        scope = voice_scope(removed or added or ())
+        if scope is None:
+            return
+        if added:
+            self.voice_scopes.setdefault(scope, set()).add(sid)
+            return
+        sids = self.voice_scopes.get(scope, set())
+        sids.discard(sid)
+        if not sids:
+            self.voice_scopes.pop(scope, None)
+
+    def _count(self, rooms, delta):
+        for room in rooms:
+            self.room_counts[room] += delta
+            if self.room_counts[room] <= 0:
+                del self.room_counts[room]
+
+    def get(self, sid):
+        with self.lock:
+            return self.clients.get(sid) or parse_subscription(None)
+
+    def active(self, room):
+        """La salle a-t-elle au moins un abonné ? (évite de sérialiser pour personne)"""
+        return room in self.room_counts
+
+    def any_room(self, prefix):
+        with self.lock:
+            return any(room.startswith(prefix) for room in self.room_counts)
+
+    def get_voice_scopes(self):
+        """[(périmètre vocal, sids)] des clients limités à des salons ou serveurs"""
+        with self.lock:
+            return [(scope, list(sids)) for scope, sids in self.voice_scopes.items()]
+
+subscriptions = SubscriptionManager()
+
+def transport_backlog(server, sid, namespace='/'):
+    """Paquets en attente d'envoi dans la file engine.io d'un client"""
+    try:
+        eio_sid = server.manager.eio_sid_from_sid(sid, namespace)
+        return server.eio.sockets[eio_sid].queue.qsize()
+    except (KeyError, AttributeError):
+        return 0
+
+EMITS = metrics.counter('socketio_emits_total', 'Événements Socket.IO émis (une fois par diffusion)', ('event',))
+EMIT_BYTES = metrics.counter('socketio_emit_bytes_total',
+                             'Octets encodés des événements émis (une fois par diffusion)', ('event',))
+
+class MeteredPacket(packet.Packet):
+    """
+    Paquet Socket.IO qui compte les événements émis et leur taille encodée
+    (serializer= du serveur) ; un paquet est encodé une fois par émission,
+    quel que soit le nombre de destinataires.
+    """
+
+    def encode(self):
+        encoded = super().encode()
+        if self.packet_type in (packet.EVENT, packet.BINARY_EVENT) and self.data:
+            parts = encoded if isinstance(encoded, list) else [encoded]
+            EMITS.inc(self.data[0])
+            EMIT_BYTES.inc(self.data[0], value=sum(len(part) for part in parts))
+        return encoded
+
+class ClientOutbox:
+    """Diffusions en attente pour un client lent"""
+
+    def __init__(self):
+        self.snapshots = {}     # événement -> dernière valeur (conflation)
+        self.logs = deque(maxlen=SOCKETIO_MAX_QUEUED_LOGS)
+        self.skipped_logs = 0
+
+    def messages(self):
+        """Messages envoyés au rattrapage : logs dans l'ordre, puis dernières valeurs"""
+        if self.skipped_logs:
+            yield 'activity_log_skipped', {'count': self.skipped_logs}
+        for log in self.logs:
+            yield 'activity_log', log
+        yield from self.snapshots.items()
+
+class RoomEmitter:
+    """
+    Enveloppe un émetteur (flask_socketio.SocketIO, ThreadsafeEmitter) : les
+    diffusions sans destinataire partent vers les salles abonnées au lieu
+    de tous les clients. S'installe avec discord_bot.set_socketio().
+
+    Avec `backlog` (file d'envoi d'un client, voir transport_backlog), un
+    client qui ne suit pas est retiré des diffusions : ses messages sont
+    gardés dans un ClientOutbox (dernière valeur pour voice_update,
+    stats_update, health_status ; logs dans l'ordre, les plus anciens
+    résumés par activity_log_skipped) et envoyés quand sa file est vide.
+    Les files sont mesurées toutes les FLUSH_INTERVAL secondes par un thread
+    de surveillance, pas à chaque diffusion : emit() lit l'ensemble des
+    clients lents qu'il a calculé.
+    """
+
+    def __init__(self, target, manager=subscriptions, backlog=None):
+        self.target = target
+        self.manager = manager
+        self.backlog = backlog
+        self.lock = Lock()
+        self.voice_data = {}
+        self.channels = {}      # salon -> JSON diffusé aux salles voice:channel/guild
+        self.outboxes = {}      # sid -> ClientOutbox des clients lents
+        self.slow = frozenset()  # sids des clients lents, recalculé par _scan
+        self.watcher_running = False
+        self.max_backlog = 0
+        self.conflated = 0
+        self.skipped_logs = 0
+        self.flushed = 0
+
+    def emit(self, event, data=None, to=None):
+        if to is not None or event not in FEED_EVENTS:
+            return self.target.emit(event, data, to=to)
+        slow = self._slow_clients()
+        if event == 'voice_update':
+            return self._emit_voice(data, slow)
+        if event == 'activity_log':
+            return self._emit_log(data, slow)
+        self._send(event, data, [FEED_EVENTS[event]], slow)
+
+    def _send(self, event, data, rooms, slow):
+        """
+        Diffuse aux salles (et à leurs variantes binaires, données encodées
+        une seule fois) ; les clients lents de ces salles reçoivent la valeur en file
+        """
+        self._send_to(event, data, data, rooms, slow)
+        if FEED_EVENTS[event] in BINARY_FEEDS:
+            binary_rooms = [room + BINARY_ROOM_SUFFIX for room in rooms]
+            if any(self.manager.active(room) for room in binary_rooms):
+                self._send_to(event, data, encode_payload(data), binary_rooms, slow)
+
+    def _send_to(self, event, data, payload, rooms, slow):
+        rooms = [room for room in rooms if self.manager.active(room)]
+        if not rooms:
+            return
+        to = rooms[0] if len(rooms) == 1 else rooms
+        skipped = self._enqueue(event, data, rooms, slow) if slow else None
+        if skipped:
+            self.target.emit(event, payload, to=to, skip_sid=skipped)
+        else:
+            self.target.emit(event, payload, to=to)
+
+    def _enqueue(self, event, data, rooms, slow):
+        skipped = []
+        with self.lock:
+            for sid in slow:
+                outbox = self.outboxes.get(sid)
+                matched = [room for room in rooms if room in self.manager.client_rooms.get(sid, ())]
+                if outbox is None or not matched:
+                    continue
+                skipped.append(sid)
+                if event == 'activity_log':
+                    if len(outbox.logs) == outbox.logs.maxlen:
+                        outbox.skipped_logs += 1
+                        self.skipped_logs += 1
+                    outbox.logs.append(data)
+                    continue
+                if event in outbox.snapshots:
+                    self.conflated += 1
+                outbox.snapshots[event] = data
+        return skipped
+
+    def _send_clients(self, event, data, payload, sids, slow):
+        """
+        voice_update partiel envoyé en une émission à une liste de clients ;
+        les clients lents le fusionnent à celui qu'ils ont déjà en file
+        """
+        queued = set()
+        if slow:
+            with self.lock:
+                for sid in sids:
+                    outbox = self.outboxes.get(sid) if sid in slow else None
+                    if outbox is None:
+                        continue
+                    queued.add(sid)
+                    previous = outbox.snapshots.get(event)
+                    if previous is not None:
+                        self.conflated += 1
+                    outbox.snapshots[event] = {**previous, **data} if previous is not None else data
+        to = [sid for sid in sids if sid not in queued]
+        if to:
+            self.target.emit(event, payload, to=to[0] if len(to) == 1 else to)
+
+    def _slow_clients(self):
+        """Clients lents lors de la dernière mesure ; lance la surveillance à la première diffusion"""
+        if self.backlog is None:
+            return self.slow
+        if not self.watcher_running:
+            with self.lock:
+                start_watcher = not self.watcher_running
+                self.watcher_running = True
+            if start_watcher:
+                threading.Thread(target=self._watch_loop, daemon=True).start()
+        return self.slow
+
+    def _scan(self):
+        """
+        Mesure la file d'envoi de chaque client : au-delà de SOCKETIO_MAX_BACKLOG
+        il devient lent ; quand elle est vide, ses messages en attente lui sont
+        envoyés
+        """
+        with self.manager.lock:
+            sids = list(self.manager.clients)
+        depths = {sid: self.backlog(sid) for sid in sids}
+
+        ready = []
+        with self.lock:
+            for sid in list(self.outboxes):
+                if sid not in depths:
+                    del self.outboxes[sid]
+                elif depths[sid] == 0:
+                    ready.append((sid, self.outboxes.pop(sid)))
+            for sid, depth in depths.items():
+                if depth >= SOCKETIO_MAX_BACKLOG and sid not in self.outboxes:
+                    self.outboxes[sid] = ClientOutbox()
+            self.max_backlog = max(depths.values(), default=0)
+            self.flushed += len(ready)
+            self.slow = frozenset(self.outboxes)
+
+        for sid, outbox in ready:
+            subscription = self.manager.get(sid)
+            for event, data in outbox.messages():
+                self.target.emit(event, client_payload(subscription, event, data), to=sid)
+        health_monitor.set_delivery_status(self.metrics())
+
+    def _watch_loop(self):
+        """
+        Surveillance des files d'envoi : repère les clients lents et les
+        rattrape, même sans nouvelle diffusion ; s'arrête quand il n'y a plus
+        de client (relancée par la diffusion suivante)
+        """
+        while True:
+            time.sleep(FLUSH_INTERVAL)
+            self._scan()
+            with self.lock:
+                if not self.outboxes and not self.manager.clients:
+                    self.watcher_running = False
+                    return
+
+    def metrics(self):
+        """Files d'attente et conflation (section web.delivery de /api/status)"""
+        with self.lock:
+            return {
+                'slow_clients': len(self.outboxes),
+                'max_backlog': self.max_backlog,
+                'queued_logs': sum(len(outbox.logs) for outbox in self.outboxes.values()),
+                'queued_snapshots': sum(len(outbox.snapshots) for outbox in self.outboxes.values()),
+                'conflated_total': self.conflated,
+                'skipped_logs_total': self.skipped_logs,
+                'flushed_total': self.flushed
+            }
+
+    def _emit_voice(self, voice_data, slow):
+        self._send('voice_update', voice_data, ['voice'], slow)
+
+        with self.lock:
+            previous_data, self.voice_data = self.voice_data, voice_data
+            if not self.manager.any_room('voice:'):
+                return
+            # Salons modifiés depuis la dernière diffusion (None = supprimé)
+            encoded = {name: json.dumps(data, sort_keys=True) for name, data in voice_data.items()}
+            changed = {name: voice_data[name] for name, text in encoded.items() if self.channels.get(name) != text}
+            changed.update((name, None) for name in self.channels if name not in encoded)
+            self.channels = encoded
+
+        # Salles concernées par chaque salon modifié
+        changed_rooms = {}
+        for name, data in changed.items():
+            changed_rooms[name] = {f'voice:channel:{name}'}
+            guild_id = (data or previous_data.get(name, {})).get('guild_id')
+            if guild_id is not None:
+                changed_rooms[name].add(f'voice:guild:{guild_id}')
+
+        # Clients groupés par salons modifiés de leur périmètre : une seule émission
+        # par groupe, un client abonné à un salon et à son serveur reçoit chaque
+        # changement une fois
+        groups = {}
+        for (rooms, binary), sids in self.manager.get_voice_scopes():
+            names = tuple(name for name, name_rooms in changed_rooms.items() if not rooms.isdisjoint(name_rooms))
+            if names:
+                groups.setdefault((names, binary), []).extend(sids)
+        for (names, binary), sids in groups.items():
+            data = {name: changed[name] for name in names}
+            self._send_clients('voice_update', data, encode_payload(data) if binary else data, sids, slow)
+
+    def _emit_log(self, log, slow):
+        rooms = ['logs']
+        for name in log_channels(log):
+            rooms.append(f'logs:channel:{name}')
+            guild_id = self.voice_data.get(name, {}).get('guild_id')
+            if guild_id is not None:
+                rooms.append(f'logs:guild:{guild_id}')
+        # Une seule émission vers toutes les salles : un client présent dans
+        # plusieurs d'entre elles ne reçoit le log qu'une fois
+        self._send('activity_log', log, list(dict.fromkeys(rooms)), slow)
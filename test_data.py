@@ -1,87 +1,311 @@
 # -*- coding: utf-8 -*-
 
-def get_test_data():
-    """Retourne des données de test pour le mode démo"""
+import heapq
+import itertools
+import math
+import random
+import time
+from types import SimpleNamespace
+from config import (SIM_GUILDS, SIM_CHANNELS, SIM_MEMBERS, SIM_EVENT_RATES,
+                    SIM_MEAN_SESSION, SIM_TIME_SCALE, SIM_SEED)
+
+FIRST_NAMES = ['Alice', 'Bob', 'Charlie', 'Dave', 'Eve', 'Frank', 'Grace', 'Heidi',
+               'Ivan', 'Judy', 'Mallory', 'Niaj', 'Olivia', 'Peggy', 'Rupert', 'Sybil',
+               'Trent', 'Victor', 'Walter', 'Yves']
+CHANNEL_NAMES = ['🎧 Salon Principal', '🎮 Gaming', '🎶 Musique', '💬 Discussion',
+                 '📚 Travail', '🎬 Cinéma', '🏆 Tournoi', '🌙 AFK']
+STATUSES = ['online', 'online', 'online', 'idle', 'dnd']
+
+# Probabilité d'un état vocal à l'arrivée dans un salon
+INITIAL_FLAG_ODDS = {
+    'muted': 0.25,
+    'deafened': 0.05,
+    'server_muted': 0.02,
+    'server_deafened': 0.0,
+    'stream': 0.05,
+    'webcam': 0.08
+}
+
+# Événement aléatoire -> état vocal basculé
+FLAG_EVENTS = {
+    'mute': 'muted',
+    'deafen': 'deafened',
+    'server_mute': 'server_muted',
+    'stream': 'stream',
+    'webcam': 'webcam'
+}
+
+def member_data(name, avatar, status):
+    """Membre au format voice_data, sans état vocal actif"""
     return {
-        "🎧 Salon Principal": {
-            "members": [
-                {
-                    "name": "Alice",
-                    "avatar": "https://i.pravatar.cc/150?img=1",
-                    "status": "online",
-                    "webcam": True,
-                    "stream": False,
-                    "muted": False,
-                    "deafened": False,
-                    "server_muted": False,
-                    "server_deafened": False
-                },
-                {
-                    "name": "Bob",
-                    "avatar": "https://i.pravatar.cc/150?img=2",
-                    "status": "online",
-                    "webcam": False,
-                    "stream": True,
-                    "muted": True,
-                    "deafened": False,
-                    "server_muted": False,
-                    "server_deafened": False
-                },
-                {
-                    "name": "Charlie",
-                    "avatar": "https://i.pravatar.cc/150?img=3",
-                    "status": "idle",
-                    "webcam": False,
-                    "stream": False,
-                    "muted": False,
-                    "deafened": True,
-                    "server_muted": False,
-                    "server_deafened": False
-                }
-            ],
-            "count": 3
-        },
-        "🎮 Gaming": {
-            "members": [
-                {
-                    "name": "Dave",
-                    "avatar": "https://i.pravatar.cc/150?img=4",
-                    "status": "dnd",
-                    "webcam": True,
-                    "stream": True,
-                    "muted": True,
-                    "deafened": True,
-                    "server_muted": False,
-                    "server_deafened": False
-                },
-                {
-                    "name": "Eve",
-                    "avatar": "https://i.pravatar.cc/150?img=5",
-                    "status": "online",
-                    "webcam": False,
-                    "stream": False,
-                    "muted": False,
-                    "deafened": False,
-                    "server_muted": True,
-                    "server_deafened": False
-                }
-            ],
-            "count": 2
-        },
-        "🎶 Musique": {
-            "members": [
-                {
-                    "name": "Frank",
-                    "avatar": "https://i.pravatar.cc/150?img=6",
-                    "status": "online",
-                    "webcam": True,
-                    "stream": False,
-                    "muted": False,
-                    "deafened": False,
-                    "server_muted": False,
-                    "server_deafened": False
-                }
-            ],
-            "count": 1
-        }
+        'name': name,
+        'avatar': avatar,
+        'status': status,
+        'webcam': False,
+        'stream': False,
+        'muted': False,
+        'deafened': False,
+        'server_muted': False,
+        'server_deafened': False
     }
+
+class VoiceSimulator:
+    """
+    Simule des serveurs Discord : salons vocaux, membres et événements
+    (join/leave/move/mute/stream...) générés selon des taux configurables
+
+    Les durées de session suivent une loi log-normale (beaucoup de sessions
+    courtes, une longue traîne de sessions de plusieurs heures).
+    """
+
+    def __init__(self, guilds=1, channels=3, members=12, event_rates=None,
+                 mean_session=1800, time_scale=1.0, seed=None, clock=time.monotonic):
+        self.rng = random.Random(seed)
+        self.clock = clock
+        self.set_event_rates(event_rates or {})
+        self.time_scale = time_scale
+
+        # Paramètres de la log-normale pour obtenir la moyenne demandée
+        self.session_sigma = 1.0
+        self.session_mu = math.log(mean_session) - self.session_sigma ** 2 / 2
+
+        # Salons
+        self.channels = []
+        for g in range(guilds):
+            for c in range(channels):
+                name = CHANNEL_NAMES[c % len(CHANNEL_NAMES)]
+                if c >= len(CHANNEL_NAMES):
+                    name += f' {c // len(CHANNEL_NAMES) + 1}'
+                if guilds > 1:
+                    name += f' #{g + 1}'
+                self.channels.append({
+                    'id': 900_000 + g * 1_000 + c,
+                    'name': name,
+                    'guild_id': 800_000 + g,
+                    'guild_name': f'Serveur {g + 1}'
+                })
+        self.channels_by_id = {ch['id']: ch for ch in self.channels}
+        self.channel_ids = set(self.channels_by_id)
+        self.member_index = {}
+
+        # Membres (profil + état vocal)
+        self.members = []
+        for i in range(members):
+            name = FIRST_NAMES[i % len(FIRST_NAMES)]
+            if i >= len(FIRST_NAMES):
+                name += f' {i // len(FIRST_NAMES) + 1}'
+            self.member_index[700_000 + i] = i
+            self.members.append({
+                'id': 700_000 + i,
+                'guild_id': 800_000 + i % guilds,
+                'data': member_data(name, f'https://i.pravatar.cc/150?img={i % 70 + 1}', self.rng.choice(STATUSES))
+            })
+
+        # Monde : salon de chaque membre connecté, membres de chaque salon
+        self.location = {}
+        self.online = []
+        self.online_pos = {}
+        self.channel_members = {ch['id']: [] for ch in self.channels}
+        self.leave_heap = []
+
+    # ----------------------------------------
+    # Mutations du monde (communes au simulateur et au rejeu)
+    # ----------------------------------------
+
+    def ensure_channel(self, channel_id, name, guild_id=None, guild_name=None):
+        """Déclare un salon s'il n'existe pas encore (rejeu d'un journal)"""
+        if channel_id not in self.channels_by_id:
+            channel = {'id': channel_id, 'name': name, 'guild_id': guild_id, 'guild_name': guild_name}
+            self.channels.append(channel)
+            self.channels_by_id[channel_id] = channel
+            self.channel_ids.add(channel_id)
+            self.channel_members[channel_id] = []
+        return self.channels_by_id[channel_id]
+
+    def ensure_member(self, member_id, name, avatar, status, guild_id=None):
+        """Déclare un membre (ou met à jour son profil) et retourne son index"""
+        index = self.member_index.get(member_id)
+        if index is None:
+            index = len(self.members)
+            self.member_index[member_id] = index
+            self.members.append({
+                'id': member_id,
+                'guild_id': guild_id,
+                'data': member_data(name, avatar, status)
+            })
+        else:
+            data = self.members[index]['data']
+            data['name'] = name
+            data['avatar'] = avatar
+            data['status'] = status
+        return index
+
+    def join(self, index, channel_id, flags=None, at=None):
+        """Connecte un membre à un salon"""
+        member = self.members[index]
+        for key, value in (flags or {}).items():
+            member['data'][key] = value
+        self.location[index] = channel_id
+        self.channel_members[channel_id].append(member['data'])
+        self.online_pos[index] = len(self.online)
+        self.online.append(index)
+        return self._event('voice', index, None, channel_id, at)
+
+    def leave(self, index, at=None):
+        """Déconnecte un membre"""
+        channel_id = self.location.pop(index)
+        self.channel_members[channel_id].remove(self.members[index]['data'])
+        # Retrait en O(1) de la liste des connectés (échange avec le dernier)
+        pos = self.online_pos.pop(index)
+        last = self.online.pop()
+        if last != index:
+            self.online[pos] = last
+            self.online_pos[last] = pos
+        return self._event('voice', index, channel_id, None, at)
+
+    def move(self, index, channel_id, at=None):
+        """Déplace un membre vers un autre salon"""
+        before = self.location[index]
+        data = self.members[index]['data']
+        self.channel_members[before].remove(data)
+        self.channel_members[channel_id].append(data)
+        self.location[index] = channel_id
+        return self._event('voice', index, before, channel_id, at)
+
+    def set_flag(self, index, key, value, at=None):
+        """Change un état vocal (mute, stream...) d'un membre connecté"""
+        self.members[index]['data'][key] = value
+        channel_id = self.location.get(index)
+        return self._event('voice', index, channel_id, channel_id, at)
+
+    def set_status(self, index, status, at=None):
+        """Change le statut (presence) d'un membre"""
+        self.members[index]['data']['status'] = status
+        return self._event('presence', index, None, self.location.get(index), at)
+
+    def _event(self, kind, index, before, after, at):
+        return {
+            'kind': kind,
+            'member': index,
+            'before': before,
+            'after': after,
+            'time': self.clock() if at is None else at
+        }
+
+    # ----------------------------------------
+    # Génération aléatoire
+    # ----------------------------------------
+
+    def set_event_rates(self, event_rates):
+        """Change les taux d'événements (par seconde) ; repart de maintenant"""
+        self.event_rates = dict(event_rates)
+        self.total_rate = sum(self.event_rates.values())
+        self.event_types = list(self.event_rates)
+        self.event_weights = list(itertools.accumulate(self.event_rates.values()))
+        self.next_event_at = None
+
+    def sample_session_length(self):
+        """Durée de session (secondes simulées) selon une loi log-normale"""
+        return self.rng.lognormvariate(self.session_mu, self.session_sigma)
+
+    def populate(self, ratio=0.5):
+        """Connecte une partie des membres dès le départ"""
+        now = self.clock()
+        for index in self.rng.sample(range(len(self.members)), int(len(self.members) * ratio)):
+            self._random_join(index, now, residual=True)
+
+    def _random_join(self, index, now, residual=False):
+        flags = {key: self.rng.random() < odds for key, odds in INITIAL_FLAG_ODDS.items()}
+        length = self.sample_session_length()
+        if residual:
+            length *= self.rng.random()
+        heapq.heappush(self.leave_heap, (now + length / self.time_scale, index))
+        return self.join(index, self.rng.choice(self.channels)['id'], flags, at=now)
+
+    def _random_event(self, now):
+        event_type = self.rng.choices(self.event_types, cum_weights=self.event_weights)[0]
+
+        if event_type == 'join':
+            if len(self.online) < len(self.members):
+                index = self.rng.randrange(len(self.members))
+                while index in self.location:
+                    index = self.rng.randrange(len(self.members))
+                return self._random_join(index, now)
+            return None
+
+        if not self.online:
+            return None
+        index = self.rng.choice(self.online)
+
+        if event_type == 'move' and len(self.channels) > 1:
+            targets = [ch['id'] for ch in self.channels if ch['id'] != self.location[index]]
+            return self.move(index, self.rng.choice(targets), at=now)
+        if event_type == 'status':
+            return self.set_status(index, self.rng.choice(STATUSES), at=now)
+        if event_type in FLAG_EVENTS:
+            key = FLAG_EVENTS[event_type]
+            return self.set_flag(index, key, not self.members[index]['data'][key], at=now)
+        return None
+
+    def due_events(self, now=None):
+        """Génère tous les événements arrivés à échéance (départs compris)"""
+        now = self.clock() if now is None else now
+        if self.next_event_at is None:
+            self.next_event_at = now
+
+        events = []
+        while self.leave_heap and self.leave_heap[0][0] <= now:
+            at, index = heapq.heappop(self.leave_heap)
+            if index in self.location:
+                events.append(self.leave(index, at=at))
+
+        if self.total_rate > 0:
+            while self.next_event_at <= now:
+                event = self._random_event(self.next_event_at)
+                if event:
+                    events.append(event)
+                self.next_event_at += self.rng.expovariate(self.total_rate)
+
+        return events
+
+    # ----------------------------------------
+    # Vues
+    # ----------------------------------------
+
+    def snapshot(self):
+        """Retourne l'état courant au format voice_data"""
+        data = {}
+        for channel in self.channels:
+            members = self.channel_members[channel['id']]
+            data[channel['name']] = {
+                'members': list(members),
+                'count': len(members),
+                'guild_id': str(channel['guild_id']) if channel['guild_id'] is not None else None
+            }
+        return data
+
+    def gateway_args(self, event):
+        """Objets minimaux imitant (member, before, after) des événements discord.py"""
+        def voice(channel_id):
+            channel = SimpleNamespace(id=channel_id) if channel_id else None
+            return SimpleNamespace(channel=channel)
+
+        member = self.members[event['member']]
+        fake_member = SimpleNamespace(id=member['id'], display_name=member['data']['name'],
+                                      voice=voice(event['after']))
+        return fake_member, voice(event['before']), voice(event['after'])
+
+# Instance globale (mode test)
+simulator = VoiceSimulator(
+    guilds=SIM_GUILDS,
+    channels=SIM_CHANNELS,
+    members=SIM_MEMBERS,
+    event_rates=SIM_EVENT_RATES,
+    mean_session=SIM_MEAN_SESSION,
+    time_scale=SIM_TIME_SCALE,
+    seed=SIM_SEED
+)
+
+def get_test_data():
+    """Retourne les données du simulateur pour le mode démo"""
+    return simulator.snapshot()
@@ -0,0 +1,302 @@
+# -*- coding: utf-8 -*-
+"""
+Traces des chemins critiques et journal des requêtes SQLite lentes
+
+Une trace commence par une span racine (événement gateway, requête HTTP,
+handler Socket.IO) ; les spans ouvertes pendant son exécution (même thread
+ou même tâche asyncio) deviennent ses enfants :
+    with tracer.span('gateway voice_state_update'):
+        update_voice_data()     # @traced() : span enfant
+
+Seule une fraction TRACE_SAMPLE_RATE des racines est enregistrée ; ailleurs
+une span ne coûte qu'une lecture de contextvar. Les traces enregistrées de
+plus de TRACE_SLOW_MS sont gardées (les plus récentes) pour /admin/traces.
+
+Les connexions SQLite ouvertes avec sqlite_connect() mesurent chaque requête
+et chaque commit : au-delà de SQL_SLOW_MS, le SQL, ses paramètres et sa
+durée sont journalisés ; dans une trace, chaque requête est une span.
+"""
+
+import contextvars
+import inspect
+import random
+import sqlite3
+import time
+from collections import deque
+from datetime import datetime
+from functools import wraps
+from threading import Lock
+
+from config import TRACE_SAMPLE_RATE, TRACE_SLOW_MS, SQL_SLOW_MS
+
+# Traces lentes et requêtes lentes gardées en mémoire
+MAX_SLOW_TRACES = 100
+MAX_SLOW_QUERIES = 200
+# Spans par trace au-delà desquelles les suivantes sont comptées mais pas gardées
+MAX_SPANS_PER_TRACE = 500
+# Longueur maximale du SQL et des paramètres journalisés
+MAX_SQL_LENGTH = 500
+
+# Span courante ; UNSAMPLED dans une racine non échantillonnée
+_current_span = contextvars.ContextVar('current_span', default=None)
+UNSAMPLED = object()
+
+class Trace:
+    __slots__ = ('name', 'started_at', 'spans', 'dropped_spans')
+
+    def __init__(self, name):
+        self.name = name
+        self.started_at = datetime.now()
+        self.spans = []
+        self.dropped_spans = 0
+
+class Span:
+    """Étape mesurée d'une trace enregistrée"""
+
+    __slots__ = ('tracer', 'trace', 'name', 'attrs', 'depth', 'start', 'duration', 'token')
+
+    def __init__(self, tracer, trace, name, attrs, depth):
+        self.tracer = tracer
+        self.trace = trace
+        self.name = name
+        self.attrs = attrs
+        self.depth = depth
+        self.duration = None
+
+    def set(self, **attrs):
+        """Ajoute des attributs à la span (statut HTTP, nombre de lignes...)"""
+        self.attrs.update(attrs)
+
+    def __enter__(self):
+        if len(self.trace.spans) < MAX_SPANS_PER_TRACE:
+            self.trace.spans.append(self)
+        else:
+            self.trace.dropped_spans += 1
+        self.token = _current_span.set(self)
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.duration = time.perf_counter() - self.start
+        _current_span.reset(self.token)
+        if exc_type is not None:
+            self.attrs['error'] = f'{exc_type.__name__}: {exc}'
+        if self.depth == 0:
+            self.tracer.finish(self.trace, self)
+        return False
+
+class UnsampledRoot:
+    """Racine non enregistrée : ses enfants sont ignorés"""
+
+    __slots__ = ('token',)
+
+    def set(self, **attrs):
+        pass
+
+    def __enter__(self):
+        self.token = _current_span.set(UNSAMPLED)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        _current_span.reset(self.token)
+        return False
+
+class NoopSpan:
+    __slots__ = ()
+
+    def set(self, **attrs):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+NOOP_SPAN = NoopSpan()
+
+class Tracer:
+    """Spans échantillonnées et traces lentes récentes"""
+
+    def __init__(self, sample_rate=TRACE_SAMPLE_RATE, slow_ms=TRACE_SLOW_MS):
+        self.lock = Lock()
+        self.sample_rate = sample_rate
+        self.slow_ms = slow_ms
+        self.slow_traces = deque(maxlen=MAX_SLOW_TRACES)
+        self.sampled = 0
+
+    def span(self, name, **attrs):
+        """Context manager ; racine si aucune span n'est en cours"""
+        parent = _current_span.get()
+        if parent is UNSAMPLED:
+            return NOOP_SPAN
+        if parent is None:
+            if self.sample_rate <= 0 or random.random() >= self.sample_rate:
+                return UnsampledRoot()
+            return Span(self, Trace(name), name, attrs, 0)
+        return Span(self, parent.trace, name, attrs, parent.depth + 1)
+
+    def start(self, name, **attrs):
+        """Span ouverte et fermée par deux appels (hooks Flask) : end(span)"""
+        span = self.span(name, **attrs)
+        span.__enter__()
+        return span
+
+    @staticmethod
+    def end(span, error=None):
+        if error is not None:
+            span.__exit__(type(error), error, None)
+        else:
+            span.__exit__(None, None, None)
+
+    def finish(self, trace, root):
+        duration_ms = root.duration * 1000
+        with self.lock:
+            self.sampled += 1
+            if duration_ms >= self.slow_ms:
+                self.slow_traces.append(self._export(trace, root))
+
+    @staticmethod
+    def _export(trace, root):
+        return {
+            'name': trace.name,
+            'started_at': trace.started_at.isoformat(),
+            'duration_ms': round(root.duration * 1000, 3),
+            'spans': [
+                {
+                    'name': span.name,
+                    'depth': span.depth,
+                    'start_ms': round((span.start - root.start) * 1000, 3),
+                    'duration_ms': round(span.duration * 1000, 3) if span.duration is not None else None,
+                    'attrs': span.attrs
+                }
+                for span in trace.spans
+            ],
+            'dropped_spans': trace.dropped_spans
+        }
+
+    def get_slow_traces(self, limit=MAX_SLOW_TRACES):
+        """Traces lentes, les plus récentes d'abord"""
+        with self.lock:
+            traces = list(self.slow_traces)
+        return traces[::-1][:limit]
+
+    def get_status(self):
+        with self.lock:
+            return {
+                'sample_rate': self.sample_rate,
+                'slow_threshold_ms': self.slow_ms,
+                'sampled_total': self.sampled
+            }
+
+def traced(name=None):
+    """Décorateur : span autour de chaque appel (nom de la fonction par défaut)"""
+    def decorator(func):
+        span_name = name or func.__qualname__
+
+        if inspect.iscoroutinefunction(func):
+            @wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                if _current_span.get() is UNSAMPLED:
+                    return await func(*args, **kwargs)
+                with tracer.span(span_name):
+                    return await func(*args, **kwargs)
+            return async_wrapper
+
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            # Dans une trace non échantillonnée : appel direct
+            if _current_span.get() is UNSAMPLED:
+                return func(*args, **kwargs)
+            with tracer.span(span_name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+# Instance globale
+tracer = Tracer()
+
+# ============================================
+# REQUÊTES SQLITE LENTES
+# ============================================
+
+def _truncate(value):
+    text = value if isinstance(value, str) else repr(value)
+    return text if len(text) <= MAX_SQL_LENGTH else text[:MAX_SQL_LENGTH] + '…'
+
+class SlowQueryLog:
+    """Requêtes SQLite de plus de SQL_SLOW_MS : SQL, paramètres, durée"""
+
+    def __init__(self, slow_ms=SQL_SLOW_MS):
+        self.lock = Lock()
+        self.slow_ms = slow_ms
+        self.entries = deque(maxlen=MAX_SLOW_QUERIES)
+        self.total = 0
+
+    def record(self, sql, params, duration, label=None):
+        duration_ms = duration * 1000
+        if duration_ms < self.slow_ms:
+            return
+        if params is not None:
+            params = _truncate(params) if label is None else f'{label}: {_truncate(params)}'
+        entry = {
+            'sql': _truncate(' '.join(sql.split())),
+            'params': params,
+            'duration_ms': round(duration_ms, 3),
+            'timestamp': datetime.now().isoformat()
+        }
+        with self.lock:
+            self.entries.append(entry)
+            self.total += 1
+        print(f"🐢 Requête SQLite lente ({entry['duration_ms']} ms): {entry['sql'][:120]}")
+
+    def get_entries(self, limit=MAX_SLOW_QUERIES):
+        """Requêtes lentes, les plus récentes d'abord"""
+        with self.lock:
+            entries = list(self.entries)
+        return entries[::-1][:limit]
+
+    def get_status(self):
+        with self.lock:
+            return {'slow_threshold_ms': self.slow_ms, 'slow_total': self.total}
+
+slow_queries = SlowQueryLog()
+
+def _timed_statement(run, sql, params, label=None):
+    span = tracer.span('sqlite', sql=_truncate(' '.join(sql.split()))) if _current_span.get() else NOOP_SPAN
+    with span:
+        start = time.perf_counter()
+        try:
+            return run()
+        finally:
+            slow_queries.record(sql, params, time.perf_counter() - start, label)
+
+class TracedCursor(sqlite3.Cursor):
+    """Curseur qui mesure chaque requête (journal lent, spans)"""
+
+    def execute(self, sql, params=()):
+        return _timed_statement(lambda: super(TracedCursor, self).execute(sql, params), sql, params)
+
+    def executemany(self, sql, seq_of_params):
+        seq_of_params = list(seq_of_params)
+        return _timed_statement(lambda: super(TracedCursor, self).executemany(sql, seq_of_params), sql,
+                                seq_of_params[:1], f'{len(seq_of_params)} lignes, première')
+
+class TracedConnection(sqlite3.Connection):
+    """Connexion dont les curseurs, execute() et commit() sont mesurés"""
+
+    def cursor(self, factory=TracedCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, params=()):
+        return self.cursor().execute(sql, params)
+
+    def executemany(self, sql, seq_of_params):
+        return self.cursor().executemany(sql, seq_of_params)
+
+    def commit(self):
+        return _timed_statement(super().commit, 'COMMIT', None)
+
+def sqlite_connect(path, **kwargs):
+    """sqlite3.connect() avec mesure des requêtes"""
+    return sqlite3.connect(path, factory=TracedConnection, **kwargs)
@@ -1,20 +1,58 @@
 # -*- coding: utf-8 -*-
 
-from flask import Flask, render_template, jsonify, request
-from flask_socketio import SocketIO, emit
-from config import FLASK_HOST, FLASK_PORT, SECRET_KEY
-from health_monitor import health_monitor
+from flask import Flask, render_template, jsonify, request, abort, g
+from flask_socketio import SocketIO, emit, join_room, leave_room
+from config import (FLASK_HOST, FLASK_PORT, SECRET_KEY, WEB_SERVER_MODE, ADMIN_TOKEN, PROFILE_INTERVAL_MS, PROFILE_MAX_SECONDS,
+                    TRACEMALLOC_FRAMES, DURATION_STATS_DEFAULT_DAYS, MEMBER_HISTORY_DEFAULT_DAYS,
+                    MEMBER_SESSIONS_PAGE_SIZE)
+from health_monitor import health_monitor, health_history
 from activity_logger import activity_logger
 import discord_bot
-from stats_tracker import stats_tracker
+from stats_tracker import stats_tracker, PERIODS as STATS_PERIODS, RANGE_GROUP_BY, period_days, top_users
+from occupancy import occupancy
+from copresence import to_graphml
+from analytics import heatmaps, GROUP_BY as HEATMAP_GROUP_BY, available as analytics_available
+from subscriptions import (subscriptions, RoomEmitter, MeteredPacket, voice_view, logs_view, transport_backlog,
+                           client_payload)
+from assets import AssetManifest, ASSETS_URL_PATH, IMMUTABLE_CACHE_CONTROL
+from metrics import metrics, render, with_labels, merge_families, CONTENT_TYPE as METRICS_CONTENT_TYPE
+from tracing import tracer, traced, slow_queries
+from profiling import cpu_profiler, memory_profiler
+import hashlib
+import hmac
+import json
+import math
+import os
 import threading
 import time
+from collections import namedtuple
+from datetime import date, datetime, timedelta
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
 
 app = Flask(__name__)
 app.config['SECRET_KEY'] = SECRET_KEY
-socketio = SocketIO(app, cors_allowed_origins="*")
+socketio = SocketIO(app, cors_allowed_origins="*", serializer=MeteredPacket)
+
+# Fichiers statiques empreintés et précompressés, lus une fois au démarrage
+assets = AssetManifest(app.static_folder).build()
+app.jinja_env.globals['asset_url'] = assets.url
+
+discord_bot.set_socketio(RoomEmitter(socketio, backlog=lambda sid: transport_backlog(socketio.server, sid)))
+
+# Worker web (mode workers) : client du bus pour interroger le bot
+bus_client = None
 
-discord_bot.set_socketio(socketio)
+def use_bus(client):
+    global bus_client
+    bus_client = client
+
+def today():
+    """Date du jour : horloge du bot (simulée au rejeu), horloge locale dans un worker web"""
+    return datetime.now().date() if bus_client else stats_tracker.clock().date()
 
 # ============================================
 # ROUTES WEB
@@ -41,26 +79,43 @@ def stats_page():
     health_monitor.web_request()
     return render_template('stats.html')
 
-@app.route('/api/bot')
-def api_bot():
-    """Retourne les données brutes du bot"""
-    health_monitor.web_request()
-    voice_data = discord_bot.get_voice_data()
+@app.route(f'{ASSETS_URL_PATH}/<path:fingerprinted>')
+def fingerprinted_asset(fingerprinted):
+    """Fichier statique empreinté, depuis la mémoire, dans l'encodage accepté par le client"""
+    found = assets.lookup(fingerprinted)
+    if found is None:
+        abort(404)
+    asset, immutable = found
+    headers = {
+        'ETag': asset.etag,
+        'Cache-Control': IMMUTABLE_CACHE_CONTROL if immutable else 'no-cache',
+        'Vary': 'Accept-Encoding'
+    }
+    if etag_matches(asset.etag, request.headers.get('If-None-Match')):
+        return app.response_class(status=304, headers=headers)
+    encoding, body = assets.select(asset, request.headers.get('Accept-Encoding'))
+    if encoding != 'identity':
+        headers['Content-Encoding'] = encoding
+    return app.response_class(body, content_type=asset.mimetype, headers=headers)
+
+# Chaque endpoint lié à l'état du bot est construit par une fonction
+# bot_*_payload, réutilisée par les routes asynchrones d'asgi_server
+# (mode single_loop) : retourne (données, code HTTP).
+
+def bot_payload():
+    _, updated_at, voice_data = discord_bot.get_voice_snapshot()
     
-    return jsonify({
+    return {
         'success': True,
         'data': voice_data,
         'metadata': {
             'total_channels': len(voice_data),
             'total_members': sum(channel['count'] for channel in voice_data.values()),
-            'timestamp': health_monitor.get_status()['timestamp']
+            'timestamp': updated_at
         }
-    })
+    }, 200
 
-@app.route('/api/bot/channels')
-def api_bot_channels():
-    """Liste des salons vocaux surveillés"""
-    health_monitor.web_request()
+def bot_channels_payload():
     voice_data = discord_bot.get_voice_data()
     
     channels = []
@@ -71,20 +126,15 @@ def api_bot_channels():
             'members': [m['name'] for m in data['members']]
         })
     
-    return jsonify({
+    return {
         'success': True,
         'channels': channels,
         'total': len(channels)
-    })
+    }, 200
 
-@app.route('/api/bot/members')
-def api_bot_members():
-    """Liste de tous les membres en vocal"""
-    health_monitor.web_request()
+def bot_members_payload(channel_filter=None):
     voice_data = discord_bot.get_voice_data()
     
-    channel_filter = request.args.get('channel')
-    
     all_members = []
     for channel_name, data in voice_data.items():
         if channel_filter and channel_name != channel_filter:
@@ -95,45 +145,33 @@ def api_bot_members():
             member_info['channel'] = channel_name
             all_members.append(member_info)
     
-    return jsonify({
+    return {
         'success': True,
         'members': all_members,
         'total': len(all_members),
         'filter': channel_filter
-    })
+    }, 200
 
-@app.route('/api/bot/member/<member_name>')
-def api_bot_member(member_name):
-    """
-    Informations détaillées sur un membre spécifique (profil complet)
-    
-    Args:
-        member_name: Nom du membre (pseudo Discord ou display name)
-    
-    Returns:
-        JSON avec toutes les infos du profil ou 404 si non trouvé
-    """
-    health_monitor.web_request()
-    
-    member_info = discord_bot.get_member_full_info(member_name)
-    
+def member_full_info(member_name):
+    """Profil complet d'un membre ; demandé au bot via le bus dans un worker web"""
+    if bus_client:
+        return bus_client.request('member', member_name)
+    return discord_bot.get_member_full_info(member_name)
+
+def bot_member_payload(member_name, member_info):
     if member_info:
-        return jsonify({
+        return {
             'success': True,
             'member': member_info
-        })
+        }, 200
     
-    return jsonify({
+    return {
         'success': False,
         'error': 'Member not found in any voice channel',
         'member_name': member_name
-    }), 404
+    }, 404
 
-
-@app.route('/api/bot/stats')
-def api_bot_stats():
-    """Statistiques générales des salons vocaux"""
-    health_monitor.web_request()
+def bot_stats_payload():
     voice_data = discord_bot.get_voice_data()
     
     total_members = 0
@@ -165,7 +203,7 @@ def api_bot_stats():
             if status in status_count:
                 status_count[status] += 1
     
-    return jsonify({
+    return {
         'success': True,
         'stats': {
             'total_channels': len(voice_data),
@@ -176,30 +214,21 @@ def api_bot_stats():
             'deafened': deafened_count,
             'status_breakdown': status_count
         }
-    })
+    }, 200
 
-@app.route('/api/status')
-def api_status():
-    """Statut détaillé du système"""
-    health_monitor.web_request()
-    return jsonify(health_monitor.get_status())
+def status_payload():
+    return health_monitor.get_status(), 200
 
-@app.route('/api/logs')
-def api_logs():
-    """Historique des logs d'activité"""
-    health_monitor.web_request()
-    
+def logs_payload(log_type=None, limit=None):
     all_logs = activity_logger.get_all_logs()
     
-    log_type = request.args.get('type')
     if log_type:
         all_logs = [log for log in all_logs if log['type'] == log_type]
     
-    limit = request.args.get('limit', type=int)
     if limit:
         all_logs = all_logs[-limit:]
     
-    return jsonify({
+    return {
         'success': True,
         'logs': all_logs,
         'total': len(all_logs),
@@ -207,95 +236,723 @@ def api_logs():
             'type': log_type,
             'limit': limit
         }
-    })
+    }, 200
+
+def health_payload():
+    status = health_monitor.get_status()
+    http_code = 200 if status['status'] == 'healthy' else 503
+    return status, http_code
+
+# ============================================
+# RÉPONSES EN CACHE (état vocal)
+# ============================================
+
+def _json_default(value):
+    """Dates en ISO 8601 pour json.dumps, comme orjson (ex. last_error de health_monitor)"""
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    raise TypeError(f'Object of type {type(value).__name__} is not JSON serializable')
+
+def dumps_json(payload):
+    """Sérialise en JSON (bytes UTF-8) ; orjson s'il est installé"""
+    if orjson:
+        return orjson.dumps(payload)
+    return json.dumps(payload, ensure_ascii=False, separators=(',', ':'), default=_json_default).encode('utf-8')
+
+CachedJSON = namedtuple('CachedJSON', 'version body etag status')
+
+# Corps JSON des endpoints de l'état vocal, sérialisés une fois par version
+# de voice_data : {clé: CachedJSON}
+response_cache = {}
+MAX_CACHED_RESPONSES = 256
+
+def cached_json(key, build):
+    """
+    Réponse de build() pour la version courante de voice_data
+
+    L'ETag (fort) est un hash du corps : une nouvelle version au contenu
+    identique garde le même ETag. Clé None : pas de mise en cache.
+    """
+    version = discord_bot.get_voice_snapshot()[0]
+    entry = response_cache.get(key)
+    if entry and entry.version == version:
+        return entry
+    
+    payload, status = build()
+    body = dumps_json(payload)
+    entry = CachedJSON(version, body, '"%s"' % hashlib.blake2b(body, digest_size=16).hexdigest(), status)
+    if key is not None:
+        if len(response_cache) >= MAX_CACHED_RESPONSES:
+            response_cache.clear()
+        response_cache[key] = entry
+    return entry
+
+def bot_json():
+    return cached_json('bot', bot_payload)
+
+def bot_channels_json():
+    return cached_json('channels', bot_channels_payload)
+
+def bot_members_json(channel_filter=None):
+    # Filtre sur un salon inconnu : réponse non mise en cache
+    key = ('members', channel_filter) if channel_filter is None or channel_filter in discord_bot.get_voice_data() else None
+    return cached_json(key, lambda: bot_members_payload(channel_filter))
+
+def bot_stats_json():
+    return cached_json('stats', bot_stats_payload)
+
+def etag_matches(etag, if_none_match):
+    """If-None-Match contient-il l'ETag ? (comparaison faible : W/ ignoré)"""
+    if not if_none_match:
+        return False
+    def opaque(tag):
+        tag = tag.strip()
+        return tag[2:] if tag.startswith('W/') else tag
+    tags = [opaque(tag) for tag in if_none_match.split(',')]
+    return '*' in tags or opaque(etag) in tags
+
+def not_modified(entry, if_none_match):
+    """If-None-Match correspond-il à l'ETag de la réponse ?"""
+    return entry.status == 200 and etag_matches(entry.etag, if_none_match)
+
+def cached_response(entry):
+    """Réponse Flask d'un CachedJSON : 304 si le client a déjà cette version"""
+    headers = {'ETag': entry.etag, 'Cache-Control': 'no-cache'}
+    if not_modified(entry, request.headers.get('If-None-Match')):
+        return app.response_class(status=304, headers=headers)
+    return app.response_class(entry.body, status=entry.status, mimetype='application/json', headers=headers)
+
+@app.route('/api/bot')
+def api_bot():
+    """Retourne les données brutes du bot"""
+    health_monitor.web_request()
+    return cached_response(bot_json())
+
+@app.route('/api/bot/channels')
+def api_bot_channels():
+    """Liste des salons vocaux surveillés"""
+    health_monitor.web_request()
+    return cached_response(bot_channels_json())
+
+@app.route('/api/bot/members')
+def api_bot_members():
+    """Liste de tous les membres en vocal"""
+    health_monitor.web_request()
+    return cached_response(bot_members_json(request.args.get('channel')))
+
+@app.route('/api/bot/member/<member_name>')
+def api_bot_member(member_name):
+    """
+    Informations détaillées sur un membre spécifique (profil complet)
+    
+    Args:
+        member_name: Nom du membre (pseudo Discord ou display name)
+    
+    Returns:
+        JSON avec toutes les infos du profil ou 404 si non trouvé
+    """
+    health_monitor.web_request()
+    return bot_member_payload(member_name, member_full_info(member_name))
+
+@app.route('/api/bot/stats')
+def api_bot_stats():
+    """Statistiques générales des salons vocaux"""
+    health_monitor.web_request()
+    return cached_response(bot_stats_json())
+
+def time_arg(name):
+    """
+    Paramètre de date : epoch (secondes) ou ISO 8601 ; None si absent,
+    ValueError si invalide, infini ou hors des dates représentables
+    """
+    value = request.args.get(name)
+    if not value:
+        return None
+    try:
+        try:
+            timestamp = float(value)
+        except ValueError:
+            timestamp = datetime.fromisoformat(value).timestamp()
+        if not math.isfinite(timestamp):
+            raise ValueError(value)
+        datetime.fromtimestamp(timestamp)
+    except (OverflowError, OSError) as e:
+        raise ValueError(value) from e
+    return timestamp
+
+def occupancy_payload(channel=None, start=None, end=None, step=None):
+    """Série d'occupation ; calculée par le bot via le bus dans un worker web"""
+    if bus_client:
+        return bus_client.request('occupancy', channel, start, end, step)
+    return occupancy.get_series(channel, start, end, step)
+
+@app.route('/api/stats/occupancy')
+def api_stats_occupancy():
+    """Membres connectés par salon au cours du temps (?channel=, ?from=, ?to=, ?step=)"""
+    health_monitor.web_request()
+    try:
+        start, end = time_arg('from'), time_arg('to')
+    except ValueError:
+        return jsonify({'success': False, 'error': 'Invalid from/to (epoch seconds or ISO 8601)'}), 400
+    step = request.args.get('step', type=int)
+    if step is not None and step <= 0:
+        return jsonify({'success': False, 'error': 'Invalid step'}), 400
+    channel = request.args.get('channel')
+    series = occupancy_payload(channel, start, end, step)
+    if series is None:
+        return jsonify({'success': False, 'error': 'Unknown channel', 'channel': channel}), 404
+    return jsonify(dict(series, success=True))
+
+def heatmap_payload(start=None, end=None, by='channel', name=None):
+    """Cartes de chaleur ; calculées par le bot via le bus dans un worker web"""
+    if bus_client:
+        return bus_client.request('heatmap', start, end, by, name, timeout=30)
+    return heatmaps.heatmap(start, end, by, name)
+
+@app.route('/api/stats/heatmap')
+def api_stats_heatmap():
+    """Présence par jour de la semaine et par heure (?by=channel|member, ?name=, ?from=, ?to=)"""
+    health_monitor.web_request()
+    if not analytics_available:
+        return jsonify({'success': False, 'error': 'NumPy is not installed'}), 503
+    try:
+        start, end = time_arg('from'), time_arg('to')
+    except ValueError:
+        return jsonify({'success': False, 'error': 'Invalid from/to (epoch seconds or ISO 8601)'}), 400
+    if start is not None and end is not None and start >= end:
+        return jsonify({'success': False, 'error': 'from must be before to'}), 400
+    by = request.args.get('by', 'channel')
+    if by not in HEATMAP_GROUP_BY:
+        return jsonify({'success': False, 'error': 'Invalid by', 'by': list(HEATMAP_GROUP_BY)}), 400
+    name = request.args.get('name')
+    heatmap = heatmap_payload(start, end, by, name)
+    if heatmap is None:
+        return jsonify({'success': False, 'error': f'Unknown {by}', 'name': name}), 404
+    return jsonify(dict(heatmap, success=True))
+
+def companions_payload(member_name, limit=10, channel=None):
+    """Compagnons de vocal ; lus par le bot via le bus dans un worker web"""
+    if bus_client:
+        return bus_client.request('companions', member_name, limit, channel)
+    return stats_tracker.get_companions(member_name, limit, channel)
+
+def copresence_graph_payload(channel=None, min_seconds=0):
+    if bus_client:
+        return bus_client.request('copresence_graph', channel, min_seconds, timeout=30)
+    return stats_tracker.get_copresence_graph(channel, min_seconds)
+
+@app.route('/api/stats/companions/<member_name>')
+def api_stats_companions(member_name):
+    """Membres avec qui member_name passe le plus de temps en vocal (?limit=, ?channel=)"""
+    health_monitor.web_request()
+    limit = request.args.get('limit', 10, type=int)
+    companions = companions_payload(member_name, max(1, min(limit, 100)), request.args.get('channel'))
+    return jsonify({'success': True, 'member': member_name, 'companions': companions or []})
+
+@app.route('/api/stats/copresence/graph')
+def api_stats_copresence_graph():
+    """Graphe de co-présence (?channel=, ?min_seconds=, ?format=json|graphml)"""
+    health_monitor.web_request()
+    export_format = request.args.get('format', 'json')
+    if export_format not in ('json', 'graphml'):
+        return jsonify({'success': False, 'error': 'Invalid format', 'formats': ['json', 'graphml']}), 400
+    graph = copresence_graph_payload(request.args.get('channel'), request.args.get('min_seconds', 0, type=float))
+    if graph is None:
+        graph = {'nodes': [], 'edges': []}
+    if export_format == 'graphml':
+        return app.response_class(to_graphml(graph), mimetype='application/graphml+xml', headers={
+            'Content-Disposition': 'attachment; filename="copresence.graphml"'
+        })
+    return jsonify(dict(graph, success=True))
+
+def day_range(start, end, default_days):
+    """Jours inclus de from à to (epoch) ; par défaut les `default_days` derniers jours"""
+    end_day = datetime.fromtimestamp(end).date() if end is not None else today()
+    start_day = (datetime.fromtimestamp(start).date() if start is not None
+                 else end_day - timedelta(days=default_days - 1))
+    return start_day, end_day
+
+def durations_payload(by='member', start_day=None, end_day=None, name=None):
+    """Distribution des durées ; lue par le bot via le bus dans un worker web"""
+    if bus_client:
+        return bus_client.request('durations', by, start_day, end_day, name)
+    return stats_tracker.get_duration_stats(by, start_day, end_day, name)
+
+@app.route('/api/stats/durations')
+def api_stats_durations():
+    """Percentiles et histogramme des durées (?by=member|channel, ?name=, ?from=, ?to=)"""
+    health_monitor.web_request()
+    try:
+        start, end = time_arg('from'), time_arg('to')
+    except ValueError:
+        return jsonify({'success': False, 'error': 'Invalid from/to (epoch seconds or ISO 8601)'}), 400
+    by = request.args.get('by', 'member')
+    if by not in ('member', 'channel'):
+        return jsonify({'success': False, 'error': 'Invalid by', 'by': ['member', 'channel']}), 400
+    
+    start_day, end_day = day_range(start, end, DURATION_STATS_DEFAULT_DAYS)
+    if start_day > end_day:
+        return jsonify({'success': False, 'error': 'from must be before to'}), 400
+    
+    durations = durations_payload(by, start_day.isoformat(), end_day.isoformat(), request.args.get('name'))
+    if durations is None:
+        return jsonify({'success': False, 'error': 'Stats unavailable'}), 503
+    payload = dict(durations, success=True, by=by)
+    payload['from'], payload['to'] = start_day.isoformat(), end_day.isoformat()
+    return jsonify(payload)
+
+def member_history_payload(member_name, start_day, end_day, longest=10, before=None, limit=MEMBER_SESSIONS_PAGE_SIZE):
+    """Historique d'un membre ; lu par le bot via le bus dans un worker web"""
+    if bus_client:
+        return bus_client.request('member_history', member_name, start_day, end_day, longest, before, limit)
+    return stats_tracker.get_member_history(member_name, start_day, end_day, longest, before, limit)
+
+@app.route('/api/stats/member/<member_name>')
+def api_stats_member(member_name):
+    """
+    Historique vocal d'un membre : totaux par jour, salons, sessions les plus
+    longues et liste paginée des sessions (?from=, ?to=, ?longest=, ?limit=, ?before=)
+    """
+    health_monitor.web_request()
+    try:
+        start, end = time_arg('from'), time_arg('to')
+    except ValueError:
+        return jsonify({'success': False, 'error': 'Invalid from/to (epoch seconds or ISO 8601)'}), 400
+    start_day, end_day = day_range(start, end, MEMBER_HISTORY_DEFAULT_DAYS)
+    if start_day > end_day:
+        return jsonify({'success': False, 'error': 'from must be before to'}), 400
+    
+    # Page suivante : next_before de la page précédente (début de sa dernière session)
+    before = request.args.get('before')
+    if before:
+        try:
+            before = datetime.fromisoformat(before).isoformat()
+        except ValueError:
+            return jsonify({'success': False, 'error': 'Invalid before (ISO 8601)'}), 400
+    longest = max(1, min(request.args.get('longest', 10, type=int), 100))
+    limit = max(1, min(request.args.get('limit', MEMBER_SESSIONS_PAGE_SIZE, type=int), 500))
+    
+    history = member_history_payload(member_name, start_day.isoformat(), end_day.isoformat(), longest, before or None, limit)
+    if history is None:
+        return jsonify({'success': False, 'error': 'Unknown member', 'member': member_name}), 404
+    payload = dict(history, success=True, member=member_name)
+    payload['from'], payload['to'] = start_day.isoformat(), end_day.isoformat()
+    return jsonify(payload)
+
+def range_stats_payload(start_day=None, end_day=None, group_by='member', name=None):
+    """Stats d'une période ; lues par le bot via le bus dans un worker web"""
+    if bus_client:
+        return bus_client.request('range_stats', start_day, end_day, group_by, name)
+    return stats_tracker.get_range_stats(start_day, end_day, group_by, name)
+
+@app.route('/api/stats/range')
+def api_stats_range():
+    """Stats d'une période (?period=today|week|month|year ou ?from=&to=, ?group_by=member|channel|day, ?name=)"""
+    health_monitor.web_request()
+    try:
+        start, end = time_arg('from'), time_arg('to')
+    except ValueError:
+        return jsonify({'success': False, 'error': 'Invalid from/to (epoch seconds or ISO 8601)'}), 400
+    group_by = request.args.get('group_by', 'member')
+    if group_by not in RANGE_GROUP_BY:
+        return jsonify({'success': False, 'error': 'Invalid group_by', 'group_by': list(RANGE_GROUP_BY)}), 400
+    if group_by == 'day' and request.args.get('name') is not None:
+        return jsonify({'success': False, 'error': 'name requires group_by=member or group_by=channel'}), 400
+    
+    # Période nommée, ou jours inclus de from à to (défaut : aujourd'hui)
+    if start is None and end is None:
+        period = request.args.get('period', 'today')
+        if period not in STATS_PERIODS:
+            return jsonify({'success': False, 'error': 'Invalid period', 'periods': list(STATS_PERIODS)}), 400
+        start_day, end_day = period_days(period, today())
+    elif start is None:
+        return jsonify({'success': False, 'error': 'from is required with to'}), 400
+    else:
+        period = 'custom'
+        start_day = datetime.fromtimestamp(start).date().isoformat()
+        end_day = (datetime.fromtimestamp(end).date() if end is not None else today()).isoformat()
+        if start_day > end_day:
+            return jsonify({'success': False, 'error': 'from must be before to'}), 400
+    
+    stats = range_stats_payload(start_day, end_day, group_by, request.args.get('name'))
+    if stats is None:
+        return jsonify({'success': False, 'error': 'Stats unavailable'}), 503
+    return jsonify({'success': True, 'period': period, 'group_by': group_by, 'from': start_day, 'to': end_day,
+                    'stats': stats})
+
+@app.route('/api/status')
+def api_status():
+    """Statut détaillé du système"""
+    health_monitor.web_request()
+    return status_payload()
+
+@app.route('/api/status/history')
+def api_status_history():
+    """Historique de santé sous-échantillonné (?resolution=1s|1m|1h, ?limit=)"""
+    health_monitor.web_request()
+    resolution = request.args.get('resolution', '1m')
+    limit = request.args.get('limit', type=int)
+    history = health_history.get_history(resolution, limit)
+    if history is None:
+        return jsonify({
+            'success': False,
+            'error': 'Unknown resolution',
+            'resolutions': list(health_history.tiers)
+        }), 400
+    if bus_client:
+        # Worker web : historique du processus du bot (boucle, événements, SQLite)
+        history['bot'] = bus_client.request('health_history', resolution, limit)
+    return jsonify(dict(history, success=True))
+
+@app.route('/api/logs')
+def api_logs():
+    """Historique des logs d'activité"""
+    health_monitor.web_request()
+    return logs_payload(request.args.get('type'), request.args.get('limit', type=int))
 
 @app.route('/health')
 def health_check():
     """Health check endpoint"""
     health_monitor.web_request()
-    status = health_monitor.get_status()
-    http_code = 200 if status['status'] == 'healthy' else 503
-    return jsonify(status), http_code
+    return health_payload()
+
+# ============================================
+# MÉTRIQUES (/metrics)
+# ============================================
+
+REQUEST_SECONDS = metrics.histogram('web_request_duration_seconds', 'Durée des requêtes HTTP par route',
+                                    ('route', 'method', 'status'))
+
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+
+@app.after_request
+def observe_request(response):
+    """Durée de la requête, par route (règle Flask, pas l'URL : cardinalité bornée)"""
+    started = g.pop('request_started', None)
+    if started is not None:
+        route = request.url_rule.rule if request.url_rule else 'other'
+        REQUEST_SECONDS.observe(time.perf_counter() - started, route, request.method, str(response.status_code))
+    return response
+
+def metrics_text():
+    """Métriques du processus ; dans un worker web, avec celles du bot (via le bus)"""
+    families = metrics.collect()
+    if bus_client:
+        bot_families = bus_client.request('metrics') or []
+        families = merge_families(with_labels(families, process='web', pid=str(os.getpid())),
+                                  with_labels(bot_families, process='bot'))
+    return render(families)
+
+@app.route('/metrics')
+def metrics_endpoint():
+    """Métriques au format texte Prometheus"""
+    return app.response_class(metrics_text(), content_type=METRICS_CONTENT_TYPE)
+
+# ============================================
+# TRACES ET ADMINISTRATION (/admin/)
+# ============================================
+
+@app.before_request
+def start_request_span():
+    """Span racine de la requête, nommée d'après la route (échantillonnée)"""
+    route = request.url_rule.rule if request.url_rule else 'other'
+    g.request_span = tracer.start(f'{request.method} {route}')
+
+@app.after_request
+def tag_request_span(response):
+    span = g.get('request_span')
+    if span is not None:
+        span.set(status=response.status_code)
+    return response
+
+@app.teardown_request
+def end_request_span(error=None):
+    span = g.pop('request_span', None)
+    if span is not None:
+        tracer.end(span, error)
+
+def require_admin():
+    """
+    Vérifie le jeton d'administration (Authorization: Bearer <jeton> ou ?token=)
+
+    Interrompt la requête : 404 si ADMIN_TOKEN n'est pas configuré, 401 si
+    le jeton est absent ou faux.
+    """
+    if not ADMIN_TOKEN:
+        abort(404)
+    authorization = request.headers.get('Authorization', '')
+    if authorization.startswith('Bearer '):
+        token = authorization[len('Bearer '):].strip()
+    else:
+        token = request.args.get('token', '')
+    if not hmac.compare_digest(token.encode('utf-8'), ADMIN_TOKEN.encode('utf-8')):
+        abort(401)
+
+def traces_payload(limit=None):
+    """Traces lentes et requêtes SQLite lentes du processus, les plus récentes d'abord"""
+    limit = limit or 50
+    return {
+        'tracing': tracer.get_status(),
+        'slow_traces': tracer.get_slow_traces(limit),
+        'sqlite': slow_queries.get_status(),
+        'slow_queries': slow_queries.get_entries(limit)
+    }
+
+@app.route('/admin/traces')
+def admin_traces():
+    """Traces lentes récentes et journal des requêtes lentes (jeton requis)"""
+    require_admin()
+    limit = request.args.get('limit', type=int)
+    payload = traces_payload(limit)
+    if bus_client:
+        # Worker web : les événements gateway et SQLite sont traités par le bot
+        payload['bot'] = bus_client.request('traces', limit)
+    return jsonify(payload)
+
+def profile_with_bot(seconds, interval_ms):
+    """Worker web : profils du worker et du bot, mesurés pendant les mêmes secondes"""
+    bot_profile = []
+    timeout = min(seconds, PROFILE_MAX_SECONDS) + 5
+    thread = threading.Thread(target=lambda: bot_profile.append(
+        bus_client.request('profile', seconds, interval_ms, 'bot', timeout=timeout)), daemon=True)
+    thread.start()
+    local = cpu_profiler.collapsed(seconds, interval_ms, root=f'web[{os.getpid()}]')
+    thread.join()
+    if local is None or not bot_profile or bot_profile[0] is None:
+        return None
+    return local + bot_profile[0]
+
+@app.route('/admin/profile')
+def admin_profile():
+    """Profil CPU de tous les threads pendant ?seconds= secondes (format collapsed, jeton requis)"""
+    require_admin()
+    seconds = request.args.get('seconds', 10, type=float)
+    interval_ms = request.args.get('interval_ms', PROFILE_INTERVAL_MS, type=float)
+    if bus_client:
+        profile = profile_with_bot(seconds, interval_ms)
+    else:
+        profile = cpu_profiler.collapsed(seconds, interval_ms)
+    if profile is None:
+        return jsonify({'success': False, 'error': 'A profile is already running'}), 409
+    return app.response_class(profile, content_type='text/plain; charset=utf-8',
+                              headers={'Content-Disposition': 'attachment; filename="profile.collapsed"'})
+
+def memory_payload(action='report', *args):
+    """Démarre/arrête tracemalloc ou mesure la mémoire du processus"""
+    if action == 'start':
+        return memory_profiler.start(*args)
+    if action == 'stop':
+        return memory_profiler.stop()
+    structures, exclude = discord_bot.memory_structures()
+    return memory_profiler.report(structures, exclude, *args)
+
+@app.route('/admin/memory')
+def admin_memory():
+    """Taille des structures suivies et, si tracemalloc tourne, allocations et variations (jeton requis)"""
+    require_admin()
+    args = (request.args.get('limit', 20, type=int), request.args.get('reset_baseline') == '1')
+    payload = memory_payload('report', *args)
+    if bus_client:
+        payload['bot'] = bus_client.request('memory', 'report', *args, timeout=30)
+    return jsonify(payload)
+
+@app.route('/admin/memory/<action>', methods=['POST'])
+def admin_memory_action(action):
+    """start (référence prise au démarrage, ?frames=) ou stop de tracemalloc (jeton requis)"""
+    require_admin()
+    if action not in ('start', 'stop'):
+        abort(404)
+    args = (request.args.get('frames', TRACEMALLOC_FRAMES, type=int),) if action == 'start' else ()
+    payload = memory_payload(action, *args)
+    if bus_client:
+        payload['bot'] = bus_client.request('memory', action, *args, timeout=30)
+    return jsonify(payload)
 
 # ============================================
 # WEBSOCKET HANDLERS
 # ============================================
 
+def apply_subscription(data, announce=False):
+    """Abonne le client courant (salles) et lui envoie l'état de son périmètre"""
+    subscription, joined, left = subscriptions.subscribe(request.sid, data)
+    for room in joined:
+        join_room(room)
+    for room in left:
+        leave_room(room)
+    if announce:
+        emit('subscribed', subscription)
+    if 'voice' in subscription['feeds']:
+        emit('voice_update', client_payload(subscription, 'voice_update',
+                                            voice_view(subscription, discord_bot.get_voice_data())))
+    if 'health' in subscription['feeds']:
+        emit('health_status', health_monitor.get_status())
+    return subscription
+
 @socketio.on('connect')
-def handle_connect():
+@traced('socket connect')
+def handle_connect(auth=None):
     """Envoie les données initiales lors de la connexion"""
     print("🔌 Client connecté")
     health_monitor.client_connected()
-    emit('voice_update', discord_bot.get_voice_data())
-    emit('health_status', health_monitor.get_status())
+    apply_subscription(auth.get('subscribe') if isinstance(auth, dict) else None)
 
 @socketio.on('disconnect')
-def handle_disconnect():
+def handle_disconnect(*args):
     """Gère la déconnexion d'un client"""
     print("🔌 Client déconnecté")
+    subscriptions.remove(request.sid)
     health_monitor.client_disconnected()
 
+@socketio.on('subscribe')
+@traced('socket subscribe')
+def handle_subscribe(data=None):
+    """Change les flux, salons et serveurs suivis par le client"""
+    apply_subscription(data, announce=True)
+
 @socketio.on('ping')
 def handle_ping():
     """Répond au ping du client"""
     emit('pong', {'timestamp': health_monitor.get_status()['timestamp']})
 
 @socketio.on('get_logs')
+@traced('socket get_logs')
 def handle_get_logs(data):
     """Envoie les logs existants au client"""
     limit = data.get('limit', 50) if data else 50
-    logs = activity_logger.get_logs(limit)
-    emit('logs_history', {'logs': logs})
+    emit('logs_history', logs_history_payload(request.sid, limit))
 
-@socketio.on('get_stats')
-def handle_get_stats(data):
-    """Envoie les statistiques complètes"""
-    period = data.get('period', 'today') if data else 'today'
-    
-    if period == 'today':
-        all_stats = stats_tracker.get_daily_stats()
-    else:
-        all_stats = stats_tracker.get_weekly_stats()
+def logs_history_payload(sid, limit=50):
+    """Derniers logs du périmètre auquel le client est abonné"""
+    logs = logs_view(subscriptions.get(sid), activity_logger.get_all_logs(), discord_bot.get_voice_data())
+    return {'logs': logs[-limit:]}
+
+def stats_request(data):
+    """
+    Période demandée par get_stats : {'period': 'today'|'week'|'month'|'year'}
+    ou {'from': jour ISO, 'to': jour ISO (défaut : aujourd'hui)}
     
-    top_users = stats_tracker.get_top_users_today(limit=10)
-    records = stats_tracker.get_records()
-    current_sessions = stats_tracker.get_current_sessions()
+    Returns:
+        (période, premier jour, dernier jour) ; jours None pour une période nommée
+    """
+    data = data or {}
+    if data.get('from'):
+        try:
+            start_day = date.fromisoformat(data['from']).isoformat()
+            end_day = date.fromisoformat(data['to']).isoformat() if data.get('to') else None
+        except (TypeError, ValueError):
+            return 'today', None, None
+        if end_day is not None and start_day > end_day:
+            return 'today', None, None
+        return 'custom', start_day, end_day
+    period = data.get('period', 'today')
+    return (period if period in STATS_PERIODS else 'today'), None, None
+
+def build_stats_payload(period='today', start_day=None, end_day=None):
+    """Construit le payload de l'événement stats_update (période nommée, ou 'custom' de start_day à end_day)"""
+    if period != 'custom':
+        start_day, end_day = period_days(period, stats_tracker.clock().date())
+    elif end_day is None:
+        end_day = stats_tracker.clock().date().isoformat()
+    all_stats = stats_tracker.get_range_stats(start_day, end_day)
     
-    emit('stats_update', {
+    return {
         'all_stats': all_stats,
-        'top_users': top_users,
-        'records': records,
-        'current_sessions': current_sessions,
-        'period': period
-    })
+        'top_users': top_users(all_stats, limit=10),
+        'records': stats_tracker.get_records(),
+        'current_sessions': stats_tracker.get_current_sessions(),
+        'period': period,
+        'from': start_day,
+        'to': end_day
+    }
+
+def request_stats_payload(period='today', start_day=None, end_day=None):
+    """build_stats_payload, calculé par le bot via le bus dans un worker web"""
+    if bus_client:
+        return bus_client.request('stats', period, start_day, end_day)
+    return build_stats_payload(period, start_day, end_day)
+
+def handle_bus_request(kind, *args):
+    """Côté bot : répond aux requêtes des workers web reçues sur le bus"""
+    if kind == 'member':
+        return discord_bot.get_member_full_info(*args)
+    if kind == 'stats':
+        return build_stats_payload(*args)
+    if kind == 'metrics':
+        return metrics.collect()
+    if kind == 'traces':
+        return traces_payload(*args)
+    if kind == 'occupancy':
+        return occupancy.get_series(*args)
+    if kind == 'heatmap':
+        return heatmaps.heatmap(*args)
+    if kind == 'companions':
+        return stats_tracker.get_companions(*args)
+    if kind == 'copresence_graph':
+        return stats_tracker.get_copresence_graph(*args)
+    if kind == 'durations':
+        return stats_tracker.get_duration_stats(*args)
+    if kind == 'range_stats':
+        return stats_tracker.get_range_stats(*args)
+    if kind == 'member_history':
+        return stats_tracker.get_member_history(*args)
+    if kind == 'health_history':
+        return health_history.get_history(*args)
+    if kind == 'profile':
+        return cpu_profiler.collapsed(*args)
+    if kind == 'memory':
+        return memory_payload(*args)
+    return None
+
+@socketio.on('get_stats')
+@traced('socket get_stats')
+def handle_get_stats(data):
+    """Envoie les statistiques complètes"""
+    emit('stats_update', client_payload(subscriptions.get(request.sid), 'stats_update',
+                                        build_stats_payload(*stats_request(data))))
+
+@traced('broadcast_stats')
+def broadcast_stats():
+    """Diffuse les stats du jour à tous les clients"""
+    if discord_bot.socketio_instance:
+        discord_bot.socketio_instance.emit('stats_update', build_stats_payload('today'))
 
 # Mise à jour automatique des stats
 def emit_stats_update():
     while True:
         time.sleep(30)
         try:
-            all_stats = stats_tracker.get_daily_stats()
-            top_users = stats_tracker.get_top_users_today(limit=10)
-            records = stats_tracker.get_records()
-            current_sessions = stats_tracker.get_current_sessions()
-            
-            socketio.emit('stats_update', {
-                'all_stats': all_stats,
-                'top_users': top_users,
-                'records': records,
-                'current_sessions': current_sessions,
-                'period': 'today'
-            })
+            broadcast_stats()
         except Exception as e:
             print(f"❌ Erreur stats update: {e}")
 
-# Démarrer le thread de mise à jour des stats
-stats_thread = threading.Thread(target=emit_stats_update, daemon=True)
-stats_thread.start()
+# Démarrer le thread de mise à jour des stats (tâche asyncio dans les modes asgi)
+if WEB_SERVER_MODE == 'werkzeug':
+    stats_thread = threading.Thread(target=emit_stats_update, daemon=True)
+    stats_thread.start()
 
 # ============================================
 # LANCEMENT DU SERVEUR
 # ============================================
 
 def run_server():
-    socketio.run(app, host=FLASK_HOST, port=FLASK_PORT, debug=False, allow_unsafe_werkzeug=True)
\ No newline at end of file
+    """
+    Lance le serveur web (bloquant) selon WEB_SERVER_MODE
+
+    En mode single_loop, main.py sert l'application sur la boucle du bot
+    (asgi_server.serve_with) ; appelée directement, cette fonction lui donne
+    sa propre boucle comme en mode asgi.
+    """
+    if WEB_SERVER_MODE != 'werkzeug':
+        import asgi_server
+        asgi_server.run_server()
+        return
+    health_history.start()
+    socketio.run(app, host=FLASK_HOST, port=FLASK_PORT, debug=False, allow_unsafe_werkzeug=True)
+
+def stop_server():
+    """Arrêt gracieux (modes asgi) ; le serveur Werkzeug s'arrête avec le processus"""
+    if WEB_SERVER_MODE != 'werkzeug':
+        import asgi_server
+        asgi_server.stop_server()
\ No newline at end of file
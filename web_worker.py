@@ -0,0 +1,118 @@
+# -*- coding: utf-8 -*-
+"""
+Workers web sans état (WEB_SERVER_MODE = 'workers')
+
+Chaque worker sert l'interface, l'API REST et Socket.IO à partir d'une copie
+de l'état du bot reçue sur le bus de messages (message_bus.py). Les workers
+partagent le port d'écoute ; main.py les lance en mode 'workers', ou
+séparément du bot :
+    python web_worker.py --workers 4
+"""
+
+import argparse
+import multiprocessing
+import signal
+import socket
+
+import config
+config.WEB_SERVER_MODE = 'workers'
+
+import uvicorn
+
+import asgi_server
+import discord_bot
+import web_server
+from activity_logger import activity_logger
+from health_monitor import health_monitor
+from message_bus import BusSubscriber, apply_voice_patch, require_authkey
+from config import (FLASK_HOST, FLASK_PORT, WEB_WORKERS, WEB_KEEPALIVE_TIMEOUT,
+                    WEB_GRACEFUL_TIMEOUT, SOCKETIO_PER_MESSAGE_DEFLATE, BUS_ADDRESS, BUS_AUTHKEY)
+
+def on_bus_event(event, data):
+    """Applique un événement du bus à l'état local et le diffuse aux clients du worker"""
+    if event == 'voice_update':
+        discord_bot.set_voice_data(data)
+    elif event == 'voice_patch':
+        discord_bot.set_voice_data(apply_voice_patch(discord_bot.get_voice_data(), data))
+        event, data = 'voice_update', discord_bot.get_voice_data()
+    elif event == 'activity_logs':
+        # État initial (abonnement ou reconnexion au broker)
+        activity_logger.clear_logs()
+        for log in data:
+            activity_logger.add_log(log)
+        return
+    elif event == 'activity_log':
+        activity_logger.add_log(data)
+    elif event == 'health_status':
+        health_monitor.set_remote_status(data)
+        data = health_monitor.get_status()
+    asgi_server.room_emitter.emit(event, data)
+
+def run_worker(sock, bus_address, authkey):
+    """Processus worker : s'abonne au bus et sert l'application sur le socket partagé"""
+    subscriber = BusSubscriber(on_bus_event, address=bus_address, authkey=authkey)
+    web_server.use_bus(subscriber)
+    subscriber.start()
+
+    server = uvicorn.Server(uvicorn.Config(
+        asgi_server.asgi_app,
+        timeout_keep_alive=WEB_KEEPALIVE_TIMEOUT,
+        timeout_graceful_shutdown=WEB_GRACEFUL_TIMEOUT,
+        ws_per_message_deflate=SOCKETIO_PER_MESSAGE_DEFLATE,
+        log_level='warning'
+    ))
+    server.run(sockets=[sock])
+
+def start_workers(count=WEB_WORKERS, host=FLASK_HOST, port=FLASK_PORT, bus_address=BUS_ADDRESS, authkey=BUS_AUTHKEY):
+    """
+    Lance `count` workers sur un socket d'écoute partagé ; retourne les processus
+
+    La clé du bus leur est transmise par le canal de lancement de multiprocessing
+    (ni argument de ligne de commande, ni variable d'environnement)
+    """
+    require_authkey(authkey)
+    sock = socket.create_server((host, port), backlog=2048)
+    ctx = multiprocessing.get_context('spawn')
+    workers = []
+    for _ in range(count):
+        worker = ctx.Process(target=run_worker, args=(sock, bus_address, authkey), daemon=True)
+        worker.start()
+        workers.append(worker)
+    sock.close()
+    return workers
+
+def stop_workers(workers, timeout=WEB_GRACEFUL_TIMEOUT):
+    """Arrêt gracieux (SIGTERM) puis forcé des workers"""
+    for worker in workers:
+        if worker.is_alive():
+            worker.terminate()
+    for worker in workers:
+        worker.join(timeout + 1)
+        if worker.is_alive():
+            worker.kill()
+
+def _interrupt(signum, frame):
+    raise KeyboardInterrupt
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--workers', type=int, default=WEB_WORKERS)
+    parser.add_argument('--host', default=FLASK_HOST)
+    parser.add_argument('--port', type=int, default=FLASK_PORT)
+    args = parser.parse_args()
+    if not BUS_AUTHKEY:
+        parser.error('BUS_AUTHKEY doit être configuré pour des workers séparés du bot')
+
+    signal.signal(signal.SIGTERM, _interrupt)
+    workers = start_workers(args.workers, args.host, args.port)
+    print(f"🌐 {len(workers)} workers web sur http://{args.host}:{args.port} (bus {BUS_ADDRESS})")
+    try:
+        for worker in workers:
+            worker.join()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        stop_workers(workers)
+
+if __name__ == '__main__':
+    main()